@@ -0,0 +1,194 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+from flask import (Blueprint, current_app, render_template, request, flash,
+                   redirect, url_for, abort, make_response)
+from models import db, Artist, GenreCount
+from suggest import suggest_index
+from cache import response_cache
+from views import (request_now, not_modified, cache_validators, stream_rows,
+                   browse_filters, show_pages, filter_place, ARTIST_FIELDS)
+
+#the forms (WTForms) are imported by the views that use them, so they are
+#not loaded until a form is shown or submitted
+blueprint = Blueprint('artists', __name__)
+
+#----------------------------------------------------------------------------#
+# Controllers.
+#----------------------------------------------------------------------------#
+
+@blueprint.route('/artists')
+@response_cache.cached('artists')
+def artists():
+
+    filters = browse_filters()
+    artists = db.session.execute(Artist.listing_statement(**filters))
+
+    data = []
+    #Parse through artists, adding in an individual dict with artist info
+    for artist in artists:
+        data.append({
+            'id': artist.id,
+            'name': artist.name
+        })
+    facets = GenreCount.facets('artist', genre=filters['genre'], state=filters['state'])
+
+    return render_template('pages/artists.html', artists=data,
+                           facets=facets, filters=filters)
+
+
+@blueprint.route('/artists/search', methods=['POST'])
+def search_artists():
+
+    #retrieve the search information from the form
+    search_term = request.form.get('search_term', '')
+    fuzzy = bool(request.form.get('fuzzy'))
+
+    #ranked top matches and an estimate of how many there are in total
+    response = Artist.search(search_term, fuzzy=fuzzy,
+                             limit=current_app.config['SEARCH_RESULTS_LIMIT'])
+
+    return render_template('pages/search_artists.html',
+            results=response, search_term=search_term, fuzzy=fuzzy)
+
+
+@blueprint.route('/artists/<artist_id>/delete', methods=['GET'])
+def delete_artist(artist_id):
+    try:
+        artist = Artist.query.options(*Artist.loader('delete')) \
+            .filter(Artist.id == artist_id).first()
+        db.session.delete(artist)
+        db.session.commit()
+        suggest_index.remove('artist', artist.id)
+        response_cache.invalidate('artists', 'shows')
+        flash('Artist ' + artist.name + ' was successfully deleted!')
+    except:
+        db.session.rollback()
+        current_app.logger.exception('Artist %s could not be deleted', artist_id)
+    finally:
+        db.session.close()
+
+    return redirect(url_for('main.index'))
+
+
+@blueprint.route('/artists/<int:artist_id>')
+def show_artist(artist_id):
+
+    #one indexed query decides whether the client's copy is still current
+    now = request_now()
+    stamp = Artist.version_stamp(artist_id, now)
+    if stamp is None:
+        abort(404)
+    response = not_modified(stamp)
+    if response is not None:
+        return response
+
+    #query the artist with the appropriate id
+    artist = Artist.query.options(*Artist.loader('detail')) \
+        .filter(Artist.id == artist_id).first()
+    #with proper query, serialize the data
+    data={
+    'id': artist.id,
+    'name': artist.name,
+    'city': artist.city,
+    'state': artist.state,
+    'phone': artist.phone,
+    'website': artist.website,
+    'facebook_link': artist.facebook_link,
+    'seeking_venue': artist.seeking_venue,
+    'seeking_description': artist.seeking_description,
+    'image_link': artist.image_link
+    }
+
+    pages = show_pages()
+    per_page = current_app.config['PROFILE_SHOWS_PER_PAGE']
+    data.update(artist.show_counts(now))
+    data['upcoming_shows'] = artist.shows_page(
+        now, upcoming=True, page=pages['upcoming_page'], per_page=per_page)
+    data['past_shows'] = artist.shows_page(
+        now, upcoming=False, page=pages['past_page'], per_page=per_page)
+
+    return cache_validators(make_response(render_template(
+        'pages/show_artist.html', artist=data, per_page=per_page, **pages)), stamp)
+
+
+@blueprint.route('/api/artists')
+def api_artists():
+    query = db.session.query(*[getattr(Artist, field) for field in ARTIST_FIELDS])
+    return stream_rows(filter_place(query, Artist).order_by(Artist.id))
+
+
+#  Update
+#  ----------------------------------------------------------------
+@blueprint.route('/artists/<int:artist_id>/edit', methods=['GET'])
+def edit_artist(artist_id):
+    from forms import ArtistForm
+    form = ArtistForm()
+    artist = Artist.query.options(*Artist.loader('detail')) \
+        .filter(Artist.id == artist_id).first()
+    return render_template('forms/edit_artist.html', form=form, artist=artist)
+
+
+@blueprint.route('/artists/<int:artist_id>/edit', methods=['POST'])
+def edit_artist_submission(artist_id):
+    from forms import ArtistForm
+
+    form = ArtistForm(request.form)
+    update_artist = Artist.query.options(*Artist.loader('detail')) \
+        .filter(Artist.id == artist_id).first()
+    update_artist.name=form.name.data
+    update_artist.phone=form.phone.data
+    update_artist.state=form.state.data
+    update_artist.image_link=form.image_link.data
+    update_artist.facebook_link=form.facebook_link.data
+    update_artist.city=form.city.data
+    update_artist.website=form.website_link.data
+    update_artist.genres=form.genres.data
+    update_artist.seeking_venue=form.seeking_venue.data
+    update_artist.seeking_description=form.seeking_description.data
+    db.session.commit()
+    suggest_index.add('artist', artist_id, form.name.data)
+    response_cache.invalidate('artists')
+    db.session.close()
+
+    return redirect(url_for('artists.show_artist', artist_id=artist_id))
+
+
+#  Create Artist
+#  ----------------------------------------------------------------
+
+@blueprint.route('/artists/create', methods=['GET'])
+def create_artist_form():
+  from forms import ArtistForm
+  form = ArtistForm()
+  return render_template('forms/new_artist.html', form=form)
+
+@blueprint.route('/artists/create', methods=['POST'])
+def create_artist_submission():
+    from forms import ArtistForm
+    form = ArtistForm(request.form)
+    new_artist = Artist(
+        name=form.name.data,
+        phone=form.phone.data,
+        state=form.state.data,
+        image_link=form.image_link.data,
+        facebook_link=form.facebook_link.data,
+        city=form.city.data,
+        website=form.website_link.data,
+        genres=form.genres.data,
+        seeking_venue=form.seeking_venue.data,
+        seeking_description=form.seeking_description.data)
+    try:
+        db.session.add(new_artist)
+        db.session.commit()
+        suggest_index.add('artist', new_artist.id, new_artist.name)
+        response_cache.invalidate('artists')
+        flash('Artist ' + request.form['name'] + ' was successfully listed!')
+    except:
+        db.session.rollback()
+        flash('Artist ' + request.form['name'] + " wasn't successfully listed!")
+        current_app.logger.exception('Artist %s could not be listed', request.form.get('name'))
+    finally:
+        db.session.close()
+
+    return render_template('pages/home.html')
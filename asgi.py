@@ -0,0 +1,383 @@
+#----------------------------------------------------------------------------#
+# Async serving mode.
+#
+# The read-only pages as async views over SQLAlchemy's asyncio extension
+# (asyncpg), with every other URL handed to the Flask app from app.py:
+#
+#     uvicorn asgi:application --workers 4
+#
+# A worker keeps serving other requests while its queries wait on Postgres,
+# and the independent queries of a profile page run at the same time, each
+# on its own connection.
+#
+# These pages share the page cache, metrics, SQL statement stats (budgets,
+# X-SQL-* headers), access log and statement timeout of the Flask app.
+# Template render times and the request profiler are only recorded for the
+# pages the Flask app serves.
+#----------------------------------------------------------------------------#
+import asyncio
+import time
+from datetime import datetime
+from functools import wraps
+from asgiref.wsgi import WsgiToAsgi
+from quart import (Quart, Blueprint, render_template, request, session, abort,
+                   make_response, Response, g)
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import is_resource_modified
+from app import create_app
+from views import (parse_date, parse_cursor, format_cursor,
+                   VENUE_FIELDS, ARTIST_FIELDS)
+from models import Venue, Artist, Show, GenreCount
+from filters import format_datetime
+from cache import response_cache
+from metrics import metrics
+from requestlog import request_log, REQUEST_ID_HEADER
+from sqlstats import StatementStats, request_statement_stats
+
+#----------------------------------------------------------------------------#
+# App Config.
+#----------------------------------------------------------------------------#
+
+wsgi_app = create_app()
+app = Quart(__name__)
+app.config.from_object('config')
+app.jinja_env.filters['datetime'] = format_datetime
+
+# the Flask app's blueprints, so the endpoints have the same names
+venues_blueprint = Blueprint('venues', __name__)
+artists_blueprint = Blueprint('artists', __name__)
+shows_blueprint = Blueprint('shows', __name__)
+
+
+def async_engine(url):
+    # the sync URL with the asyncpg driver, and the same pool settings
+    url = make_url(url).set(drivername='postgresql+asyncpg')
+    options = dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+    if app.config['DB_PGBOUNCER']:
+        # prepared statements don't survive PgBouncer's transaction pooling
+        url = url.update_query_dict({'prepared_statement_cache_size': '0'})
+        options['connect_args'] = {'statement_cache_size': 0}
+    return create_async_engine(url, **options)
+
+
+engines = {}
+
+
+@app.before_serving
+async def create_engines():
+    # created in the server's event loop, asyncpg connections are bound to it
+    engines['primary'] = async_engine(wsgi_app.config['SQLALCHEMY_DATABASE_URI'])
+    if 'replica' in app.config['SQLALCHEMY_BINDS']:
+        engines['replica'] = async_engine(app.config['SQLALCHEMY_BINDS']['replica'])
+
+
+@app.after_serving
+async def dispose_engines():
+    for engine in engines.values():
+        await engine.dispose()
+    engines.clear()
+
+#----------------------------------------------------------------------------#
+# Requests.
+#----------------------------------------------------------------------------#
+
+# what the Flask app's request hooks do, through the same objects
+
+@app.before_request
+async def start_request():
+    g.started = time.perf_counter()
+    g.request_id = request_log.request_id(request.headers)
+    # the engines' statement events record into it, see sqlstats.py
+    g.sql_stats = StatementStats.for_endpoint(request.endpoint, app.config)
+    request_statement_stats.set(g.sql_stats)
+    if metrics.enabled:
+        metrics.request_started()
+
+
+@app.after_request
+async def finish_response(response):
+    response.headers[REQUEST_ID_HEADER] = g.request_id
+    g.sql_stats.report(response, app.config, wsgi_app.logger)
+    g.status = response.status_code
+    return response
+
+
+@app.teardown_request
+async def finish_request(exc):
+    if 'started' not in g:
+        return
+    duration = time.perf_counter() - g.started
+    status = g.get('status', 500)
+    if metrics.enabled:
+        metrics.request_finished(request.endpoint, status, duration, g.sql_stats)
+    request_log.access(request.method, request.path, request.endpoint, status,
+                       duration, g.sql_stats)
+
+
+def cached(*tags):
+    # response_cache.cached() for the async views
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            if request.method != 'GET' or '_flashes' in session:
+                return await view(*args, **kwargs)
+            key = response_cache.page_key(request.full_path, tags)
+            body = response_cache.lookup(key)
+            if body is None:
+                body = await view(*args, **kwargs)
+                response_cache.store(key, body)
+            return body
+        return wrapper
+    return decorator
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def read_engine():
+    # the replica, unless this client wrote something through the Flask app
+    # in the last few seconds (same session cookie) and has to see it
+    if 'replica' in engines and session.get('primary_until', 0) < time.time():
+        return engines['replica']
+    return engines['primary']
+
+
+def set_statement_timeout(connection):
+    # SET LOCAL, as the Flask app does: it lasts for the transaction, which
+    # also holds through PgBouncer. on the DBAPI cursor, so it isn't counted
+    # as one of the request's statements
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute('SET LOCAL statement_timeout = {:d}'.format(
+            app.config['DB_STATEMENT_TIMEOUT_MS']))
+    finally:
+        cursor.close()
+
+
+async def execute(statement):
+    # every call gets its own session, and so its own connection, which is
+    # what lets asyncio.gather() run a page's queries concurrently
+    async with AsyncSession(read_engine()) as db_session:
+        if app.config['DB_STATEMENT_TIMEOUT_MS']:
+            await (await db_session.connection()).run_sync(set_statement_timeout)
+        rows = (await db_session.execute(statement)).all()
+    # asyncpg reports no row count to the statement events
+    stats = request_statement_stats.get()
+    if stats is not None:
+        stats.rows += len(rows)
+    return rows
+
+
+async def not_modified(stamp):
+    # the same check as views.py makes, on the ETag alone
+    etag, _ = stamp
+    environ = {'REQUEST_METHOD': request.method}
+    if 'If-None-Match' in request.headers:
+        environ['HTTP_IF_NONE_MATCH'] = request.headers['If-None-Match']
+    if '_flashes' in session or is_resource_modified(environ, etag=etag):
+        return None
+    return cache_validators(Response('', status=304), stamp)
+
+
+def cache_validators(response, stamp):
+    etag, last_modified = stamp
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+def browse_filters(*extra):
+    return {key: request.args.get(key) or None
+            for key in ('genre', 'state') + extra}
+
+
+def show_pages():
+    return {key: max(request.args.get(key, 1, type=int), 1)
+            for key in ('upcoming_page', 'past_page')}
+
+#----------------------------------------------------------------------------#
+# Controllers.
+#----------------------------------------------------------------------------#
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@venues_blueprint.route('/venues')
+@cached('venues', 'shows')
+async def venues():
+    if request.args.get('summary'):
+        rows = await execute(Venue.area_summaries_statement(datetime.now()))
+        return await render_template('pages/venues.html',
+                                     areas=Venue.summary_areas(rows), summary=True)
+
+    filters = browse_filters('city')
+    rows, facets = await asyncio.gather(
+        execute(Venue.directory_statement(**filters)),
+        facet_counts('venue', filters))
+    return await render_template('pages/venues.html', areas=Venue.directory_areas(rows),
+                                 facets=facets, filters=filters)
+
+
+@venues_blueprint.route('/venues/search', methods=['POST'])
+async def search_venues():
+    form = await request.form
+    search_term = form.get('search_term', '')
+    fuzzy = bool(form.get('fuzzy'))
+    results = await search(Venue, search_term, fuzzy)
+    return await render_template('pages/search_venues.html',
+        results=results, search_term=search_term, fuzzy=fuzzy)
+
+
+@venues_blueprint.route('/venues/<int:venue_id>')
+async def show_venue(venue_id):
+    return await profile(Venue, venue_id, VENUE_FIELDS, 'venue', 'pages/show_venue.html')
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@artists_blueprint.route('/artists')
+@cached('artists')
+async def artists():
+    filters = browse_filters()
+    rows, facets = await asyncio.gather(
+        execute(Artist.listing_statement(**filters)),
+        facet_counts('artist', filters))
+    data = [{'id': row.id, 'name': row.name} for row in rows]
+    return await render_template('pages/artists.html', artists=data,
+                                 facets=facets, filters=filters)
+
+
+@artists_blueprint.route('/artists/search', methods=['POST'])
+async def search_artists():
+    form = await request.form
+    search_term = form.get('search_term', '')
+    fuzzy = bool(form.get('fuzzy'))
+    results = await search(Artist, search_term, fuzzy)
+    return await render_template('pages/search_artists.html',
+        results=results, search_term=search_term, fuzzy=fuzzy)
+
+
+@artists_blueprint.route('/artists/<int:artist_id>')
+async def show_artist(artist_id):
+    return await profile(Artist, artist_id, ARTIST_FIELDS, 'artist', 'pages/show_artist.html')
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@shows_blueprint.route('/shows')
+@cached('venues', 'artists', 'shows')
+async def shows():
+    start = request.args.get('from', type=parse_date)
+    end = request.args.get('to', type=parse_date)
+    if start is None and not request.args.get('all'):
+        start = datetime.now()
+    after = request.args.get('after', type=parse_cursor)
+
+    limit = app.config['SHOWS_PER_PAGE']
+    rows = await execute(Show.feed_statement(start=start, end=end, after=after, limit=limit))
+    data, next_after = Show.feed_page(rows, limit)
+
+    filters = {key: request.args[key] for key in ('from', 'to', 'all')
+               if key in request.args}
+    next_cursor = format_cursor(next_after) if next_after else None
+    return await render_template('pages/shows.html', shows=data,
+                                 next_cursor=next_cursor, filters=filters)
+
+#  Shared
+#  ----------------------------------------------------------------
+
+async def facet_counts(kind, filters):
+    genres, states = GenreCount.facets_statements(
+        kind, genre=filters['genre'], state=filters['state'])
+    return GenreCount.facet_results(*await asyncio.gather(execute(genres), execute(states)))
+
+
+async def search(model, search_term, fuzzy):
+    limit = app.config['SEARCH_RESULTS_LIMIT']
+    query, count_query = model.search_statements(search_term, limit=limit, fuzzy=fuzzy)
+    # the count is only needed when the matches fill the page, as in
+    # SearchMixin.search()
+    rows = await execute(query)
+    count = len(rows)
+    if count == limit:
+        count = (await execute(count_query))[0][0]
+    return model.search_results(rows, count)
+
+
+async def profile(model, id, fields, name, template):
+    # the version check first, it decides whether anything else runs
+    now = datetime.now()
+    rows = await execute(model.version_stamp_statement(id, now))
+    stamp = model.stamp_result(rows[0] if rows else None)
+    if stamp is None:
+        abort(404)
+    response = await not_modified(stamp)
+    if response is not None:
+        return response
+
+    # then the entity, its counts and both show pages all at once
+    pages = show_pages()
+    per_page = app.config['PROFILE_SHOWS_PER_PAGE']
+    entity, counts, upcoming, past = await asyncio.gather(
+        execute(model.detail_statement(id)),
+        execute(model.show_counts_statement(id, now)),
+        execute(model.shows_page_statement(
+            id, now, True, page=pages['upcoming_page'], per_page=per_page)),
+        execute(model.shows_page_statement(
+            id, now, False, page=pages['past_page'], per_page=per_page)))
+
+    entity = entity[0][0]
+    data = {field: getattr(entity, field) for field in fields}
+    data.update(model.counts_result(counts[0]))
+    data['upcoming_shows'] = [dict(row._mapping) for row in upcoming]
+    data['past_shows'] = [dict(row._mapping) for row in past]
+
+    response = await make_response(await render_template(
+        template, per_page=per_page, **{name: data}, **pages))
+    return cache_validators(response, stamp)
+
+
+@app.errorhandler(404)
+async def not_found_error(error):
+    return await render_template('errors/404.html'), 404
+
+
+@app.errorhandler(500)
+async def server_error(error):
+    return await render_template('errors/500.html'), 500
+
+#----------------------------------------------------------------------------#
+# Dispatch.
+#----------------------------------------------------------------------------#
+
+app.register_blueprint(venues_blueprint)
+app.register_blueprint(artists_blueprint)
+app.register_blueprint(shows_blueprint)
+
+# every other endpoint is only registered for url_for() in the templates,
+# requests for them go to the Flask app
+for rule in wsgi_app.url_map.iter_rules():
+    if rule.endpoint not in app.view_functions:
+        app.add_url_rule(rule.rule, rule.endpoint, methods=rule.methods)
+
+flask_application = WsgiToAsgi(wsgi_app)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http':
+        adapter = app.url_map.bind('', url_scheme=scope.get('scheme', 'http'))
+        try:
+            endpoint, _ = adapter.match(scope['path'], method=scope['method'])
+        except HTTPException:
+            endpoint = None
+        if endpoint not in ASYNC_ENDPOINTS:
+            return await flask_application(scope, receive, send)
+    return await app(scope, receive, send)
+
+
+ASYNC_ENDPOINTS = ('venues.venues', 'artists.artists', 'shows.shows',
+                   'venues.show_venue', 'artists.show_artist',
+                   'venues.search_venues', 'artists.search_artists')
@@ -0,0 +1,262 @@
+"""Fill a database with a deterministic synthetic catalog.
+
+Generates venues, artists and shows at any scale from 1k to 1M shows. Cities
+are weighted by population, genres by popularity and venues and artists by a
+long-tailed (Zipf) popularity, so a few of them have most of the shows.
+Shows fall mostly on Thursday to Saturday evenings, spread over the past
+--past-days and the next --future-days:
+
+    python benchmarks/datagen.py --database-url postgresql://localhost/fyyur_bench \
+        --shows 100000
+
+The same --seed, scale and --anchor always give the same rows with the same
+ids. --anchor defaults to today, so upcoming and past shows stay in the same
+proportion whenever it runs. One venue and one artist per ten shows unless
+--venues/--artists say otherwise. The database needs the migrations applied
+(`flask db upgrade`). Its venue, artist, show, show_booking and show_archive
+tables are emptied first, and show partitions are created for every month
+with shows; `flask shows-partitions` archives the old ones. The shows from
+--anchor on are booked, the first listed winning where two overlap.
+"""
+import argparse
+import bisect
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# (city, state, weight): roughly the metro populations, in millions
+CITIES = [
+    ('New York', 'NY', 19.5), ('Los Angeles', 'CA', 13.0), ('Chicago', 'IL', 9.4),
+    ('Dallas', 'TX', 7.6), ('Houston', 'TX', 7.1), ('Washington', 'DC', 6.3),
+    ('Miami', 'FL', 6.1), ('Philadelphia', 'PA', 6.1), ('Atlanta', 'GA', 6.0),
+    ('Boston', 'MA', 4.9), ('Phoenix', 'AZ', 4.9), ('San Francisco', 'CA', 4.7),
+    ('Detroit', 'MI', 4.3), ('Seattle', 'WA', 4.0), ('Minneapolis', 'MN', 3.6),
+    ('San Diego', 'CA', 3.3), ('Denver', 'CO', 2.9), ('Baltimore', 'MD', 2.8),
+    ('St. Louis', 'MO', 2.8), ('Portland', 'OR', 2.5), ('Charlotte', 'NC', 2.6),
+    ('San Antonio', 'TX', 2.6), ('Pittsburgh', 'PA', 2.4), ('Las Vegas', 'NV', 2.3),
+    ('Austin', 'TX', 2.3), ('Cincinnati', 'OH', 2.2), ('Kansas City', 'MO', 2.2),
+    ('Cleveland', 'OH', 2.1), ('Nashville', 'TN', 2.0), ('New Orleans', 'LA', 1.3),
+    ('Memphis', 'TN', 1.3), ('Louisville', 'KY', 1.3), ('Richmond', 'VA', 1.3),
+    ('Salt Lake City', 'UT', 1.2), ('Birmingham', 'AL', 1.1), ('Albuquerque', 'NM', 0.9),
+    ('Omaha', 'NE', 0.9), ('Boise', 'ID', 0.8), ('Burlington', 'VT', 0.2),
+    ('Missoula', 'MT', 0.1),
+]
+
+# the genres of the forms, weighted by how many acts list them
+GENRES = [
+    ('Rock n Roll', 16), ('Pop', 13), ('Hip-Hop', 12), ('Alternative', 10),
+    ('Electronic', 9), ('Country', 8), ('R&B', 7), ('Jazz', 6), ('Folk', 5),
+    ('Punk', 5), ('Heavy Metal', 4), ('Soul', 4), ('Blues', 4), ('Reggae', 3),
+    ('Funk', 3), ('Classical', 2), ('Instrumental', 2), ('Musical Theatre', 1),
+    ('Other', 2),
+]
+
+# Monday first; most shows are Thursday to Saturday, in the evening
+WEEKDAY_WEIGHTS = [5, 6, 9, 14, 25, 28, 13]
+HOUR_WEIGHTS = {17: 2, 18: 5, 19: 14, 20: 25, 21: 24, 22: 16, 23: 8, 0: 3}
+
+VENUE_WORDS = (
+    ['Blue', 'Red', 'Golden', 'Silver', 'Velvet', 'Iron', 'Electric', 'Old',
+     'Black Cat', 'Crooked', 'Lucky', 'Little', 'Rusty', 'Midnight', 'Echo',
+     'Paper Moon', 'Copper', 'Wild', 'Empty Bottle', 'Low'],
+    ['Note', 'Room', 'Lounge', 'Garden', 'Cellar', 'Barn', 'Anchor', 'Owl',
+     'Mule', 'Lantern', 'Door', 'Fox', 'Palace', 'Tavern', 'Spoke', 'Rose'],
+    ['Hall', 'Club', 'Theatre', 'Bar', 'Ballroom', 'House', 'Social', 'Music Hall'],
+)
+ARTIST_WORDS = (
+    ['The', 'Los', 'DJ', 'Big', 'Saint', 'Sister', 'Young', 'Cosmic', 'Neon',
+     'Brass', 'Dead', 'Holy', 'Sunset', 'Modern', 'Velvet', 'Lazy'],
+    ['River', 'Ghost', 'Tiger', 'Canyon', 'Static', 'Honey', 'Thunder', 'Violet',
+     'Harbor', 'Comet', 'Marble', 'Lotus', 'Prairie', 'Radio', 'Gravel', 'Orchid'],
+    ['Kings', 'Sound', 'Collective', 'Brothers', 'Trio', 'Orchestra', 'Machine',
+     'Band', 'Project', 'Club', 'Revival', 'Quartet'],
+)
+STREETS = ['Main', 'Market', 'Broadway', 'Mission', 'Elm', 'Oak', 'Pine',
+           'Maple', 'Cedar', 'Washington', 'Lake', 'Hill', 'Sunset', 'Union',
+           'Grand', 'Canal', 'Bourbon', 'Beale', 'Valencia', 'Sixth']
+
+BATCH = 20000
+
+
+def cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+def zipf_weights(count, rng, exponent=0.8):
+    # popularity by rank, the ranks shuffled so the busiest venues and
+    # artists aren't simply the first ids
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    return cumulative(1.0 / rank ** exponent for rank in ranks)
+
+
+def pick(rng, population, cum_weights):
+    return population[bisect.bisect(cum_weights, rng.random() * cum_weights[-1])]
+
+
+def name(words, index):
+    # every combination once, then the same names again with a number
+    first, second, third = words
+    combinations = len(first) * len(second) * len(third)
+    number, index = divmod(index, combinations)
+    index, c = divmod(index, len(third))
+    a, b = divmod(index, len(second))
+    text = '{} {} {}'.format(first[a], second[b], third[c])
+    return text + ' {}'.format(number + 1) if number else text
+
+
+def genre_list(rng, count):
+    genres, cum = [genre for genre, _ in GENRES], cumulative(w for _, w in GENRES)
+    chosen = []
+    while len(chosen) < count:
+        genre = pick(rng, genres, cum)
+        if genre not in chosen:
+            chosen.append(genre)
+    return chosen
+
+
+def venues(count, rng):
+    cities, cum = CITIES, cumulative(w for _, _, w in CITIES)
+    for i in range(count):
+        city, state, _ = pick(rng, cities, cum)
+        seeking = rng.random() < 0.3
+        yield {
+            'name': name(VENUE_WORDS, i),
+            'city': city, 'state': state,
+            'address': '{} {} St'.format(rng.randint(1, 2999), rng.choice(STREETS)),
+            'phone': '{:03d}-555-{:04d}'.format(rng.randint(201, 989), rng.randint(0, 9999)),
+            'image_link': 'https://images.example.com/venues/{}.jpg'.format(i + 1),
+            'facebook_link': 'https://www.facebook.com/venue{}'.format(i + 1),
+            'website': 'https://venue{}.example.com'.format(i + 1),
+            'genres': genre_list(rng, rng.choice([1, 1, 2, 2, 2, 3, 4])),
+            'seeking_talent': seeking,
+            'seeking_description': 'Booking local acts for weeknights.' if seeking else None,
+        }
+
+
+def artists(count, rng):
+    cities, cum = CITIES, cumulative(w for _, _, w in CITIES)
+    for i in range(count):
+        city, state, _ = pick(rng, cities, cum)
+        seeking = rng.random() < 0.4
+        yield {
+            'name': name(ARTIST_WORDS, i),
+            'city': city, 'state': state,
+            'phone': '{:03d}-555-{:04d}'.format(rng.randint(201, 989), rng.randint(0, 9999)),
+            'image_link': 'https://images.example.com/artists/{}.jpg'.format(i + 1),
+            'facebook_link': 'https://www.facebook.com/artist{}'.format(i + 1),
+            'website': 'https://artist{}.example.com'.format(i + 1),
+            'genres': genre_list(rng, rng.choice([1, 1, 1, 2, 2, 3])),
+            'seeking_venue': seeking,
+            'seeking_description': 'Looking for a residency.' if seeking else None,
+        }
+
+
+def shows(count, venue_count, artist_count, rng, anchor, past_days, future_days):
+    venue_cum = zipf_weights(venue_count, rng)
+    artist_cum = zipf_weights(artist_count, rng)
+    venue_ids, artist_ids = range(1, venue_count + 1), range(1, artist_count + 1)
+    weekdays, weekday_cum = range(7), cumulative(WEEKDAY_WEIGHTS)
+    hours, hour_cum = list(HOUR_WEIGHTS), cumulative(HOUR_WEIGHTS.values())
+    # whole weeks starting on the Monday on or before the first day
+    first = anchor - timedelta(days=past_days)
+    first -= timedelta(days=first.weekday())
+    weeks = (past_days + future_days) // 7 + 1
+    last = anchor + timedelta(days=future_days)
+    generated = 0
+    while generated < count:
+        day = first + timedelta(weeks=rng.randrange(weeks), days=pick(rng, weekdays, weekday_cum))
+        hour = pick(rng, hours, hour_cum)
+        start_time = day + timedelta(days=1 if hour == 0 else 0, hours=hour,
+                                     minutes=rng.choice([0, 0, 0, 30]))
+        if not anchor - timedelta(days=past_days) <= start_time < last:
+            continue
+        generated += 1
+        yield {'venue_id': pick(rng, venue_ids, venue_cum),
+               'artist_id': pick(rng, artist_ids, artist_cum),
+               'start_time': start_time}
+
+
+def batches(rows, size=BATCH):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def generate(shows_count, venue_count=None, artist_count=None, seed=0,
+             anchor=None, past_days=365, future_days=180, echo=print):
+    # empties the catalog and loads the synthetic one in the app's database,
+    # inside an app context. returns the row counts
+    from commands import add_months, copy_rows, create_show_partitions
+    from flask import current_app
+    from models import db, Venue, Artist, Show, ShowBooking
+
+    venue_count = venue_count or max(shows_count // 10, 10)
+    artist_count = artist_count or max(shows_count // 10, 10)
+    anchor = datetime.combine(anchor or date.today(), datetime.min.time())
+    # each kind of row from its own generator, so changing one count
+    # leaves the others as they were
+    rngs = {kind: random.Random('{}:{}'.format(seed, kind))
+            for kind in ('venue', 'artist', 'show')}
+
+    db.session.execute('TRUNCATE show_booking, show, show_archive, venue, artist RESTART IDENTITY')
+    started = time.perf_counter()
+    for table, rows in ((Venue.__table__, venues(venue_count, rngs['venue'])),
+                        (Artist.__table__, artists(artist_count, rngs['artist']))):
+        for batch in batches(rows):
+            copy_rows(table, batch)
+        echo('{:>9,} {}s'.format(venue_count if table.name == 'venue' else artist_count,
+                                 table.name))
+
+    first = (anchor - timedelta(days=past_days)).date().replace(day=1)
+    last = (anchor + timedelta(days=future_days)).date().replace(day=1)
+    months = (last.year - first.year) * 12 + last.month - first.month
+    create_show_partitions(db.session.connection(),
+                           [add_months(first, n) for n in range(months + 1)])
+    for batch in batches(shows(shows_count, venue_count, artist_count, rngs['show'],
+                               anchor, past_days, future_days)):
+        copy_rows(Show.__table__, batch)
+    echo('{:>9,} shows'.format(shows_count))
+    # the upcoming shows booked, as the app would have
+    booked = db.session.execute(ShowBooking.book_listed_statement(
+        anchor, current_app.config['SHOW_BOOKING_HOURS'])).rowcount
+    echo('{:>9,} upcoming shows booked'.format(booked))
+    db.session.commit()
+    db.session.execute('ANALYZE venue, artist, show, show_archive, show_booking, genre_count')
+    db.session.commit()
+    echo('loaded in {:.1f}s'.format(time.perf_counter() - started))
+    return {'venues': venue_count, 'artists': artist_count, 'shows': shows_count}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--shows', type=int, default=100000)
+    parser.add_argument('--venues', type=int)
+    parser.add_argument('--artists', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--anchor', type=date.fromisoformat,
+                        help='the day the shows are placed around (default today)')
+    parser.add_argument('--past-days', type=int, default=365)
+    parser.add_argument('--future-days', type=int, default=180)
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    with app.app_context():
+        generate(args.shows, args.venues, args.artists, seed=args.seed,
+                 anchor=args.anchor, past_days=args.past_days,
+                 future_days=args.future_days)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Time the `datetime` template filter against the implementation it replaced.
+
+Formats the start times of a synthetic 500-show page the way
+pages/shows.html does, both with every time distinct and with the repeats
+a real page has (several shows per evening):
+
+    python benchmarks/datetime_filter_bench.py
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import babel.dates
+import dateutil.parser
+
+from filters import format_datetime, _format, _parse
+
+
+def format_datetime_before(value, format='medium'):
+    # the filter as it was in app.py
+    if isinstance(value, str):
+        date = dateutil.parser.parse(value)
+    else:
+        date = value
+    if format == 'full':
+        format="EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format="EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def page(distinct):
+    start = datetime(2026, 1, 1, 20, 0)
+    return [start + timedelta(hours=(i if distinct else i // 5) * 7) for i in range(500)]
+
+
+def main():
+    cases = [
+        ('500 distinct datetimes', page(True)),
+        ('500 datetimes, 100 distinct', page(False)),
+        ('500 distinct strings', [str(value) for value in page(True)]),
+    ]
+    for label, values in cases:
+        assert [format_datetime(v, 'full') for v in values] == \
+               [format_datetime_before(v, 'full') for v in values]
+        before = min(timeit.repeat(
+            lambda: [format_datetime_before(v, 'full') for v in values], number=5, repeat=5)) / 5
+        # a cold memo is the first render after a restart, a warm one every
+        # later render of the same page
+        def cold():
+            _format.cache_clear()
+            _parse.cache_clear()
+            [format_datetime(v, 'full') for v in values]
+        after_cold = min(timeit.repeat(cold, number=5, repeat=5)) / 5
+        after_warm = min(timeit.repeat(
+            lambda: [format_datetime(v, 'full') for v in values], number=5, repeat=5)) / 5
+        print('{:<30} before {:7.2f} ms   cold {:7.2f} ms   warm {:7.2f} ms'.format(
+            label, before * 1000, after_cold * 1000, after_warm * 1000))
+
+
+if __name__ == '__main__':
+    main()
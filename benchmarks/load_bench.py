@@ -0,0 +1,171 @@
+"""Compare the sync Flask server with the async (ASGI) serving mode under load.
+
+Starts each deployment as a single process on the same database, so both
+run with one worker's worth of memory, drives it with concurrent clients
+over a mix of the read pages and reports requests/sec, latency percentiles
+and the server's peak RSS:
+
+    python benchmarks/load_bench.py --database-url postgresql://localhost/fyyur_bench \
+        --concurrency 32 --duration 20
+
+The sync side is app.run() as `python app.py` serves it (threaded werkzeug
+server), the async side is asgi.py under uvicorn. The page cache is turned
+off for both, the async views don't use it. The database needs the
+migrations applied and some data, venue and artist ids are picked from it.
+"""
+import argparse
+import http.client
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+
+SERVERS = {
+    'sync': [sys.executable, '-c',
+             'from wsgi import app; app.run(port={port}, use_reloader=False)'],
+    'async': [sys.executable, '-m', 'uvicorn', 'asgi:application',
+              '--port', '{port}', '--log-level', 'warning', '--no-access-log'],
+}
+
+
+def page_mix(database_url, count):
+    # mostly profile pages, as on the live site, plus the listings
+    from sqlalchemy import create_engine
+    engine = create_engine(database_url)
+    with engine.connect() as connection:
+        venue_ids = [row[0] for row in connection.exec_driver_sql(
+            'SELECT id FROM venue ORDER BY random() LIMIT 200')]
+        artist_ids = [row[0] for row in connection.exec_driver_sql(
+            'SELECT id FROM artist ORDER BY random() LIMIT 200')]
+    engine.dispose()
+    if not venue_ids or not artist_ids:
+        sys.exit('the database has no venues or artists to request')
+    paths = []
+    for _ in range(count):
+        roll = random.random()
+        if roll < 0.4:
+            paths.append('/venues/{}'.format(random.choice(venue_ids)))
+        elif roll < 0.8:
+            paths.append('/artists/{}'.format(random.choice(artist_ids)))
+        elif roll < 0.9:
+            paths.append('/shows')
+        else:
+            paths.append('/venues?summary=1')
+    return paths
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start(kind, database_url):
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, DEBUG='0',
+               CACHE_BACKEND='null')
+    command = [part.format(port=port) for part in SERVERS[kind]]
+    process = subprocess.Popen(command, cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    sys.exit('{} server did not start'.format(kind))
+
+
+def peak_rss(pid):
+    # VmHWM: the most resident memory the process has had, in kB
+    with open('/proc/{}/status'.format(pid)) as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) // 1024
+
+
+def drive(port, paths, concurrency, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+
+    def client(offset):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        own, i = [], offset
+        while time.perf_counter() < stop:
+            path = paths[i % len(paths)]
+            i += concurrency
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    raise http.client.HTTPException(response.status)
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            own.append((time.perf_counter() - started) * 1000)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] if latencies else 0
+    return {'requests': len(latencies), 'errors': errors[0],
+            'rps': len(latencies) / elapsed,
+            'p50': statistics.median(latencies) if latencies else 0,
+            'p95': percentile(0.95), 'p99': percentile(0.99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--concurrency', type=int, action='append')
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--server', choices=sorted(SERVERS), action='append')
+    args = parser.parse_args()
+
+    random.seed(0)
+    paths = page_mix(args.database_url, 5000)
+    print('{:<6} {:>5} {:>9} {:>8} {:>8} {:>8} {:>8} {:>7} {:>8}'.format(
+        'server', 'conc', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms',
+        'errors', 'RSS MB'))
+    for kind in args.server or ['sync', 'async']:
+        process, port = start(kind, args.database_url)
+        try:
+            drive(port, paths, 4, args.warmup)
+            for concurrency in args.concurrency or [1, 8, 32]:
+                result = drive(port, paths, concurrency, args.duration)
+                print('{:<6} {:>5} {requests:>9} {rps:>8.1f} {p50:>8.2f} {p95:>8.2f} '
+                      '{p99:>8.2f} {errors:>7} {:>8}'.format(
+                          kind, concurrency, peak_rss(process.pid), **result))
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""Fail if a page's queries sequentially scan venue, artist or show.
+
+Seeds a scratch database with synthetic rows, ANALYZEs it and runs EXPLAIN
+for the queries behind every read route, the same statements the sync and
+async views execute:
+
+    python benchmarks/plan_check.py --database-url postgresql://localhost/fyyur_bench \
+        --venues 100000 --artists 100000 --shows 1000000
+
+Exits with status 1 and prints the plan of each query that has a Seq Scan
+on one of the large tables, or that reads upcoming shows from a partition
+of a past month. Pages that list every row (/artists, the full
+/venues directory and its summary) read the whole table by design and are
+not checked. The database needs the migrations applied (`flask db
+upgrade`). Its venue, artist, show, show_booking and show_archive tables
+are emptied first. tests/test_plans.py runs the same check against
+TEST_DATABASE_URL.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import create_app
+from models import db, Venue, Artist, Show, ShowBooking, GenreCount
+from commands import add_months, create_show_partitions, show_partitions
+
+app = create_app()
+
+LARGE_TABLES = ('venue', 'artist', 'show', 'show_archive', 'show_booking')
+
+GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk',
+          'Funk', 'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz',
+          'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae', 'Rock n Roll',
+          'Soul', 'Other']
+
+SEED_SQL = """
+INSERT INTO {table} (name, city, state, genres)
+SELECT
+    (ARRAY['Blue', 'Red', 'Golden', 'Silver', 'Velvet', 'Iron', 'Electric', 'Old'])[1 + i % 8]
+        || ' ' ||
+    (ARRAY['Note', 'Room', 'Hall', 'Lounge', 'Club', 'Garden', 'Theatre', 'Cellar', 'Barn'])[1 + (i / 8) % 9]
+        || ' ' || i,
+    'City ' || (i % 500),
+    'S' || (i % 50),
+    ARRAY[(:genres)[1 + i % array_length(:genres, 1)],
+          (:genres)[1 + (i / 7) % array_length(:genres, 1)]]
+FROM generate_series(1, :rows) AS i
+"""
+
+SHOWS_SQL = """
+INSERT INTO show (venue_id, artist_id, start_time)
+SELECT 1 + (i::bigint * 7919) % :venues, 1 + (i::bigint * 104729) % :artists,
+       :now + (i % 730 - 365) * interval '1 day' + (i % 24) * interval '1 hour'
+FROM generate_series(1, :rows) AS i
+"""
+
+
+def seed(venues, artists, shows):
+    db.session.execute('TRUNCATE show_booking, show, show_archive, venue, artist RESTART IDENTITY')
+    for table, rows in (('venue', venues), ('artist', artists)):
+        db.session.execute(SEED_SQL.format(table=table),
+                           {'rows': rows, 'genres': GENRES})
+    # a partition for every month of the shows, as `flask shows-partitions`
+    # would have made them
+    this_month = date.today().replace(day=1)
+    create_show_partitions(db.session.connection(),
+                           [add_months(this_month, n) for n in range(-13, 14)])
+    db.session.execute(SHOWS_SQL, {'venues': venues, 'artists': artists,
+                                   'rows': shows, 'now': datetime.now()})
+    # and the shows of the first half year archived
+    cutoff = add_months(this_month, -6)
+    for name, month in show_partitions(db.session.connection()):
+        if add_months(month, 1) <= cutoff:
+            db.session.execute(db.text('SELECT fyyur_archive_shows(:source, :before)'),
+                               {'source': name, 'before': cutoff})
+    db.session.execute(ShowBooking.book_listed_statement(
+        datetime.now(), app.config['SHOW_BOOKING_HOURS']))
+    db.session.commit()
+    db.session.execute('ANALYZE venue, artist, show, show_archive, show_booking')
+    db.session.commit()
+
+
+# routes that only look at shows from now on
+UPCOMING_ROUTES = ('/shows', '/shows?after=', '/shows?from=&to=',
+                   '/venues/<id> upcoming shows', '/artists/<id> upcoming shows')
+
+
+def route_queries(venue_id, artist_id, now):
+    # (route, statement) for every query of the read routes
+    queries = [
+        ('/venues?city=&state=', Venue.directory_statement(city='City 7', state='S7')),
+        ('/venues?state=', Venue.directory_statement(state='S7')),
+        ('/venues?genre=&state=', Venue.directory_statement(state='S7', genre='Reggae')),
+        ('/artists?genre=', Artist.listing_statement(genre='Reggae')),
+        ('/shows', Show.feed_statement(start=now)),
+        ('/shows?after=', Show.feed_statement(start=now, after=(now + timedelta(days=30), 1))),
+        ('/shows?from=&to=', Show.feed_statement(start=now, end=now + timedelta(days=7))),
+        ('/api/venues?genre=', db.select(Venue.id).where(Venue.genres.contains(['Reggae']))),
+        ('/api/artists?genre=', db.select(Artist.id).where(Artist.genres.contains(['Reggae']))),
+        ('/api/shows?venue_id=', db.select(Show.id).where(Show.venue_id == venue_id)),
+        ('/venues/<id>/delete cascade', db.select(Show.id).where(Show.venue_id == venue_id)),
+        ('/artists/<id>/delete cascade', db.select(Show.id).where(Show.artist_id == artist_id)),
+    ]
+    # the batch booking, the only write checked: its existence checks and
+    # the lookup of the bookings in the way of refused rows
+    batch = [{'venue_id': venue_id, 'artist_id': artist_id, 'start_time': now + timedelta(days=n)}
+             for n in range(20)]
+    hours = app.config['SHOW_BOOKING_HOURS']
+    queries += [('/shows/batch', Show.book_statement(batch, hours)),
+                ('/shows/batch conflicts', Show.conflicts_statement(list(enumerate(batch)), hours))]
+    for kind in ('venue', 'artist'):
+        genres, states = GenreCount.facets_statements(kind, genre='Reggae', state='S7')
+        queries += [('/{}s facets by genre'.format(kind), genres),
+                    ('/{}s facets by state'.format(kind), states)]
+    for model, id, path in ((Venue, venue_id, '/venues/<id>'), (Artist, artist_id, '/artists/<id>')):
+        queries += [
+            (path + ' version stamp', model.version_stamp_statement(id, now)),
+            (path + ' entity', model.detail_statement(id)),
+            (path + ' counts', model.show_counts_statement(id, now)),
+            (path + ' upcoming shows', model.shows_page_statement(id, now, True)),
+            (path + ' past shows', model.shows_page_statement(id, now, False, page=3)),
+        ]
+    # search terms that match a handful of rows, like a visitor looking for
+    # one place. a term half the table matches makes a limited seq scan the
+    # cheaper plan for the capped count, and the planner rightly takes it
+    for model, path in ((Venue, '/venues/search'), (Artist, '/artists/search')):
+        for term, fuzzy in (('blue note 1234', False), ('bleu nott 1234', True)):
+            query, count_query = model.search_statements(term, fuzzy=fuzzy)
+            queries += [(path + ' ' + term, query), (path + ' ' + term + ' count', count_query)]
+    return queries
+
+
+def is_large(relation):
+    # show_default only holds shows of months without a partition, which
+    # `flask shows-partitions` moves out again
+    return relation in LARGE_TABLES or relation.startswith('show_p')
+
+
+def relations(plan, node_types=None):
+    # the tables this plan node or any node below it reads
+    found = []
+    if 'Relation Name' in plan and (node_types is None or plan['Node Type'] in node_types):
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        found += relations(child, node_types)
+    return found
+
+
+def past_partitions(plan):
+    this_partition = 'show_p' + date.today().strftime('%Y_%m')
+    return [name for name in relations(plan)
+            if name.startswith('show_p') and name < this_partition]
+
+
+def explain(statement):
+    compiled = statement.compile(dialect=db.engine.dialect)
+    connection = db.session.connection()
+    rows = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + compiled.string,
+                                      compiled.params).scalar()
+    plan = rows if isinstance(rows, list) else json.loads(rows)
+    text = connection.exec_driver_sql('EXPLAIN ' + compiled.string, compiled.params)
+    return plan[0]['Plan'], '\n'.join('    ' + row[0] for row in text)
+
+
+def check_plans(now):
+    # (route, problems, plan text) for every query, problems empty for the
+    # ones whose plan is fine. the first venue and artist stand in for any
+    # a seq scan of an empty partition (next months) costs nothing
+    empty = set(db.session.execute(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND reltuples = 0").scalars())
+    venue_id = db.session.query(db.func.min(Venue.id)).scalar()
+    artist_id = db.session.query(db.func.min(Artist.id)).scalar()
+    results = []
+    for route, statement in route_queries(venue_id, artist_id, now):
+        plan, text = explain(statement)
+        tables = [name for name in relations(plan, ('Seq Scan',))
+                  if is_large(name) and name not in empty]
+        past = past_partitions(plan) if route in UPCOMING_ROUTES else []
+        problems = ((['seq scan on ' + ', '.join(tables)] if tables else []) +
+                    (['reads past partitions ' + ', '.join(past)] if past else []))
+        results.append((route, problems, plan['Node Type'], text))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--venues', type=int, default=100000)
+    parser.add_argument('--artists', type=int, default=100000)
+    parser.add_argument('--shows', type=int, default=1000000)
+    parser.add_argument('--no-seed', action='store_true',
+                        help='check against the rows already in the database')
+    args = parser.parse_args()
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    failures = 0
+    with app.app_context():
+        if not args.no_seed:
+            seed(args.venues, args.artists, args.shows)
+        for route, problems, node_type, text in check_plans(datetime.now()):
+            if problems:
+                failures += 1
+                print('FAIL {:<40} {}'.format(route, '; '.join(problems)))
+                print(text)
+            else:
+                print('ok   {:<40} {}'.format(route, node_type))
+        db.session.rollback()
+
+    if failures:
+        print('\n{} queries scan a large table'.format(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,374 @@
+"""Benchmark every route of the app and compare the results with a baseline.
+
+Runs each route through the Flask test client (latency, SQL statements and
+rows per request, peak RSS) and, with --http, under concurrent clients
+against the sync server the way load_bench.py starts it (latency, req/s
+and the server's peak RSS), then writes the numbers per route as JSON:
+
+    python benchmarks/datagen.py --database-url postgresql://localhost/fyyur_bench --shows 100000
+    python benchmarks/route_bench.py --database-url postgresql://localhost/fyyur_bench \
+        --http --output benchmarks/baseline.json
+    # later, after a change
+    python benchmarks/route_bench.py --database-url postgresql://localhost/fyyur_bench \
+        --http --baseline benchmarks/baseline.json
+
+With --baseline, a route is flagged when its p95 latency or peak RSS grew by
+more than --tolerance (and the latency by more than --min-ms), or when it
+runs more SQL statements than before; the exit status is 1 if any was, or
+if there is no baseline at that path. A route that answers with an error
+status fails the run too. The page cache is turned off. Write routes
+create, edit and delete their own venues, artists and shows and leave the
+rest of the data alone; --read-only skips them. --generate N loads the
+datagen.py catalog with N shows first. --strict turns on SQL_STRICT, so a
+route over its query budget or repeating a statement (N+1) answers 500 and
+fails the run.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+
+# measured without the page cache, and as deployed rather than in debug mode
+os.environ.setdefault('CACHE_BACKEND', 'null')
+os.environ.setdefault('DEBUG', '0')
+
+from app import create_app
+from models import db, Venue, Artist, Show
+from sqlstats import QueryCounter
+from load_bench import start, drive, peak_rss
+
+app = create_app()
+
+BENCH_NAME = 'Route Bench'
+# shows per batch of the batch booking cases
+TOUR_SHOWS = 20
+# not app routes as such, or only served when turned on (PROFILE_ENABLED)
+NOT_BENCHMARKED = ('static', 'main.profile_dump')
+
+
+def reset_peak_rss(pid):
+    # writing 5 to clear_refs resets VmHWM to the current RSS (Linux)
+    try:
+        with open('/proc/{}/clear_refs'.format(pid), 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)] if values else 0
+
+
+def sample_ids():
+    # the busiest venue and artist, whose pages are the slowest, and a city
+    # and state with plenty of venues
+    venue_id = db.session.execute(db.select(Show.venue_id).group_by(Show.venue_id)
+        .order_by(db.func.count().desc(), Show.venue_id).limit(1)).scalar()
+    artist_id = db.session.execute(db.select(Show.artist_id).group_by(Show.artist_id)
+        .order_by(db.func.count().desc(), Show.artist_id).limit(1)).scalar()
+    venue = db.session.get(Venue, venue_id)
+    if venue is None or artist_id is None:
+        sys.exit('the database has no shows, load some with datagen.py')
+    return {'venue_id': venue.id, 'artist_id': artist_id,
+            'city': venue.city, 'state': venue.state,
+            'genre': (venue.genres or ['Jazz'])[0],
+            'word': venue.name.split()[0].lower()}
+
+
+def read_cases(ids):
+    # (endpoint, method, path, form data) for the read routes
+    v, a = ids['venue_id'], ids['artist_id']
+    return [
+        ('main.index', 'GET', '/', None),
+        ('main.search_suggest', 'GET', '/api/search/suggest?q=' + ids['word'][:3], None),
+        ('main.search_suggest_stats', 'GET', '/api/search/suggest/stats', None),
+        ('main.cache_stats', 'GET', '/api/cache/stats', None),
+        ('main.db_pool_stats', 'GET', '/api/db/pool', None),
+        ('main.prometheus_metrics', 'GET', '/metrics', None),
+        ('venues.api_venues', 'GET', '/api/venues?' + urlencode({'city': ids['city'],
+                                                          'state': ids['state']}), None),
+        ('artists.api_artists', 'GET', '/api/artists?' + urlencode({'genre': ids['genre'],
+                                                            'state': ids['state']}), None),
+        ('shows.api_shows', 'GET', '/api/shows?venue_id={}'.format(v), None),
+        ('venues.venues', 'GET', '/venues', None),
+        ('venues.venues', 'GET', '/venues?summary=1', None),
+        ('venues.venues', 'GET', '/venues?' + urlencode({'state': ids['state'],
+                                                  'genre': ids['genre']}), None),
+        ('venues.search_venues', 'POST', '/venues/search', {'search_term': ids['word']}),
+        ('venues.search_venues', 'POST', '/venues/search', {'search_term': ids['word'][:-1] + 'x',
+                                                     'fuzzy': 'y'}),
+        ('venues.show_venue', 'GET', '/venues/{}'.format(v), None),
+        ('venues.show_venue', 'GET', '/venues/{}?past_page=3'.format(v), None),
+        ('venues.create_venue_form', 'GET', '/venues/create', None),
+        ('venues.edit_venue', 'GET', '/venues/{}/edit'.format(v), None),
+        ('artists.artists', 'GET', '/artists', None),
+        ('artists.artists', 'GET', '/artists?' + urlencode({'genre': ids['genre']}), None),
+        ('artists.search_artists', 'POST', '/artists/search', {'search_term': 'the'}),
+        ('artists.show_artist', 'GET', '/artists/{}'.format(a), None),
+        ('artists.create_artist_form', 'GET', '/artists/create', None),
+        ('artists.edit_artist', 'GET', '/artists/{}/edit'.format(a), None),
+        ('shows.shows', 'GET', '/shows', None),
+        ('shows.create_shows', 'GET', '/shows/create', None),
+        ('shows.create_shows_batch', 'GET', '/shows/batch', None),
+    ]
+
+
+VENUE_FORM = {'name': BENCH_NAME, 'city': 'Austin', 'state': 'TX',
+              'address': '1 Main St', 'phone': '512-555-0100',
+              'facebook_link': 'https://www.facebook.com/bench', 'genres': ['Jazz']}
+ARTIST_FORM = {'name': BENCH_NAME, 'city': 'Austin', 'state': 'TX',
+               'phone': '512-555-0100',
+               'facebook_link': 'https://www.facebook.com/bench', 'genres': ['Jazz']}
+
+
+def bench_ids(model):
+    return db.session.execute(db.select(model.id).where(model.name == BENCH_NAME)
+                              .order_by(model.id)).scalars().all()
+
+
+def write_cases():
+    # (endpoint, method, path or a function returning it, form data) in
+    # order: what the creates make is edited, booked and then deleted
+    ids = {}
+
+    def created(model, n):
+        def path(i):
+            if model not in ids:
+                with app.app_context():
+                    ids[model] = bench_ids(model)
+            return n.format(ids[model][i % len(ids[model])])
+        return path
+
+    def show_form(i):
+        return {'venue_id': ids[Venue][i % len(ids[Venue])],
+                'artist_id': ids[Artist][i % len(ids[Artist])],
+                'start_time': '2030-01-01 20:00:00'}
+
+    tours = itertools.count()
+
+    def tour():
+        # TOUR_SHOWS nights in a row of an artist at the bench venues, each
+        # tour after the last so none of them conflict (warmup included)
+        i = next(tours)
+        first = datetime(2031, 1, 1, 20) + timedelta(days=i * TOUR_SHOWS)
+        return [(ids[Artist][i % len(ids[Artist])], ids[Venue][(i + n) % len(ids[Venue])],
+                 first + timedelta(days=n)) for n in range(TOUR_SHOWS)]
+
+    def batch_form(i):
+        return {'shows': '\n'.join('{}, {}, {:%Y-%m-%d %H:%M}'.format(*show)
+                                    for show in tour())}
+
+    def batch_json(i):
+        return [{'artist_id': artist_id, 'venue_id': venue_id, 'start_time': start_time.isoformat()}
+                for artist_id, venue_id, start_time in tour()]
+
+    return [
+        ('venues.create_venue_submission', 'POST', '/venues/create', VENUE_FORM),
+        ('artists.create_artist_submission', 'POST', '/artists/create', ARTIST_FORM),
+        ('venues.edit_venue_submission', 'POST', created(Venue, '/venues/{}/edit'), VENUE_FORM),
+        ('artists.edit_artist_submission', 'POST', created(Artist, '/artists/{}/edit'), ARTIST_FORM),
+        ('shows.create_show_submission', 'POST', '/shows/create', show_form),
+        ('shows.create_shows_batch_submission', 'POST', '/shows/batch', batch_form),
+        ('shows.api_create_shows', 'POST', '/api/shows', batch_json),
+        ('venues.delete_venue', 'GET', created(Venue, '/venues/{}/delete'), None),
+        ('artists.delete_artist', 'GET', created(Artist, '/artists/{}/delete'), None),
+    ]
+
+
+def case_name(endpoint, method, path):
+    return '{} {}'.format(method, path if isinstance(path, str) else endpoint)
+
+
+def run_client(cases, requests, warmup):
+    # every case `requests` times through the test client, timed and
+    # with its statements counted
+    client = app.test_client()
+    results = {}
+    for endpoint, method, path, data in cases:
+        name = case_name(endpoint, method, path)
+        timings, statements, rows, errors = [], [], [], 0
+        reset_peak_rss(os.getpid())
+        for i in range(-warmup, requests):
+            url = path(max(i, 0)) if callable(path) else path
+            form = data(max(i, 0)) if callable(data) else data
+            with app.app_context():
+                counter = QueryCounter(db.engine)
+                started = time.perf_counter()
+                with counter:
+                    # a list is sent as a JSON body, anything else as a form
+                    body = {'json': form} if isinstance(form, list) else {'data': form}
+                    response = client.open(url, method=method, **body)
+                    response.get_data()
+                elapsed = (time.perf_counter() - started) * 1000
+            if response.status_code >= 400:
+                errors += 1
+            if i >= 0:
+                timings.append(elapsed)
+                statements.append(counter.count)
+                rows.append(counter.rows)
+        results[name] = {
+            'endpoint': endpoint, 'requests': len(timings), 'errors': errors,
+            'p50_ms': statistics.median(timings), 'p95_ms': percentile(timings, 0.95),
+            'p99_ms': percentile(timings, 0.99),
+            'sql_statements': max(statements), 'sql_rows': max(rows),
+            'peak_rss_mb': peak_rss(os.getpid()),
+        }
+    return results
+
+
+def run_http(database_url, cases, concurrency, duration, warmup):
+    # the GET routes, one at a time, under concurrent clients
+    process, port = start('sync', database_url)
+    results = {}
+    try:
+        for endpoint, method, path, data in cases:
+            if method != 'GET':
+                continue
+            drive(port, [path], concurrency, warmup)
+            reset_peak_rss(process.pid)
+            result = drive(port, [path], concurrency, duration)
+            results[case_name(endpoint, method, path)] = {
+                'endpoint': endpoint, 'concurrency': concurrency,
+                'requests': result['requests'], 'errors': result['errors'],
+                'rps': result['rps'], 'p50_ms': result['p50'],
+                'p95_ms': result['p95'], 'p99_ms': result['p99'],
+                'peak_rss_mb': peak_rss(process.pid),
+            }
+    finally:
+        process.terminate()
+        process.wait()
+    return results
+
+
+def regressions(current, baseline, tolerance, min_ms):
+    # (suite, route, why) for every number that got worse than the baseline
+    found = []
+    for suite in ('client', 'http'):
+        for name, result in current.get(suite, {}).items():
+            before = baseline.get(suite, {}).get(name)
+            if before is None:
+                continue
+            p95, base = result['p95_ms'], before['p95_ms']
+            if p95 > base * (1 + tolerance) and p95 - base > min_ms:
+                found.append((suite, name, 'p95 {:.2f} ms, was {:.2f}'.format(p95, base)))
+            if result.get('sql_statements', 0) > before.get('sql_statements', float('inf')):
+                found.append((suite, name, '{} SQL statements, was {}'.format(
+                    result['sql_statements'], before['sql_statements'])))
+            if result['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance):
+                found.append((suite, name, 'peak RSS {} MB, was {}'.format(
+                    result['peak_rss_mb'], before['peak_rss_mb'])))
+    return found
+
+
+def dataset():
+    with app.app_context():
+        return {'venues': db.session.query(db.func.count(Venue.id)).scalar(),
+                'artists': db.session.query(db.func.count(Artist.id)).scalar(),
+                'shows': db.session.query(db.func.count(Show.id)).scalar()}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(suite, results, flagged):
+    print('\n{} {:<48} {:>6} {:>8} {:>8} {:>8} {:>5} {:>7} {:>7}'.format(
+        suite.ljust(6), 'route', 'reqs', 'p50 ms', 'p95 ms', 'p99 ms', 'SQL', 'rows', 'RSS MB'))
+    for name, r in results.items():
+        print('{:<6} {:<48} {:>6} {:>8.2f} {:>8.2f} {:>8.2f} {:>5} {:>7} {:>7}{}'.format(
+            '', name[:48], r['requests'], r['p50_ms'], r['p95_ms'], r['p99_ms'],
+            r.get('sql_statements', '-'), r.get('sql_rows', '-'), r['peak_rss_mb'],
+            '  ERRORS {}'.format(r['errors']) if r['errors'] else
+            ('  REGRESSION' if (suite, name) in flagged else '')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--generate', type=int, metavar='SHOWS',
+                        help='load the datagen.py catalog with this many shows first')
+    parser.add_argument('--requests', type=int, default=30,
+                        help='test client requests per route')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--read-only', action='store_true', help='skip the write routes')
+    parser.add_argument('--strict', action='store_true',
+                        help='fail routes over their SQL_QUERY_BUDGETS or repeating statements')
+    parser.add_argument('--http', action='store_true',
+                        help='also drive the GET routes over HTTP')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--output', help='write the results as JSON here')
+    parser.add_argument('--baseline', help='compare with the JSON of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--min-ms', type=float, default=1.0,
+                        help='latency changes smaller than this are noise')
+    args = parser.parse_args()
+
+    if args.baseline and not os.path.exists(args.baseline):
+        # a run with nothing to compare with would pass whatever it measured
+        parser.error('no baseline at {}, write one with --output first'.format(args.baseline))
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['SQL_STRICT'] = args.strict
+    if args.generate:
+        import datagen
+        with app.app_context():
+            datagen.generate(args.generate)
+    with app.app_context():
+        ids = sample_ids()
+    cases = read_cases(ids)
+
+    results = {'commit': git_commit(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(), 'dataset': dataset()}
+    results['client'] = run_client(cases, args.requests, args.warmup)
+    if not args.read_only:
+        results['client'].update(run_client(write_cases(), args.requests, 0))
+    if args.http:
+        results['http'] = run_http(args.database_url, cases, args.concurrency,
+                                   args.duration, 1)
+
+    # every route of the app has to be in the suite
+    covered = {result['endpoint'] for suite in ('client', 'http')
+               for result in results.get(suite, {}).values()}
+    missing = sorted(rule.endpoint for rule in app.url_map.iter_rules()
+                     if rule.endpoint not in covered and rule.endpoint not in NOT_BENCHMARKED)
+    if missing and not args.read_only:
+        print('not benchmarked: ' + ', '.join(missing))
+
+    flagged = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            flagged = regressions(results, json.load(f), args.tolerance, args.min_ms)
+    names = {(suite, name) for suite, name, _ in flagged}
+    for suite in ('client', 'http'):
+        if suite in results:
+            report(suite, results[suite], names)
+    for suite, name, why in flagged:
+        print('REGRESSION {} {}: {}'.format(suite, name, why))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    errors = sum(r['errors'] for suite in ('client', 'http') for r in results.get(suite, {}).values())
+    if flagged or errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
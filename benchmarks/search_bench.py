@@ -0,0 +1,93 @@
+"""Compare the ranked venue search with the old ilike scan.
+
+Seeds the venue table of a scratch database with synthetic rows and times
+both search paths for a handful of terms:
+
+    python benchmarks/search_bench.py --database-url postgresql://localhost/fyyur_bench \
+        --rows 100000 --rows 1000000
+
+The database needs the migrations applied (`flask db upgrade`). Its venue,
+artist and show tables are emptied first.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import create_app
+from models import db, Venue
+
+app = create_app()
+
+TERMS = ['blue', 'blue note', 'jazz', 'san francisco', 'hall', 'bleu nott']
+
+SEED_SQL = """
+INSERT INTO venue (name, city, state, genres)
+SELECT
+    (ARRAY['Blue', 'Red', 'Golden', 'Silver', 'Velvet', 'Iron', 'Electric', 'Old'])[1 + i % 8]
+        || ' ' ||
+    (ARRAY['Note', 'Room', 'Hall', 'Lounge', 'Club', 'Garden', 'Theatre', 'Cellar', 'Barn'])[1 + (i / 8) % 9]
+        || ' ' || i,
+    (ARRAY['San Francisco', 'New York', 'Austin', 'Chicago', 'Nashville', 'Seattle'])[1 + i % 6],
+    (ARRAY['CA', 'NY', 'TX', 'IL', 'TN', 'WA'])[1 + i % 6],
+    ARRAY[(ARRAY['Jazz', 'Rock n Roll', 'Folk', 'Blues', 'Classical', 'Hip-Hop', 'Soul'])[1 + i % 7]]
+FROM generate_series(1, :rows) AS i
+"""
+
+
+def ilike_search(term, limit):
+    # the search as it was before ranking: unbounded, then counted with len()
+    venues = Venue.query.options(*Venue.loader('listing')) \
+        .filter(Venue.name.ilike('%' + term + '%')).all()
+    return {'count': len(venues),
+            'data': [{'id': v.id, 'name': v.name} for v in venues[:limit]]}
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+        db.session.rollback()
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def seed(rows):
+    db.session.execute('TRUNCATE show_booking, show, show_archive, venue, artist RESTART IDENTITY')
+    db.session.execute(SEED_SQL, {'rows': rows})
+    db.session.commit()
+    db.session.execute('ANALYZE venue')
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--rows', type=int, action='append')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    with app.app_context():
+        for rows in args.rows or [100000, 1000000]:
+            seed(rows)
+            print('\n{:,} venues (median / p95 ms)'.format(rows))
+            print('{:<16} {:>20} {:>20} {:>20}'.format('term', 'ilike', 'ranked', 'fuzzy'))
+            for term in TERMS:
+                results = [
+                    timed(lambda: ilike_search(term, args.limit), args.repeat),
+                    timed(lambda: Venue.search(term, limit=args.limit), args.repeat),
+                    timed(lambda: Venue.search(term, limit=args.limit, fuzzy=True), args.repeat),
+                ]
+                print('{:<16} '.format(term) + ' '.join(
+                    '{:>9.2f} / {:>8.2f}'.format(*r) for r in results))
+
+
+if __name__ == '__main__':
+    main()
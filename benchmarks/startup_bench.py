@@ -0,0 +1,133 @@
+"""Measure how long the app takes to start, each run in a fresh interpreter.
+
+    python benchmarks/startup_bench.py --database-url postgresql://localhost/fyyur_bench
+    python benchmarks/startup_bench.py --database-url postgresql://localhost/fyyur_bench \
+        --against HEAD~1
+
+The stages, each run --runs times and timed from process start to exit:
+
+  app             the app created, as in the master of a pre-fork server
+  first response  the app created and a venue page served, as in a worker
+                  that was not preloaded (needs --database-url)
+  flask command   `flask routes`, a one-off command through flask
+  manage command  `python manage.py routes`, where the tree has manage.py
+
+Startup is mostly reading and importing files, so the fastest run is the
+one that counts; the median is printed next to it. With --against the same
+stages also run in a checkout of that revision (a temporary git worktree)
+and the speedup of this tree over it is printed.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# works with the app module before and after create_app()
+CREATE_APP = ("import app as module; "
+              "app = getattr(module, 'app', None) or module.create_app()")
+FIRST_RESPONSE = CREATE_APP + ("; import sys; "
+                               "response = app.test_client().get(sys.argv[1]); "
+                               "sys.exit(response.status_code != 200)")
+
+
+def stages(tree, database_url, path):
+    # (name, command) of what the tree can run
+    found = [('app', [sys.executable, '-c', CREATE_APP])]
+    if database_url:
+        found.append(('first response', [sys.executable, '-c', FIRST_RESPONSE, path]))
+    found.append(('flask command', [sys.executable, '-m', 'flask', 'routes']))
+    if os.path.exists(os.path.join(tree, 'manage.py')):
+        found.append(('manage command', [sys.executable, 'manage.py', 'routes']))
+    return found
+
+
+def run(tree, command, env, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(command, cwd=tree, env=env, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE)
+        timings.append((time.perf_counter() - started) * 1000)
+        if result.returncode:
+            raise SystemExit('{} failed in {}:\n{}'.format(
+                ' '.join(command), tree, result.stderr.decode()))
+    return {'min_ms': min(timings), 'median_ms': statistics.median(timings)}
+
+
+def measure(tree, database_url, path, runs):
+    env = dict(os.environ, FLASK_APP='app', DEBUG='0', CACHE_BACKEND='null',
+               LOG_ACCESS='0', PYTHONDONTWRITEBYTECODE='')
+    if database_url:
+        env['DATABASE_URL'] = database_url
+    results = {}
+    for name, command in stages(tree, database_url, path):
+        # one run first, so every tree starts with its bytecode compiled
+        run(tree, command, env, 1)
+        results[name] = run(tree, command, env, runs)
+    return results
+
+
+def busiest_venue(database_url):
+    from sqlalchemy import create_engine, text
+    engine = create_engine(database_url)
+    with engine.connect() as connection:
+        venue_id = connection.execute(text(
+            'SELECT venue_id FROM show GROUP BY venue_id ORDER BY count(*) DESC LIMIT 1')).scalar()
+    engine.dispose()
+    return '/venues/{}'.format(venue_id or 1)
+
+
+def checkout(revision):
+    directory = tempfile.mkdtemp(prefix='startup-bench-')
+    subprocess.check_call(['git', 'worktree', 'add', '--detach', '--quiet', directory, revision],
+                          cwd=ROOT)
+    return directory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url',
+                        help='for the first response stage, skipped without it')
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--path', help='the page of the first response (default the busiest venue)')
+    parser.add_argument('--against', metavar='REVISION',
+                        help='also measure this git revision and compare')
+    args = parser.parse_args()
+
+    path = args.path or (busiest_venue(args.database_url) if args.database_url else '/')
+    current = measure(ROOT, args.database_url, path, args.runs)
+    other = None
+    if args.against:
+        tree = checkout(args.against)
+        try:
+            other = measure(tree, args.database_url, path, args.runs)
+        finally:
+            subprocess.call(['git', 'worktree', 'remove', '--force', tree], cwd=ROOT)
+            shutil.rmtree(tree, ignore_errors=True)
+
+    print('{:<16} {:>10} {:>10}'.format('', 'min ms', 'median ms'), end='')
+    print('  {:>10} {:>10} {:>8}'.format(args.against[:10], 'median ms', 'speedup')
+          if other else '')
+    for name, result in current.items():
+        print('{:<16} {:>10.0f} {:>10.0f}'.format(name, result['min_ms'], result['median_ms']),
+              end='')
+        before = (other or {}).get(name)
+        if before:
+            print('  {:>10.0f} {:>10.0f} {:>7.2f}x'.format(
+                before['min_ms'], before['median_ms'], before['min_ms'] / result['min_ms']))
+        else:
+            print()
+    if other and 'manage command' in current and 'manage command' not in other:
+        print('{:<16} {:>10.2f}x  (manage command over {}\'s flask command)'.format(
+            'one-off command', other['flask command']['min_ms'] / current['manage command']['min_ms'],
+            args.against))
+
+
+if __name__ == '__main__':
+    main()
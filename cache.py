@@ -0,0 +1,214 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session
+
+
+class NullBackend(object):
+    evictions = 0
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def get_version(self, tag):
+        return None
+
+    def set_version(self, tag, version):
+        pass
+
+
+class LRUBackend(object):
+    # per process: least recently used entries go once max_entries is hit.
+    # tag versions are kept apart and never evicted, there are only a few
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_version(self, tag):
+        return self._versions.get(tag)
+
+    def set_version(self, tag, version):
+        self._versions[tag] = version
+
+
+class FileSystemBackend(object):
+    # one pickle per key in a directory every worker on the host shares;
+    # the oldest files are culled once there are more than max_entries.
+    # tag versions are files of their own subdirectory, which isn't culled
+
+    def __init__(self, directory, max_entries=1000):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.evictions = 0
+        self.versions_directory = os.path.join(directory, 'versions')
+        os.makedirs(self.versions_directory, exist_ok=True)
+
+    def _path(self, key, directory=None):
+        return os.path.join(directory or self.directory,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _write(self, path, value):
+        # written aside and renamed over, so a reader never sees half a file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        entry = self._read(self._path(key))
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires is not None and expires < time.time():
+            return None
+        return value
+
+    def set(self, key, value, ttl):
+        expires = time.time() + ttl if ttl else None
+        self._write(self._path(key), (expires, value))
+        self._cull()
+
+    def get_version(self, tag):
+        return self._read(self._path(tag, self.versions_directory))
+
+    def set_version(self, tag, version):
+        self._write(self._path(tag, self.versions_directory), version)
+
+    def _cull(self):
+        entries = [entry for entry in os.scandir(self.directory)
+                   if entry.is_file() and not entry.name.startswith('.tmp')]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+                self.evictions += 1
+            except OSError:
+                pass
+
+
+class ResponseCache(object):
+    # caches rendered pages under the tags of the data they show. every tag
+    # has a version kept in the backend and part of each key, so bumping it
+    # in invalidate() makes all pages with that tag miss from then on,
+    # without having to know which keys they were stored under
+
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self.ttl = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.get('CACHE_BACKEND', 'null')
+        max_entries = app.config.get('CACHE_MAX_ENTRIES', 1000)
+        if kind == 'lru':
+            self.backend = LRUBackend(max_entries)
+        elif kind == 'filesystem':
+            self.backend = FileSystemBackend(app.config['CACHE_DIR'], max_entries)
+        else:
+            self.backend = NullBackend()
+        self.ttl = app.config.get('CACHE_TTL')
+
+    def _version(self, tag):
+        version = self.backend.get_version(tag)
+        if version is None:
+            # a tag without a version (a new backend, a cleared directory)
+            # gets a fresh one that no stored page is under, never a
+            # default like 0 that pages from before it was lost could match
+            version = time.time_ns()
+            self.backend.set_version(tag, version)
+        return version
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.set_version(tag, time.time_ns())
+        self.invalidations += 1
+
+    def page_key(self, full_path, tags):
+        return 'page:{}:{}'.format(
+            full_path, ':'.join(str(self._version(tag)) for tag in tags))
+
+    def lookup(self, key):
+        body = self.backend.get(key)
+        if body is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return body
+
+    def store(self, key, body):
+        if isinstance(body, str):
+            self.backend.set(key, body, self.ttl)
+
+    def cached(self, *tags):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # a pending flash message belongs to this visitor only
+                if request.method != 'GET' or '_flashes' in session:
+                    return view(*args, **kwargs)
+                key = self.page_key(request.full_path, tags)
+                body = self.lookup(key)
+                if body is None:
+                    body = view(*args, **kwargs)
+                    self.store(key, body)
+                return body
+            return wrapper
+        return decorator
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'backend': type(self.backend).__name__,
+                'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None,
+                'evictions': self.backend.evictions,
+                'invalidations': self.invalidations}
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,526 @@
+import csv
+import gzip
+import io
+import json
+import os
+import time
+from datetime import date, datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.datastructures import MultiDict
+
+from cache import response_cache
+from models import db, Venue, Artist, Show, ShowArchive
+from profiler import PROFILE_HEADER, request_profiler
+
+# genres are a ;-separated list in CSV files
+GENRE_SEPARATOR = ';'
+FALSE_VALUES = ('', '0', 'false', 'f', 'no', 'n')
+
+
+#----------------------------------------------------------------------------#
+# Reading and writing catalog files.
+#----------------------------------------------------------------------------#
+
+def open_text(path, mode='rt'):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, encoding='utf-8', newline='')
+    return open(path, mode.replace('t', ''), encoding='utf-8', newline='')
+
+
+def file_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'jsonl' if name.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(path):
+    # dicts from a CSV file with a header row or a JSON-lines file
+    with open_text(path) as f:
+        if file_format(path) == 'jsonl':
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            for row in csv.DictReader(f):
+                if row.get('genres'):
+                    row['genres'] = row['genres'].split(GENRE_SEPARATOR)
+                yield row
+
+
+#----------------------------------------------------------------------------#
+# Import.
+#----------------------------------------------------------------------------#
+
+def formdata(row):
+    # a catalog row as the form would have posted it
+    data = MultiDict()
+    for key, value in row.items():
+        if key == 'website':
+            key = 'website_link'
+        if isinstance(value, list):
+            data.setlist(key, value)
+        elif isinstance(value, bool):
+            data[key] = 'y' if value else ''
+        elif value is not None:
+            data[key] = str(value)
+    for key in ('seeking_talent', 'seeking_venue'):
+        if str(data.get(key, '')).lower() in FALSE_VALUES:
+            data.pop(key, None)
+    return data
+
+
+def venue_values(form):
+    return {'name': form.name.data, 'city': form.city.data,
+            'state': form.state.data, 'address': form.address.data,
+            'phone': form.phone.data, 'image_link': form.image_link.data,
+            'facebook_link': form.facebook_link.data,
+            'website': form.website_link.data, 'genres': form.genres.data,
+            'seeking_talent': form.seeking_talent.data,
+            'seeking_description': form.seeking_description.data}
+
+
+def artist_values(form):
+    return {'name': form.name.data, 'city': form.city.data,
+            'state': form.state.data, 'phone': form.phone.data,
+            'image_link': form.image_link.data,
+            'facebook_link': form.facebook_link.data,
+            'website': form.website_link.data, 'genres': form.genres.data,
+            'seeking_venue': form.seeking_venue.data,
+            'seeking_description': form.seeking_description.data}
+
+
+def show_values(form):
+    return {'start_time': form.start_time.data,
+            'venue_id': form.venue_id.data, 'artist_id': form.artist_id.data}
+
+
+# the forms are named rather than imported, WTForms is only loaded when an
+# import runs
+IMPORTS = {
+    'venues': (Venue, 'VenueForm', venue_values, ('venues',)),
+    'artists': (Artist, 'ArtistForm', artist_values, ('artists',)),
+    'shows': (Show, 'ShowForm', show_values, ('shows',)),
+}
+
+
+def resolve_references(batch, rejects):
+    # shows may point at venues and artists by id or by name; all of a
+    # batch's references are looked up with one query per table
+    resolved = []
+    lookups = {}
+    for model, key in ((Venue, 'venue'), (Artist, 'artist')):
+        ids = set()
+        names = set()
+        for line, values in batch:
+            if values.get(key + '_id'):
+                ids.add(as_id(values[key + '_id']))
+            elif values.get(key + '_name'):
+                names.add(values[key + '_name'])
+        rows = db.session.query(model.id, model.name).filter(
+            db.or_(model.id.in_(ids), model.name.in_(names))).all()
+        by_name = {}
+        for id, name in rows:
+            by_name.setdefault(name, []).append(id)
+        lookups[key] = (set(id for id, _ in rows), by_name)
+
+    for line, values in batch:
+        errors = {}
+        for key in ('venue', 'artist'):
+            known_ids, by_name = lookups[key]
+            if values.get(key + '_id'):
+                if as_id(values[key + '_id']) not in known_ids:
+                    errors[key + '_id'] = ['No such {}'.format(key)]
+            else:
+                matches = by_name.get(values.get(key + '_name'), [])
+                if len(matches) != 1:
+                    errors[key + '_name'] = ['{} {}s with this name'.format(len(matches), key)]
+                else:
+                    values[key + '_id'] = matches[0]
+        if errors:
+            rejects.append((line, errors))
+        else:
+            resolved.append((line, {'start_time': values['start_time'],
+                                    'venue_id': int(values['venue_id']),
+                                    'artist_id': int(values['artist_id'])}))
+    return resolved
+
+
+def book_rows(batch, rejects):
+    # shows are booked like the ones listed on the web pages (Show.book):
+    # a row that overlaps a booking of its venue or artist, or an earlier
+    # row, is rejected with the shows in its way
+    if not batch:
+        return []
+    results = Show.book([row for _, row in batch], current_app.config['SHOW_BOOKING_HOURS'])
+    booked = []
+    for (line, row), result in zip(batch, results):
+        if result['status'] == 'created':
+            booked.append((line, row))
+        elif result['status'] == 'conflict':
+            rejects.append((line, {'start_time': [
+                'The {} is booked at {} (show {})'.format(
+                    ' and the '.join(kind for kind in ('venue', 'artist') if conflict[kind]),
+                    conflict['start_time'].isoformat(), conflict['show_id'])
+                for conflict in result['conflicts']]}))
+        else:
+            # deleted since the references were resolved
+            key = result['status'][len('unknown_'):]
+            rejects.append((line, {key + '_id': ['No such {}'.format(key)]}))
+    return booked
+
+
+def as_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def copy_rows(table, rows):
+    # COPY ... FROM STDIN on the session's connection, inside its transaction
+    columns = list(rows[0].keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([pg_copy_value(row[column]) for column in columns])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH (FORMAT csv)'.format(
+        table.name, ', '.join(columns)), buffer)
+
+
+def pg_copy_value(value):
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return '{' + ','.join('"' + item.replace('\\', '\\\\').replace('"', '\\"') + '"'
+                              for item in value) + '}'
+    return value
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORTS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--copy/--insert', 'use_copy', default=False,
+              help='Load venue and artist batches with COPY instead of multi-row '
+                   'INSERTs. Shows are always booked with one INSERT per batch.')
+@click.option('--restart', is_flag=True,
+              help='Ignore the checkpoint of an earlier run and start over.')
+@with_appcontext
+def import_command(kind, path, batch_size, use_copy, restart):
+    """Load venues, artists or shows from a CSV or JSON-lines file.
+
+    Rows are validated like the forms of the web pages, and shows are
+    booked like theirs, so a show that overlaps one of its venue or artist
+    is refused. Rows that don't validate or are refused are written to
+    PATH.rejects.jsonl with their errors. Every
+    batch is committed separately and recorded in PATH.checkpoint, so a
+    failed import picks up after the last committed batch when run again.
+    """
+    import forms
+    model, form_name, values, tags = IMPORTS[kind]
+    form_class = getattr(forms, form_name)
+    checkpoint = path + '.checkpoint'
+    skip = 0
+    if os.path.exists(checkpoint) and not restart:
+        with open(checkpoint) as f:
+            skip = int(f.read() or 0)
+        click.echo('Resuming after row {}'.format(skip))
+
+    started = time.perf_counter()
+    loaded = rejected = 0
+    with open(path + '.rejects.jsonl', 'a' if skip else 'w') as rejects_file:
+
+        def flush(batch, rejects, line):
+            nonlocal loaded, rejected
+            if kind == 'shows':
+                batch = book_rows(resolve_references(batch, rejects), rejects)
+            rows = [row for _, row in batch]
+            if rows and kind != 'shows':
+                if use_copy:
+                    copy_rows(model.__table__, rows)
+                else:
+                    db.session.execute(model.__table__.insert(), rows)
+            db.session.commit()
+            for reject_line, errors in sorted(rejects):
+                rejects_file.write(json.dumps({'line': reject_line, 'errors': errors}) + '\n')
+            rejects_file.flush()
+            write_checkpoint(checkpoint, line)
+            loaded += len(rows)
+            rejected += len(rejects)
+            elapsed = time.perf_counter() - started
+            click.echo('{} rows loaded, {} rejected, {:.0f} rows/s'.format(
+                loaded, rejected, loaded / elapsed if elapsed else 0))
+
+        # binding the fields is most of the cost of a form, so one form is
+        # bound up front and refilled for every row
+        form = form_class(meta={'csrf': False})
+        batch = []
+        rejects = []
+        line = skip
+        for line, row in enumerate(read_rows(path), 1):
+            if line <= skip:
+                continue
+            form.process(formdata(row))
+            if not form.validate():
+                rejects.append((line, form.errors))
+                continue
+            item = values(form)
+            # references by name are resolved per batch
+            for key in ('venue_name', 'artist_name'):
+                if row.get(key):
+                    item[key] = row[key]
+            batch.append((line, item))
+            if len(batch) >= batch_size:
+                flush(batch, rejects, line)
+                batch = []
+                rejects = []
+        flush(batch, rejects, line)
+
+    os.remove(checkpoint)
+    response_cache.invalidate(*tags)
+    elapsed = time.perf_counter() - started
+    click.echo('Done: {} rows loaded, {} rejected in {:.1f}s ({:.0f} rows/s)'.format(
+        loaded, rejected, elapsed, loaded / elapsed if elapsed else 0))
+
+
+def write_checkpoint(path, line):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(str(line))
+    os.replace(tmp, path)
+
+
+#----------------------------------------------------------------------------#
+# Export.
+#----------------------------------------------------------------------------#
+
+EXPORT_TABLES = ('venue', 'artist', 'show')
+# derived from other columns, not worth shipping
+EXPORT_SKIP_COLUMNS = ('search_vector',)
+
+
+def export_value(value, fmt):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ') if fmt == 'csv' else value.isoformat()
+    if isinstance(value, list) and fmt == 'csv':
+        return GENRE_SEPARATOR.join(value)
+    return value
+
+
+def export_queries(table, columns, since):
+    # the table's rows in id order. a full export of show also has the
+    # archived shows, unpacked into show rows after the others and without
+    # an updated_at; --since leaves them out, they were exported before
+    # they were archived
+    query = db.select(columns).order_by(table.c.id)
+    if since is not None:
+        return [query.where(table.c.updated_at >= since)]
+    queries = [query]
+    if table.name == 'show':
+        archived = ShowArchive.unnested_statement().subquery()
+        queries.append(db.select([
+            archived.c[column.name] if column.name in archived.c
+            else db.cast(db.null(), column.type).label(column.name)
+            for column in columns]))
+    return queries
+
+
+def export_table(connection, table, path, fmt, since):
+    columns = [column for column in table.columns
+               if column.name not in EXPORT_SKIP_COLUMNS]
+    count = 0
+    with open_text(path, 'wt') as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow([column.name for column in columns])
+        for query in export_queries(table, columns, since):
+            # stream_results makes psycopg2 use a named, server-side cursor,
+            # so only one batch of rows is in memory at a time
+            result = connection.execution_options(stream_results=True).execute(query)
+            for row in result.yield_per(5000):
+                values = [export_value(value, fmt) for value in row]
+                if fmt == 'csv':
+                    writer.writerow(values)
+                else:
+                    f.write(json.dumps(dict(zip(row._fields, values))) + '\n')
+                count += 1
+    return count
+
+
+@click.command('export')
+@click.argument('directory', type=click.Path(file_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              default='csv', show_default=True)
+@click.option('--table', 'tables', multiple=True, type=click.Choice(EXPORT_TABLES),
+              help='Export only this table (repeatable). Defaults to all.')
+@click.option('--since', type=click.DateTime(),
+              help='Only rows updated at or after this UTC time.')
+@click.option('--snapshot/--no-snapshot', default=True, show_default=True,
+              help='Read all tables in one REPEATABLE READ transaction.')
+@with_appcontext
+def export_command(directory, fmt, tables, since, snapshot):
+    """Dump venues, artists and shows to gzipped CSV or JSON-lines files.
+
+    Writes DIRECTORY/<table>.<format>.gz and a manifest.json with the row
+    counts and the snapshot time to pass as --since on the next run.
+    Archived shows are in show.<format>.gz as show rows without an
+    updated_at. --since only picks up inserted and updated rows, not
+    deleted ones, and no archived shows.
+    """
+    os.makedirs(directory, exist_ok=True)
+    tables = [db.metadata.tables[name] for name in tables or EXPORT_TABLES]
+    manifest = {'format': fmt, 'since': since.isoformat() if since else None,
+                'tables': {}}
+
+    started = time.perf_counter()
+    with db.engine.connect() as connection:
+        # read only in every transaction, also those after the commit
+        # between tables without --snapshot
+        options = {'postgresql_readonly': True}
+        if snapshot:
+            options['isolation_level'] = 'REPEATABLE READ'
+        connection = connection.execution_options(**options)
+        transaction = connection.begin()
+        try:
+            # the start of the (first) transaction, rows changed after it
+            # are left for the next incremental export
+            manifest['snapshot'] = connection.execute(db.select(
+                db.func.timezone('utc', db.func.now()))).scalar().isoformat()
+            for table in tables:
+                path = os.path.join(directory, '{}.{}.gz'.format(table.name, fmt))
+                count = export_table(connection, table, path, fmt, since)
+                manifest['tables'][table.name] = {'file': os.path.basename(path),
+                                                  'rows': count}
+                click.echo('{}: {} rows'.format(table.name, count))
+                if not snapshot:
+                    transaction.commit()
+                    transaction = connection.begin()
+        finally:
+            transaction.rollback()
+
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    rows = sum(table['rows'] for table in manifest['tables'].values())
+    elapsed = time.perf_counter() - started
+    click.echo('Done: {} rows in {:.1f}s ({:.0f} rows/s), next --since {}'.format(
+        rows, elapsed, rows / elapsed if elapsed else 0, manifest['snapshot']))
+
+
+#----------------------------------------------------------------------------#
+# Show partitions.
+#----------------------------------------------------------------------------#
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def show_partitions(connection):
+    # (name, month) of the monthly partitions of show, oldest first
+    rows = connection.execute(db.text("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'show'::regclass AND c.relname <> 'show_default'
+        ORDER BY c.relname"""))
+    return [(name, datetime.strptime(name[len('show_p'):], '%Y_%m').date())
+            for name, in rows]
+
+
+def create_show_partitions(connection, months):
+    # the partitions that didn't exist yet, each also takes over the rows
+    # of its month from the default partition
+    created = []
+    for month in months:
+        name = connection.execute(db.text('SELECT fyyur_create_show_partition(:month)'),
+                                  {'month': month}).scalar()
+        if name:
+            created.append(name)
+    return created
+
+
+@click.command('shows-partitions')
+@click.option('--ahead', type=int,
+              help='Months of partitions to keep after the current one. '
+                   '[default: SHOW_PARTITIONS_AHEAD]')
+@click.option('--archive-after', type=int,
+              help='Archive shows older than this many months, 0 to keep all. '
+                   '[default: SHOW_ARCHIVE_AFTER_MONTHS]')
+@click.option('--dry-run', is_flag=True, help='Only print what would be done.')
+@with_appcontext
+def partitions_command(ahead, archive_after, dry_run):
+    """Create upcoming show partitions and archive the old ones.
+
+    show is partitioned by month of start_time. This creates the partitions
+    for the current month and the next --ahead ones, plus any month that
+    has shows waiting in the default partition. Partitions entirely older
+    than --archive-after months are packed into show_archive and dropped,
+    and so are the old shows in the default partition. Archived shows
+    still count and are listed as past shows on venue and artist pages.
+    Run it daily or at least monthly, e.g. from cron.
+    """
+    config = current_app.config
+    ahead = config['SHOW_PARTITIONS_AHEAD'] if ahead is None else ahead
+    archive_after = config['SHOW_ARCHIVE_AFTER_MONTHS'] if archive_after is None else archive_after
+    this_month = date.today().replace(day=1)
+    cutoff = add_months(this_month, -archive_after) if archive_after else None
+
+    with db.engine.connect() as connection:
+        # months with shows in the default partition, e.g. from an import
+        waiting = connection.execute(db.text(
+            "SELECT DISTINCT date_trunc('month', start_time)::date FROM show_default")).scalars()
+        months = sorted(set([add_months(this_month, n) for n in range(ahead + 1)] +
+                            [month for month in waiting if cutoff is None or month >= cutoff]))
+        existing = set(name for name, _ in show_partitions(connection))
+        missing = [month for month in months
+                   if 'show_p' + month.strftime('%Y_%m') not in existing]
+        expired = [name for name, month in show_partitions(connection)
+                   if cutoff is not None and add_months(month, 1) <= cutoff]
+
+        if dry_run:
+            click.echo('Would create: {}'.format(', '.join(
+                'show_p' + month.strftime('%Y_%m') for month in missing) or 'nothing'))
+            click.echo('Would archive: {}'.format(', '.join(expired) or 'nothing') +
+                       (' and default partition shows before {}'.format(cutoff) if cutoff else ''))
+            return
+
+        # one transaction per partition, each holds a lock on show while
+        # it attaches or detaches
+        for month in missing:
+            with connection.begin():
+                for name in create_show_partitions(connection, [month]):
+                    click.echo('Created {}'.format(name))
+        archived = 0
+        for name in expired + (['show_default'] if cutoff else []):
+            with connection.begin():
+                count = connection.execute(db.text('SELECT fyyur_archive_shows(:source, :before)'),
+                                           {'source': name, 'before': cutoff}).scalar()
+            archived += count
+            if name != 'show_default':
+                click.echo('Archived {} ({} venue months)'.format(name, count))
+            elif count:
+                click.echo('Archived default partition shows before {} ({} venue months)'.format(
+                    cutoff, count))
+
+    if archived:
+        response_cache.invalidate('shows')
+    click.echo('Done: {} partitions created, {} archived'.format(len(missing), len(expired)))
+
+
+#----------------------------------------------------------------------------#
+# Profiling.
+#----------------------------------------------------------------------------#
+
+@click.command('profile-token')
+@with_appcontext
+def profile_token_command():
+    """Print a token that has a request profiled.
+
+    Send it as the X-Profile header to a server running with
+    PROFILE_ENABLED, then fetch /api/profile with the same header. It is
+    signed with SECRET_KEY, which has to be the one the server uses, and
+    expires after PROFILE_TOKEN_MAX_AGE seconds.
+    """
+    click.echo('{}: {}'.format(PROFILE_HEADER, request_profiler.token(current_app)))
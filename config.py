@@ -1,13 +1,169 @@
 import os
-SECRET_KEY = os.urandom(32)
+import tempfile
+from sqlalchemy.pool import NullPool
+
+# Profile: 'dev', 'test' or 'prod'. Each setting below has a default per
+# profile that an environment variable of the same name overrides.
+FYYUR_ENV = os.environ.get('FYYUR_ENV', 'dev')
+
+
+def setting(name, dev, test=None, prod=None, cast=str):
+    defaults = {'dev': dev,
+                'test': dev if test is None else test,
+                'prod': dev if prod is None else prod}
+    value = os.environ.get(name)
+    return defaults[FYYUR_ENV] if value is None else cast(value)
+
+
+def flag(value):
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+# Has to be the same in every worker for sessions to work across them
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 # Enable debug mode.
-DEBUG = True
+DEBUG = setting('DEBUG', True, False, False, cast=flag)
 
 # Connect to the database
 
 
-SQLALCHEMY_DATABASE_URI = 'postgresql://seohochoi@localhost:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = setting('DATABASE_URL',
+                                  'postgresql://seohochoi@localhost:5432/fyyur',
+                                  'postgresql://localhost:5432/fyyur_test',
+                                  'postgresql://localhost:5432/fyyur')
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Optional read replica for the read-only endpoints below. A client that
+# wrote something reads from the primary for REPLICA_STICKY_SECONDS after.
+SQLALCHEMY_BINDS = {}
+if os.environ.get('DATABASE_REPLICA_URL'):
+    SQLALCHEMY_BINDS['replica'] = os.environ['DATABASE_REPLICA_URL']
+REPLICA_ENDPOINTS = ('venues.venues', 'artists.artists', 'shows.shows',
+                     'venues.show_venue', 'artists.show_artist',
+                     'venues.search_venues', 'artists.search_artists',
+                     'venues.api_venues', 'artists.api_artists', 'shows.api_shows')
+REPLICA_STICKY_SECONDS = setting('REPLICA_STICKY_SECONDS', 5, cast=int)
+
+# Connection pool of each worker: at most DB_POOL_SIZE + DB_MAX_OVERFLOW
+# connections, waiting DB_POOL_TIMEOUT seconds for a free one
+DB_POOL_SIZE = setting('DB_POOL_SIZE', 5, 2, 10, cast=int)
+DB_MAX_OVERFLOW = setting('DB_MAX_OVERFLOW', 10, 0, 5, cast=int)
+DB_POOL_TIMEOUT = setting('DB_POOL_TIMEOUT', 30, 5, 5, cast=int)
+DB_POOL_RECYCLE = setting('DB_POOL_RECYCLE', 1800, cast=int)
+DB_POOL_PRE_PING = setting('DB_POOL_PRE_PING', False, False, True, cast=flag)
+# Longest a single statement of a web request may run, 0 for no limit. It
+# is set in each transaction of a request, so migrations and commands
+# (`flask db upgrade`, `flask shows-partitions`, ...) run without one
+DB_STATEMENT_TIMEOUT_MS = setting('DB_STATEMENT_TIMEOUT_MS', 0, 5000, 5000, cast=int)
+# Connecting through PgBouncer in transaction pooling mode: PgBouncer does
+# the pooling
+DB_PGBOUNCER = setting('DB_PGBOUNCER', False, cast=flag)
+
+if DB_PGBOUNCER:
+    SQLALCHEMY_ENGINE_OPTIONS = {'poolclass': NullPool}
+else:
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+
+# Number of shows per page on /shows
+SHOWS_PER_PAGE = 60
+
+# Number of upcoming/past shows per page on venue and artist pages
+PROFILE_SHOWS_PER_PAGE = 12
+
+# Number of ranked results shown by the venue and artist searches
+SEARCH_RESULTS_LIMIT = 50
+
+# Number of names returned by /api/search/suggest
+SUGGEST_LIMIT = 10
+
+# A show takes its venue and artist for SHOW_BOOKING_HOURS: shows of the same
+# venue or artist that overlap are refused. /shows/batch and POST /api/shows
+# take up to SHOW_BATCH_MAX shows at once
+SHOW_BOOKING_HOURS = setting('SHOW_BOOKING_HOURS', 3, cast=int)
+SHOW_BATCH_MAX = setting('SHOW_BATCH_MAX', 500, cast=int)
+
+# `flask shows-partitions` keeps this many monthly show partitions ahead of
+# the current month, and archives shows older than SHOW_ARCHIVE_AFTER_MONTHS
+# (0 keeps every show in the partitions)
+SHOW_PARTITIONS_AHEAD = setting('SHOW_PARTITIONS_AHEAD', 3, cast=int)
+SHOW_ARCHIVE_AFTER_MONTHS = setting('SHOW_ARCHIVE_AFTER_MONTHS', 24, cast=int)
+
+# Statements, database time and rows of each request go out as X-SQL-*
+# and Server-Timing headers. A request that runs one statement shape
+# SQL_REPEAT_THRESHOLD times (a query per row, N+1) or more statements than
+# its endpoint's budget is logged, and with SQL_STRICT fails with
+# sqlstats.QueryBudgetExceeded at the statement that went over
+SQL_STATS_HEADERS = setting('SQL_STATS_HEADERS', True, True, False, cast=flag)
+SQL_STRICT = setting('SQL_STRICT', False, True, False, cast=flag)
+SQL_REPEAT_THRESHOLD = setting('SQL_REPEAT_THRESHOLD', 5, cast=int)
+SQL_DEFAULT_QUERY_BUDGET = setting('SQL_DEFAULT_QUERY_BUDGET', 10, cast=int)
+SQL_QUERY_BUDGETS = {
+    'venues.venues': 3, 'artists.artists': 3, 'shows.shows': 1,
+    'venues.show_venue': 5, 'artists.show_artist': 5,
+    'venues.search_venues': 2, 'artists.search_artists': 2,
+    'venues.api_venues': 1, 'artists.api_artists': 1, 'shows.api_shows': 1,
+    'venues.edit_venue': 1, 'artists.edit_artist': 1,
+    'venues.edit_venue_submission': 2, 'artists.edit_artist_submission': 2,
+    'venues.create_venue_submission': 2, 'artists.create_artist_submission': 2,
+    'shows.create_show_submission': 2, 'shows.create_shows_batch_submission': 2,
+    'shows.api_create_shows': 2, 'shows.create_shows_batch': 0,
+    'venues.delete_venue': 2, 'artists.delete_artist': 2,
+    'main.index': 0, 'main.search_suggest': 0,
+}
+
+# Prometheus metrics on /metrics. With several worker processes (gunicorn)
+# set METRICS_DIR to a directory they share that is emptied when the server
+# starts: each worker writes its numbers there every METRICS_FLUSH_SECONDS
+# and a scrape adds them up
+METRICS_ENABLED = setting('METRICS_ENABLED', True, cast=flag)
+METRICS_DIR = setting('METRICS_DIR', '')
+METRICS_FLUSH_SECONDS = setting('METRICS_FLUSH_SECONDS', 5, cast=int)
+
+# Profiling of live requests, off unless PROFILE_ENABLED (then nothing is
+# hooked in at all). Requests with an X-Profile token from `flask
+# profile-token` are profiled, and PROFILE_SAMPLE_RATE of the requests to
+# PROFILE_ENDPOINTS (comma separated, e.g. venues.show_venue, empty for
+# every endpoint).
+# PROFILE_MODE 'sample' samples stacks every PROFILE_INTERVAL_MS, 'cprofile'
+# traces every call. /api/profile dumps a worker's profiles
+PROFILE_ENABLED = setting('PROFILE_ENABLED', False, cast=flag)
+PROFILE_MODE = setting('PROFILE_MODE', 'sample')
+PROFILE_SAMPLE_RATE = setting('PROFILE_SAMPLE_RATE', 0.0, cast=float)
+PROFILE_ENDPOINTS = [name for name in setting('PROFILE_ENDPOINTS', '').split(',') if name]
+PROFILE_INTERVAL_MS = setting('PROFILE_INTERVAL_MS', 5, cast=int)
+PROFILE_TOKEN_MAX_AGE = setting('PROFILE_TOKEN_MAX_AGE', 3600, cast=int)
+
+# JSON-lines log of app.logger and, with LOG_ACCESS, of every request. A
+# background thread writes it to LOG_FILE ('{pid}' is replaced by the
+# worker's pid; stderr when empty), rotated at LOG_MAX_BYTES, or every
+# LOG_ROTATE_WHEN ('midnight', 'H', ...) when that is set, keeping
+# LOG_BACKUP_COUNT old files. Workers rotating one file get in each other's
+# way, so give them a file each. Records beyond LOG_QUEUE_SIZE waiting to be
+# written are dropped (fyyur_log_records_dropped_total) rather than making
+# requests wait
+LOG_FILE = setting('LOG_FILE', '', '', 'fyyur.log')
+LOG_LEVEL = setting('LOG_LEVEL', 'INFO')
+LOG_ACCESS = setting('LOG_ACCESS', True, cast=flag)
+LOG_MAX_BYTES = setting('LOG_MAX_BYTES', 50 * 1024 * 1024, cast=int)
+LOG_ROTATE_WHEN = setting('LOG_ROTATE_WHEN', '')
+LOG_BACKUP_COUNT = setting('LOG_BACKUP_COUNT', 5, cast=int)
+LOG_QUEUE_SIZE = setting('LOG_QUEUE_SIZE', 10000, cast=int)
+
+# Cache for the /venues, /artists and /shows pages: 'lru' (per process),
+# 'filesystem' (shared by the workers on a host, in CACHE_DIR) or 'null'.
+# an edit invalidates the pages of the process, or host, that handled it;
+# with 'lru' the other workers keep serving theirs for up to CACHE_TTL, so
+# production shares a filesystem cache between its workers
+CACHE_BACKEND = setting('CACHE_BACKEND', 'lru', 'null', 'filesystem')
+CACHE_TTL = setting('CACHE_TTL', 60, cast=int)
+CACHE_MAX_ENTRIES = setting('CACHE_MAX_ENTRIES', 1000, cast=int)
+CACHE_DIR = setting('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'fyyur-cache'))
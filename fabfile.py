@@ -1,58 +1,97 @@
-from fabric.api import local, settings, abort
-from fabric.contrib.console import confirm
+import os
 
-# prepare for deployment
+from fabric import task
+from invoke.exceptions import Exit
 
+# prepare for deployment
 
-def test():
-    with settings(warn_only=True):
-        result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
-        )
+# the tests (tests/, with the query plan check of benchmarks/plan_check.py)
+# run against the scratch database in TEST_DATABASE_URL, which they empty
+# and fill. the route suite runs against the one in BENCH_DATABASE_URL
+# (filled by benchmarks/datagen.py) and fails on an error status or a
+# regression against benchmarks/baseline.json, which `fab baseline` writes.
+# the baseline is of this machine, so it isn't committed: without it, or
+# without either database, `fab test` stops rather than passes
+BENCH = 'python benchmarks/route_bench.py --database-url "$BENCH_DATABASE_URL"'
+BASELINE = 'benchmarks/baseline.json'
+
+
+def confirm(question):
+    return input(question + " [y/N] ").strip().lower() in ("y", "yes")
+
+
+@task
+def test(c):
+    missing = [name for name in ('TEST_DATABASE_URL', 'BENCH_DATABASE_URL')
+               if not os.environ.get(name)]
+    if missing:
+        raise Exit('Set {} to run the tests.'.format(' and '.join(missing)))
+    if not os.path.exists(BASELINE):
+        raise Exit('No {} to compare the routes with: run `fab baseline` '
+                   'on the revision to compare against first.'.format(BASELINE))
+    result = c.run(
+        "python -m compileall -q . && python -m pytest -q && "
+        + BENCH + " --baseline " + BASELINE, warn=True
+    )
     if result.failed and not confirm("Tests failed. Continue?"):
-        abort("Aborted at user request.")
+        raise Exit("Aborted at user request.")
+
+
+@task
+def baseline(c):
+    c.run(BENCH + " --http --output " + BASELINE)
 
 
-def commit():
-    message = raw_input("Enter a git commit message: ")
-    local("git add . && git commit -am '{}'".format(message))
+@task
+def commit(c):
+    message = input("Enter a git commit message: ")
+    c.run("git add . && git commit -am '{}'".format(message))
 
 
-def push():
-    local("git push origin master")
+@task
+def push(c):
+    c.run("git push origin master")
 
 
-def prepare():
-    test()
-    commit()
-    push()
+@task
+def prepare(c):
+    test(c)
+    commit(c)
+    push(c)
 
 # deploy to heroku
 
 
-def pull():
-    local("git pull origin master")
+@task
+def pull(c):
+    c.run("git pull origin master")
 
 
-def heroku():
-    local("git push heroku master")
+@task
+def heroku(c):
+    c.run("git push heroku master")
 
 
-def heroku_test():
-    local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
+@task
+def heroku_test(c):
+    # read routes only, a few requests each, as a smoke test of the release
+    c.run(
+        "heroku run 'python benchmarks/route_bench.py --database-url \"$DATABASE_URL\""
+        " --read-only --requests 1 --warmup 0'"
     )
 
 
-def deploy():
-    pull()
-    test()
-    commit()
-    heroku()
-    heroku_test()
+@task
+def deploy(c):
+    pull(c)
+    test(c)
+    commit(c)
+    heroku(c)
+    heroku_test(c)
 
 # rollback
 
 
-def rollback():
-    local("heroku rollback")
+@task
+def rollback(c):
+    c.run("heroku rollback")
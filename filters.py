@@ -0,0 +1,50 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+
+# babel and dateutil are imported by the first call that needs them, not
+# when the app starts
+
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=None)
+def compiled_pattern(format, locale):
+    # a handful of (format, locale) pairs, each parsed once per process
+    import babel.dates
+    pattern = DATETIME_FORMATS.get(format, format)
+    return babel.dates.parse_pattern(pattern), babel.Locale.parse(locale)
+
+
+# the lengths babel formats by the locale's own date and time patterns,
+# those not in DATETIME_FORMATS are left to it
+BABEL_FORMATS = ('short', 'medium', 'long', 'full')
+
+
+@lru_cache(maxsize=4096)
+def _format(value, format, locale):
+    if format in BABEL_FORMATS and format not in DATETIME_FORMATS:
+        import babel.dates
+        return babel.dates.format_datetime(value, format, locale=locale)
+    pattern, locale = compiled_pattern(format, locale)
+    # babel reads naive datetimes as UTC, same as babel.dates.format_datetime
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return pattern.apply(value, locale)
+
+
+@lru_cache(maxsize=4096)
+def _parse(value):
+    import dateutil.parser
+    return dateutil.parser.parse(value)
+
+
+def format_datetime(value, format='medium', locale='en'):
+    # the `datetime` template filter. values from the database are already
+    # datetimes and skip dateutil; the same show time is often rendered
+    # many times on a page, so results are memoized
+    if not isinstance(value, datetime):
+        value = _parse(value)
+    return _format(value, format, locale)
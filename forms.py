@@ -1,6 +1,7 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
+from wtforms import (StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField,
+                     TextAreaField)
 from wtforms.validators import DataRequired, AnyOf, URL, Regexp
 
 class ShowForm(Form):
@@ -16,6 +17,16 @@ class ShowForm(Form):
         default= datetime.today()
     )
 
+class ShowBatchForm(Form):
+    # one show per line: "venue_id, start_time" of artist_id, or
+    # "artist_id, venue_id, start_time" when it is empty
+    artist_id = StringField(
+        'artist_id'
+    )
+    shows = TextAreaField(
+        'shows', validators=[DataRequired()]
+    )
+
 class VenueForm(Form):
     name = StringField(
         'name', validators=[DataRequired()]
@@ -0,0 +1,34 @@
+#----------------------------------------------------------------------------#
+# The flask command, for one-off commands that should start quickly:
+#
+#     python manage.py partitions
+#     python manage.py db upgrade
+#
+# `flask` loads every installed plugin before running anything, which means
+# pkg_resources to find them and alembic for Flask-Migrate's `db`, whatever
+# the command. Here `db` is the only plugin, and is loaded when asked for.
+#----------------------------------------------------------------------------#
+from flask.cli import FlaskGroup
+from app import create_app
+
+
+class ManageGroup(FlaskGroup):
+
+    def _load_plugin_commands(self):
+        pass
+
+    def get_command(self, ctx, name):
+        if name == 'db':
+            from flask_migrate.cli import db
+            return db
+        return super().get_command(ctx, name)
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | {'db'})
+
+
+cli = ManageGroup(create_app=create_app,
+                  help='The commands of the flask command, without its plugin lookup.')
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,307 @@
+import os
+import pickle
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import g, request
+from flask.signals import before_render_template, signals_available, template_rendered
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+from cache import response_cache
+from requestlog import request_log
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RENDER_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'fyyur_http_request_duration_seconds':
+        ('histogram', 'Time to handle a request, by endpoint.', LATENCY_BUCKETS),
+    'fyyur_http_responses_total':
+        ('counter', 'Responses sent, by endpoint and status.', None),
+    'fyyur_http_requests_in_flight':
+        ('gauge', 'Requests being handled.', None),
+    'fyyur_db_time_seconds_total':
+        ('counter', 'Time spent running SQL statements, by endpoint.', None),
+    'fyyur_db_statements_total':
+        ('counter', 'SQL statements run, by endpoint.', None),
+    'fyyur_template_render_seconds':
+        ('histogram', 'Time to render a template, by template.', RENDER_BUCKETS),
+    'fyyur_db_pool_checkouts_total':
+        ('counter', 'Connections checked out of the pools.', None),
+    'fyyur_db_pool_checked_out':
+        ('gauge', 'Connections checked out of the pools now.', None),
+    'fyyur_cache_hits_total':
+        ('counter', 'Pages served from the page cache.', None),
+    'fyyur_cache_misses_total':
+        ('counter', 'Cacheable pages that had to be rendered.', None),
+    'fyyur_cache_hit_ratio':
+        ('gauge', 'Share of cacheable pages served from the cache.', None),
+    'fyyur_log_records_dropped_total':
+        ('counter', 'Log records dropped because the log writer fell behind.', None),
+}
+
+
+class Registry(object):
+    # samples keyed (name, labels, field), field being None for counters and
+    # gauges, and 'sum', 'count' or a bucket index for histograms. every
+    # thread adds to its own shard, so recording never takes a lock and no
+    # two threads write the same dict; a snapshot adds the shards up. the
+    # shards of finished threads (the threaded server starts one per
+    # request) are folded into one dict now and then
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = defaultdict(float)
+            with self._lock:
+                if len(self._shards) >= 64:
+                    self._retire()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _retire(self):
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                for key, value in shard.items():
+                    self._retired[key] += value
+        self._shards = live
+
+    def inc(self, name, labels=(), value=1.0):
+        self._shard()[(name, labels, None)] += value
+
+    def observe(self, name, labels, value):
+        shard = self._shard()
+        shard[(name, labels, bisect_left(METRICS[name][2], value))] += 1
+        shard[(name, labels, 'sum')] += value
+        shard[(name, labels, 'count')] += 1
+
+    def snapshot(self):
+        with self._lock:
+            self._retire()
+            total = defaultdict(float, self._retired)
+            for _, shard in self._shards:
+                # list() copies the items without letting the owning thread
+                # run in between
+                for key, value in list(shard.items()):
+                    total[key] += value
+        return total
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, str(value).replace('\\', r'\\')
+                                                .replace('"', r'\"').replace('\n', r'\n'))
+                          for key, value in labels) + '}'
+
+
+class Metrics(object):
+    # request, database, template, pool and page cache metrics in the
+    # Prometheus text format. each worker process keeps its own Registry;
+    # with METRICS_DIR set, a background thread writes it to <pid>.pickle
+    # there every METRICS_FLUSH_SECONDS and a scrape adds up the files of
+    # every worker. counters of workers that exited still count, gauges only
+    # for the ones alive
+
+    def __init__(self, app=None):
+        self.registry = Registry()
+        self.enabled = False
+        self.directory = None
+        self.flush_interval = 5
+        self._flusher_pid = None
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        if not self.enabled:
+            return
+        self.directory = app.config.get('METRICS_DIR') or None
+        self.flush_interval = app.config.get('METRICS_FLUSH_SECONDS', 5)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self._start)
+        app.after_request(self._response)
+        app.teardown_request(self._finish)
+        if signals_available:
+            before_render_template.connect(self._render_started, app)
+            template_rendered.connect(self._render_finished, app)
+        else:
+            app.logger.warning('blinker is not installed, '
+                               'fyyur_template_render_seconds is not recorded')
+        if not self._listening:
+            event.listen(Pool, 'checkout', self._checkout)
+            event.listen(Pool, 'checkin', self._checkin)
+            self._listening = True
+
+    # recording
+
+    # every g access goes through a context lookup, so each hook resolves
+    # it once; this is what keeps the overhead to a few microseconds
+
+    def request_started(self):
+        if self.directory and self._flusher_pid != os.getpid():
+            self._start_flusher()
+        self.registry.inc('fyyur_http_requests_in_flight')
+
+    def request_finished(self, endpoint, status, duration, stats):
+        # stats: the request's sqlstats.StatementStats, or None
+        registry = self.registry
+        endpoint = (('endpoint', endpoint or 'unmatched'),)
+        registry.observe('fyyur_http_request_duration_seconds', endpoint, duration)
+        registry.inc('fyyur_http_requests_in_flight', value=-1)
+        registry.inc('fyyur_http_responses_total', endpoint + (('status', status),))
+        if stats is not None and stats.count:
+            registry.inc('fyyur_db_statements_total', endpoint, stats.count)
+            registry.inc('fyyur_db_time_seconds_total', endpoint, stats.duration)
+
+    def _start(self):
+        g._get_current_object().metrics_started = time.perf_counter()
+        self.request_started()
+
+    def _response(self, response):
+        g._get_current_object().metrics_status = response.status_code
+        return response
+
+    def _finish(self, exc):
+        store = g._get_current_object()
+        started = store.__dict__.pop('metrics_started', None)
+        if started is None:
+            return
+        self.request_finished(request.endpoint, getattr(store, 'metrics_status', 500),
+                              time.perf_counter() - started, getattr(store, 'sql_stats', None))
+
+    def _render_started(self, sender, template, context, **extra):
+        store = g._get_current_object()
+        if 'metrics_renders' not in store:
+            store.metrics_renders = []
+        store.metrics_renders.append(time.perf_counter())
+
+    def _render_finished(self, sender, template, context, **extra):
+        renders = getattr(g._get_current_object(), 'metrics_renders', None)
+        if renders:
+            self.registry.observe('fyyur_template_render_seconds',
+                                  (('template', template.name),),
+                                  time.perf_counter() - renders.pop())
+
+    def _checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.registry.inc('fyyur_db_pool_checkouts_total')
+        self.registry.inc('fyyur_db_pool_checked_out')
+
+    def _checkin(self, dbapi_connection, connection_record):
+        self.registry.inc('fyyur_db_pool_checked_out', value=-1)
+
+    # collecting
+
+    def worker_samples(self):
+        # this worker's registry, plus the counters kept elsewhere
+        samples = self.registry.snapshot()
+        samples[('fyyur_cache_hits_total', (), None)] = response_cache.hits
+        samples[('fyyur_cache_misses_total', (), None)] = response_cache.misses
+        samples[('fyyur_log_records_dropped_total', (), None)] = request_log.dropped
+        return samples
+
+    def _start_flusher(self):
+        # one per worker process, started by its first request (after the fork)
+        self._flusher_pid = os.getpid()
+        thread = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+        thread.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        samples = dict(self.worker_samples())
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(samples, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, os.path.join(self.directory, '{}.pickle'.format(os.getpid())))
+
+    def collect(self):
+        # every worker's samples added up, this one's read live
+        total = defaultdict(float, self.worker_samples())
+        if self.directory:
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith('.pickle'):
+                    continue
+                pid = int(entry.name[:-len('.pickle')])
+                if pid == os.getpid():
+                    continue
+                try:
+                    with open(entry.path, 'rb') as f:
+                        samples = pickle.load(f)
+                except (OSError, EOFError, pickle.UnpicklingError):
+                    continue
+                alive = pid_alive(pid)
+                for key, value in samples.items():
+                    if alive or METRICS[key[0]][0] != 'gauge':
+                        total[key] += value
+        hits = total.get(('fyyur_cache_hits_total', (), None), 0)
+        lookups = hits + total.get(('fyyur_cache_misses_total', (), None), 0)
+        if lookups:
+            total[('fyyur_cache_hit_ratio', (), None)] = hits / lookups
+        return total
+
+    def render(self):
+        by_name = defaultdict(dict)
+        for (name, labels, field), value in self.collect().items():
+            by_name[name][labels, field] = value
+        lines = []
+        for name, (kind, help, buckets) in METRICS.items():
+            samples = by_name.get(name)
+            if not samples:
+                continue
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            if kind != 'histogram':
+                for (labels, _), value in sorted(samples.items()):
+                    lines.append(name + format_labels(labels) + ' ' + format_value(value))
+                continue
+            for labels in sorted({labels for labels, _ in samples}):
+                cumulative = 0
+                for i, bound in enumerate(buckets + (float('inf'),)):
+                    cumulative += samples.get((labels, i), 0)
+                    lines.append('{}_bucket{} {}'.format(
+                        name, format_labels(labels + (('le', format_value(bound)),)),
+                        format_value(cumulative)))
+                lines.append('{}_sum{} {}'.format(name, format_labels(labels),
+                                                  format_value(samples.get((labels, 'sum'), 0))))
+                lines.append('{}_count{} {}'.format(name, format_labels(labels),
+                                                    format_value(samples.get((labels, 'count'), 0))))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,40 @@
+"""indexes for show lookups, the venue directory and genres
+
+Revision ID: 3f6a9d2c7e41
+Revises: 8c4d2b6e1f37
+Create Date: 2026-10-18 13:20:05.118734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6a9d2c7e41'
+down_revision = '8c4d2b6e1f37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a venue's or artist's shows in time order: profile pages, their counts
+    # and version stamps, and the ON DELETE CASCADE lookups
+    op.create_index('ix_show_venue_id_start_time', 'show', ['venue_id', 'start_time'])
+    op.create_index('ix_show_artist_id_start_time', 'show', ['artist_id', 'start_time'])
+    # the /shows feed pages on (start_time, id)
+    op.create_index('ix_show_start_time_id', 'show', ['start_time', 'id'])
+    # the venue directory is filtered by area and listed in this order
+    op.create_index('ix_venue_state_city_name', 'venue', ['state', 'city', 'name'])
+    # genres.contains([...]) is the array @> operator
+    for table in ('venue', 'artist'):
+        op.create_index('ix_{}_genres'.format(table), table, ['genres'],
+                        postgresql_using='gin')
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.drop_index('ix_{}_genres'.format(table), table_name=table)
+    op.drop_index('ix_venue_state_city_name', table_name='venue')
+    op.drop_index('ix_show_start_time_id', table_name='show')
+    op.drop_index('ix_show_artist_id_start_time', table_name='show')
+    op.drop_index('ix_show_venue_id_start_time', table_name='show')
@@ -0,0 +1,61 @@
+"""search vectors and trigram indexes for venues and artists
+
+Revision ID: 5a1c3e7f9b20
+Revises: d2e9ec415b79
+Create Date: 2026-10-18 10:12:41.508321
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5a1c3e7f9b20'
+down_revision = 'd2e9ec415b79'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    # name weighs most, then where the place is, then its genres.
+    # array_to_string is not immutable, so the vector is kept up to date
+    # by a trigger instead of a generated column
+    op.execute("""
+        CREATE FUNCTION fyyur_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(NEW.city, '') || ' ' ||
+                                                coalesce(NEW.state, '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce(array_to_string(NEW.genres, ' '), '')), 'C');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+        op.execute("""
+            CREATE TRIGGER {0}_search_vector_update
+            BEFORE INSERT OR UPDATE OF name, city, state, genres ON {0}
+            FOR EACH ROW EXECUTE FUNCTION fyyur_search_vector_update()
+        """.format(table))
+        # fire the trigger for the rows already there
+        op.execute('UPDATE {0} SET name = name'.format(table))
+        op.create_index('ix_{}_search_vector'.format(table), table, ['search_vector'],
+                        postgresql_using='gin')
+        op.create_index('ix_{}_name_trgm'.format(table), table, ['name'],
+                        postgresql_using='gin',
+                        postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.drop_index('ix_{}_name_trgm'.format(table), table_name=table)
+        op.drop_index('ix_{}_search_vector'.format(table), table_name=table)
+        op.execute('DROP TRIGGER {0}_search_vector_update ON {0}'.format(table))
+        op.drop_column(table, 'search_vector')
+    op.execute('DROP FUNCTION fyyur_search_vector_update()')
@@ -0,0 +1,29 @@
+"""updated_at on venue, artist and show
+
+Revision ID: 8c4d2b6e1f37
+Revises: 5a1c3e7f9b20
+Create Date: 2026-10-18 11:02:17.344908
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4d2b6e1f37'
+down_revision = '5a1c3e7f9b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # stored in UTC, existing rows start out as modified now
+    for table in ('venue', 'artist', 'show'):
+        op.add_column(table, sa.Column(
+            'updated_at', sa.DateTime(), nullable=False,
+            server_default=sa.text("timezone('utc', now())")))
+
+
+def downgrade():
+    for table in ('show', 'artist', 'venue'):
+        op.drop_column(table, 'updated_at')
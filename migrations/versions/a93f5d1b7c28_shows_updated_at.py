@@ -0,0 +1,117 @@
+"""shows_updated_at on venue and artist, kept up to date by triggers
+
+Revision ID: a93f5d1b7c28
+Revises: f7b3c9e2d140
+Create Date: 2026-10-18 19:12:44.508213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a93f5d1b7c28'
+down_revision = 'f7b3c9e2d140'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # when the shows listed on the profile page last changed: one of its
+    # own shows added, moved or removed, or the name or image of a venue or
+    # artist it has a show with. the page's version stamp then only reads
+    # the entity's row instead of all of its shows
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column(
+            'shows_updated_at', sa.DateTime(), nullable=False,
+            server_default=sa.text("timezone('utc', now())")))
+
+    # statement level with transition tables, like the genre counts, so a
+    # batch of shows bumps each of its venues and artists once. archived
+    # shows only change when a venue or artist is deleted: archiving itself
+    # updates show_archive and leaves the pages as they were
+    op.execute("""
+        CREATE FUNCTION fyyur_shows_changed() RETURNS trigger AS $$
+        DECLARE
+            rows_query text := CASE TG_TABLE_NAME
+                WHEN 'show' THEN 'SELECT venue_id, artist_id FROM %I'
+                ELSE 'SELECT venue_id, unnest(artist_ids) FROM %I' END;
+            changes text[] := '{}';
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                changes := changes || format(rows_query, 'fyyur_new_rows');
+            END IF;
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                changes := changes || format(rows_query, 'fyyur_old_rows');
+            END IF;
+            EXECUTE format(
+                'WITH changed (venue_id, artist_id) AS (%s), '
+                'venues AS (UPDATE venue SET shows_updated_at = timezone(''utc'', now()) '
+                '           WHERE id IN (SELECT venue_id FROM changed)) '
+                'UPDATE artist SET shows_updated_at = timezone(''utc'', now()) '
+                'WHERE id IN (SELECT artist_id FROM changed)',
+                array_to_string(changes, ' UNION '));
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER show_shows_changed_insert AFTER INSERT ON show
+        REFERENCING NEW TABLE AS fyyur_new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION fyyur_shows_changed()
+    """)
+    op.execute("""
+        CREATE TRIGGER show_shows_changed_update AFTER UPDATE ON show
+        REFERENCING OLD TABLE AS fyyur_old_rows NEW TABLE AS fyyur_new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION fyyur_shows_changed()
+    """)
+    op.execute("""
+        CREATE TRIGGER show_shows_changed_delete AFTER DELETE ON show
+        REFERENCING OLD TABLE AS fyyur_old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION fyyur_shows_changed()
+    """)
+    op.execute("""
+        CREATE TRIGGER show_archive_shows_changed_delete AFTER DELETE ON show_archive
+        REFERENCING OLD TABLE AS fyyur_old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION fyyur_shows_changed()
+    """)
+
+    # a venue's shows list their artists' names and images and the other
+    # way round, renaming one changes the pages of everyone it played with
+    op.execute("""
+        CREATE FUNCTION fyyur_counterpart_renamed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_TABLE_NAME = 'venue' THEN
+                UPDATE artist SET shows_updated_at = timezone('utc', now())
+                WHERE id IN (SELECT artist_id FROM show WHERE venue_id = NEW.id
+                             UNION
+                             SELECT unnest(artist_ids) FROM show_archive WHERE venue_id = NEW.id);
+            ELSE
+                UPDATE venue SET shows_updated_at = timezone('utc', now())
+                WHERE id IN (SELECT venue_id FROM show WHERE artist_id = NEW.id
+                             UNION
+                             SELECT venue_id FROM show_archive WHERE artist_ids @> ARRAY[NEW.id]);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for table in ('venue', 'artist'):
+        op.execute("""
+            CREATE TRIGGER {0}_counterpart_renamed AFTER UPDATE OF name, image_link ON {0}
+            FOR EACH ROW
+            WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.image_link IS DISTINCT FROM NEW.image_link)
+            EXECUTE FUNCTION fyyur_counterpart_renamed()
+        """.format(table))
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.execute('DROP TRIGGER {0}_counterpart_renamed ON {0}'.format(table))
+    op.execute('DROP FUNCTION fyyur_counterpart_renamed()')
+    op.execute('DROP TRIGGER show_archive_shows_changed_delete ON show_archive')
+    for event in ('delete', 'update', 'insert'):
+        op.execute('DROP TRIGGER show_shows_changed_{0} ON show'.format(event))
+    op.execute('DROP FUNCTION fyyur_shows_changed()')
+    for table in ('artist', 'venue'):
+        op.drop_column(table, 'shows_updated_at')
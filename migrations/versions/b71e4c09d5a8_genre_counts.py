@@ -0,0 +1,103 @@
+"""genre_count table kept up to date by triggers, for the genre facets
+
+Revision ID: b71e4c09d5a8
+Revises: 3f6a9d2c7e41
+Create Date: 2026-10-18 13:41:52.630417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b71e4c09d5a8'
+down_revision = '3f6a9d2c7e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # how many venues/artists of each state list each genre, and under the
+    # genre '' how many there are in the state at all. a few thousand rows
+    # at most, so any facet is an aggregate over a small table
+    op.create_table('genre_count',
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('genre', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'genre', 'state')
+    )
+
+    # statement level, with transition tables, so a bulk insert or COPY
+    # adds its rows in one upsert per (genre, state) instead of one per row.
+    # a NULL state counts as ''. the query is built per event because it
+    # can only name the transition tables that event has
+    op.execute("""
+        CREATE FUNCTION fyyur_genre_count_update() RETURNS trigger AS $$
+        DECLARE
+            rows_query text := 'SELECT DISTINCT t.id, g.genre, coalesce(t.state, '''') AS state, '
+                               '%s AS delta FROM %I t, unnest(array_append(t.genres, '''')) AS g(genre) '
+                               'WHERE g.genre IS NOT NULL';
+            changes text[] := '{}';
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                DELETE FROM genre_count WHERE kind = TG_TABLE_NAME;
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                changes := changes || format(rows_query, 1, 'fyyur_new_rows');
+            END IF;
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                changes := changes || format(rows_query, -1, 'fyyur_old_rows');
+            END IF;
+            EXECUTE format(
+                'INSERT INTO genre_count AS c (kind, genre, state, count) '
+                'SELECT %L, genre, state, sum(delta) FROM (%s) AS changes '
+                'GROUP BY genre, state HAVING sum(delta) <> 0 '
+                'ON CONFLICT (kind, genre, state) DO UPDATE SET count = c.count + excluded.count',
+                TG_TABLE_NAME, array_to_string(changes, ' UNION ALL '));
+            DELETE FROM genre_count WHERE kind = TG_TABLE_NAME AND count <= 0;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+    for table in ('venue', 'artist'):
+        # transition tables can't go with a column list, so every update
+        # fires it; one that leaves genres and state alone nets out to nothing
+        op.execute("""
+            CREATE TRIGGER {0}_genre_count_insert AFTER INSERT ON {0}
+            REFERENCING NEW TABLE AS fyyur_new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION fyyur_genre_count_update()
+        """.format(table))
+        op.execute("""
+            CREATE TRIGGER {0}_genre_count_update AFTER UPDATE ON {0}
+            REFERENCING OLD TABLE AS fyyur_old_rows NEW TABLE AS fyyur_new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION fyyur_genre_count_update()
+        """.format(table))
+        op.execute("""
+            CREATE TRIGGER {0}_genre_count_delete AFTER DELETE ON {0}
+            REFERENCING OLD TABLE AS fyyur_old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION fyyur_genre_count_update()
+        """.format(table))
+        op.execute("""
+            CREATE TRIGGER {0}_genre_count_truncate AFTER TRUNCATE ON {0}
+            FOR EACH STATEMENT EXECUTE FUNCTION fyyur_genre_count_update()
+        """.format(table))
+
+        # count the rows already there
+        op.execute("""
+            INSERT INTO genre_count (kind, genre, state, count)
+            SELECT '{0}', genre, coalesce(state, ''), count(DISTINCT id)
+            FROM {0}, unnest(array_append(genres, '')) AS g(genre)
+            WHERE genre IS NOT NULL
+            GROUP BY genre, coalesce(state, '')
+        """.format(table))
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        for event in ('truncate', 'delete', 'update', 'insert'):
+            op.execute('DROP TRIGGER {0}_genre_count_{1} ON {0}'.format(table, event))
+    op.execute('DROP FUNCTION fyyur_genre_count_update()')
+    op.drop_table('genre_count')
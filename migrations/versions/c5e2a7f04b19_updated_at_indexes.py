@@ -0,0 +1,28 @@
+"""indexes on updated_at, for incremental exports
+
+Revision ID: c5e2a7f04b19
+Revises: a93f5d1b7c28
+Create Date: 2026-10-18 20:03:51.772160
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e2a7f04b19'
+down_revision = 'a93f5d1b7c28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # `flask export --since` reads the rows changed after the last export,
+    # a small part of each table. on show it is created on every partition
+    for table in ('venue', 'artist', 'show'):
+        op.create_index('ix_{}_updated_at'.format(table), table, ['updated_at'])
+
+
+def downgrade():
+    for table in ('show', 'artist', 'venue'):
+        op.drop_index('ix_{}_updated_at'.format(table), table_name=table)
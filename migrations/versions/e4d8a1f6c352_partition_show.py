@@ -0,0 +1,210 @@
+"""partition show by month of start_time, archive table for old shows
+
+Revision ID: e4d8a1f6c352
+Revises: b71e4c09d5a8
+Create Date: 2026-10-18 14:22:37.905113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4d8a1f6c352'
+down_revision = 'b71e4c09d5a8'
+branch_labels = None
+depends_on = None
+
+# months of partitions created past the current one, `flask shows-partitions`
+# keeps this many ahead from then on
+MONTHS_AHEAD = 3
+
+
+def upgrade():
+    # the partition for the month of a date, named show_pYYYY_MM. rows that
+    # went to the default partition while it didn't exist are moved into it
+    op.execute("""
+        CREATE FUNCTION fyyur_create_show_partition(month date) RETURNS text AS $$
+        DECLARE
+            name text := 'show_p' || to_char(month, 'YYYY_MM');
+            lower_bound timestamp := date_trunc('month', month);
+            upper_bound timestamp := date_trunc('month', month) + interval '1 month';
+        BEGIN
+            IF to_regclass(name) IS NOT NULL THEN
+                RETURN NULL;
+            END IF;
+            EXECUTE format('CREATE TABLE %I (LIKE show INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', name);
+            EXECUTE format('WITH moved AS (DELETE FROM show_default WHERE start_time >= %L '
+                           'AND start_time < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                           lower_bound, upper_bound, name);
+            EXECUTE format('ALTER TABLE show ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                           name, lower_bound, upper_bound);
+            RETURN name;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+    # archived shows, one row per venue and month with the shows packed into
+    # parallel arrays: no per-show tuple overhead, and TOAST compresses the
+    # arrays of busy venues
+    op.create_table('show_archive',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('show_ids', postgresql.ARRAY(sa.Integer()), nullable=False),
+    sa.Column('artist_ids', postgresql.ARRAY(sa.Integer()), nullable=False),
+    sa.Column('start_times', postgresql.ARRAY(sa.DateTime()), nullable=False),
+    sa.Column('show_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'month')
+    )
+    op.create_index('ix_show_archive_artist_ids', 'show_archive', ['artist_ids'],
+                    postgresql_using='gin')
+
+    # pack the shows of a partition, or of the default partition before a
+    # cutoff, into the archive and remove them from show
+    op.execute("""
+        CREATE FUNCTION fyyur_archive_shows(source regclass, before timestamp) RETURNS bigint AS $$
+        DECLARE
+            archived bigint;
+            later boolean;
+        BEGIN
+            IF source <> 'show_default'::regclass THEN
+                -- a partition goes as a whole
+                EXECUTE format('SELECT EXISTS (SELECT FROM %s WHERE start_time >= %L)', source, before)
+                    INTO later;
+                IF later THEN
+                    RAISE EXCEPTION '% has shows from % on', source, before;
+                END IF;
+            END IF;
+            EXECUTE format(
+                'INSERT INTO show_archive AS a (venue_id, month, show_ids, artist_ids, start_times, show_count) '
+                'SELECT venue_id, date_trunc(''month'', start_time)::date, '
+                '       array_agg(id ORDER BY start_time, id), array_agg(artist_id ORDER BY start_time, id), '
+                '       array_agg(start_time ORDER BY start_time, id), count(*) '
+                'FROM %s WHERE start_time < %L GROUP BY 1, 2 '
+                'ON CONFLICT (venue_id, month) DO UPDATE SET '
+                '    show_ids = a.show_ids || excluded.show_ids, '
+                '    artist_ids = a.artist_ids || excluded.artist_ids, '
+                '    start_times = a.start_times || excluded.start_times, '
+                '    show_count = a.show_count + excluded.show_count',
+                source, before);
+            GET DIAGNOSTICS archived = ROW_COUNT;
+            IF source = 'show_default'::regclass THEN
+                DELETE FROM show_default WHERE start_time < before;
+            ELSE
+                EXECUTE format('ALTER TABLE show DETACH PARTITION %s', source);
+                EXECUTE format('DROP TABLE %s', source);
+            END IF;
+            RETURN archived;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+    # show_archive can't reference artists from an array, deleting one
+    # repacks the rows it appears in without its shows
+    op.execute("""
+        CREATE FUNCTION fyyur_show_archive_artist_delete() RETURNS trigger AS $$
+        BEGIN
+            WITH affected AS (
+                DELETE FROM show_archive
+                WHERE artist_ids && (SELECT array_agg(id) FROM fyyur_old_rows)
+                RETURNING *
+            )
+            INSERT INTO show_archive (venue_id, month, show_ids, artist_ids, start_times, show_count)
+            SELECT venue_id, month, array_agg(u.show_id ORDER BY u.n),
+                   array_agg(u.artist_id ORDER BY u.n), array_agg(u.start_time ORDER BY u.n), count(*)
+            FROM affected,
+                 unnest(show_ids, artist_ids, start_times) WITH ORDINALITY AS u(show_id, artist_id, start_time, n)
+            WHERE u.artist_id NOT IN (SELECT id FROM fyyur_old_rows)
+            GROUP BY venue_id, month;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER artist_show_archive_delete AFTER DELETE ON artist
+        REFERENCING OLD TABLE AS fyyur_old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION fyyur_show_archive_artist_delete()
+    """)
+
+    # the partitioned table takes over the name, the sequence and the
+    # indexes; the primary key has to include the partition key
+    op.execute('ALTER SEQUENCE show_id_seq OWNED BY NONE')
+    op.execute('ALTER TABLE show RENAME TO show_unpartitioned')
+    for index in ('show_pkey', 'ix_show_venue_id_start_time',
+                  'ix_show_artist_id_start_time', 'ix_show_start_time_id'):
+        op.execute('ALTER INDEX {0} RENAME TO {0}_unpartitioned'.format(index))
+    op.execute("""
+        CREATE TABLE show (
+            id integer NOT NULL DEFAULT nextval('show_id_seq'),
+            start_time timestamp NOT NULL,
+            venue_id integer NOT NULL REFERENCES venue (id) ON DELETE CASCADE,
+            artist_id integer NOT NULL REFERENCES artist (id) ON DELETE CASCADE,
+            updated_at timestamp NOT NULL DEFAULT timezone('utc', now()),
+            CONSTRAINT show_pkey PRIMARY KEY (id, start_time)
+        ) PARTITION BY RANGE (start_time)
+    """)
+    op.execute('ALTER SEQUENCE show_id_seq OWNED BY show.id')
+    op.create_index('ix_show_venue_id_start_time', 'show', ['venue_id', 'start_time'])
+    op.create_index('ix_show_artist_id_start_time', 'show', ['artist_id', 'start_time'])
+    op.create_index('ix_show_start_time_id', 'show', ['start_time', 'id'])
+    # shows of months without a partition land here until one is created
+    op.execute('CREATE TABLE show_default PARTITION OF show DEFAULT')
+
+    # a partition for every month with shows, and the next few
+    op.execute("""
+        SELECT fyyur_create_show_partition(month::date)
+        FROM generate_series(
+            date_trunc('month', least(coalesce((SELECT min(start_time) FROM show_unpartitioned), now()), now())),
+            date_trunc('month', greatest(coalesce((SELECT max(start_time) FROM show_unpartitioned), now()),
+                                         now() + interval '{} months')),
+            interval '1 month') AS month
+    """.format(MONTHS_AHEAD))
+    op.execute("""
+        INSERT INTO show (id, start_time, venue_id, artist_id, updated_at)
+        SELECT id, start_time, venue_id, artist_id, updated_at FROM show_unpartitioned
+    """)
+    op.execute('DROP TABLE show_unpartitioned')
+    op.execute('ANALYZE show')
+
+
+def downgrade():
+    op.execute('ALTER SEQUENCE show_id_seq OWNED BY NONE')
+    op.execute('ALTER TABLE show RENAME TO show_partitioned')
+    for index in ('show_pkey', 'ix_show_venue_id_start_time',
+                  'ix_show_artist_id_start_time', 'ix_show_start_time_id'):
+        op.execute('ALTER INDEX {0} RENAME TO {0}_partitioned'.format(index))
+    op.create_table('show',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('show_id_seq')"), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False,
+              server_default=sa.text("timezone('utc', now())")),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('ALTER SEQUENCE show_id_seq OWNED BY show.id')
+    # archived shows come back as plain rows
+    op.execute("""
+        INSERT INTO show (id, start_time, venue_id, artist_id)
+        SELECT u.id, u.start_time, a.venue_id, u.artist_id
+        FROM show_archive a, unnest(a.show_ids, a.artist_ids, a.start_times) AS u(id, artist_id, start_time)
+    """)
+    op.execute("""
+        INSERT INTO show (id, start_time, venue_id, artist_id, updated_at)
+        SELECT id, start_time, venue_id, artist_id, updated_at FROM show_partitioned
+    """)
+    op.execute('DROP TABLE show_partitioned CASCADE')
+    op.create_index('ix_show_venue_id_start_time', 'show', ['venue_id', 'start_time'])
+    op.create_index('ix_show_artist_id_start_time', 'show', ['artist_id', 'start_time'])
+    op.create_index('ix_show_start_time_id', 'show', ['start_time', 'id'])
+
+    op.execute('DROP TRIGGER artist_show_archive_delete ON artist')
+    op.execute('DROP FUNCTION fyyur_show_archive_artist_delete()')
+    op.execute('DROP FUNCTION fyyur_archive_shows(regclass, timestamp)')
+    op.drop_index('ix_show_archive_artist_ids', table_name='show_archive')
+    op.drop_table('show_archive')
+    op.execute('DROP FUNCTION fyyur_create_show_partition(date)')
@@ -0,0 +1,105 @@
+"""show bookings that keep a venue or an artist from being booked twice
+
+Revision ID: f7b3c9e2d140
+Revises: e4d8a1f6c352
+Create Date: 2026-10-18 17:05:12.341870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7b3c9e2d140'
+down_revision = 'e4d8a1f6c352'
+branch_labels = None
+depends_on = None
+
+# how long the shows already listed are taken to last, SHOW_BOOKING_HOURS
+# is the length of the ones created from then on
+BOOKING_HOURS = 3
+
+# fyyur_archive_shows() of e4d8a1f6c352, with a place for a statement
+# between the check of the partition and the packing of its shows
+ARCHIVE_SHOWS = """
+    CREATE OR REPLACE FUNCTION fyyur_archive_shows(source regclass, before timestamp) RETURNS bigint AS $$
+    DECLARE
+        archived bigint;
+        later boolean;
+    BEGIN
+        IF source <> 'show_default'::regclass THEN
+            -- a partition goes as a whole
+            EXECUTE format('SELECT EXISTS (SELECT FROM %s WHERE start_time >= %L)', source, before)
+                INTO later;
+            IF later THEN
+                RAISE EXCEPTION '% has shows from % on', source, before;
+            END IF;
+        END IF;
+        {}
+        EXECUTE format(
+            'INSERT INTO show_archive AS a (venue_id, month, show_ids, artist_ids, start_times, show_count) '
+            'SELECT venue_id, date_trunc(''month'', start_time)::date, '
+            '       array_agg(id ORDER BY start_time, id), array_agg(artist_id ORDER BY start_time, id), '
+            '       array_agg(start_time ORDER BY start_time, id), count(*) '
+            'FROM %s WHERE start_time < %L GROUP BY 1, 2 '
+            'ON CONFLICT (venue_id, month) DO UPDATE SET '
+            '    show_ids = a.show_ids || excluded.show_ids, '
+            '    artist_ids = a.artist_ids || excluded.artist_ids, '
+            '    start_times = a.start_times || excluded.start_times, '
+            '    show_count = a.show_count + excluded.show_count',
+            source, before);
+        GET DIAGNOSTICS archived = ROW_COUNT;
+        IF source = 'show_default'::regclass THEN
+            DELETE FROM show_default WHERE start_time < before;
+        ELSE
+            EXECUTE format('ALTER TABLE show DETACH PARTITION %s', source);
+            EXECUTE format('DROP TABLE %s', source);
+        END IF;
+        RETURN archived;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+
+    # one row per show with the time its venue and artist are taken. the
+    # exclusion constraints can't go on show itself: a partitioned table
+    # only takes constraints that compare its partition key with =. the
+    # foreign key is checked at commit, so a show and its booking can be
+    # inserted in either order
+    op.create_table('show_booking',
+    sa.Column('show_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('during', postgresql.TSRANGE(), nullable=False),
+    sa.ForeignKeyConstraint(['show_id', 'start_time'], ['show.id', 'show.start_time'],
+                            ondelete='CASCADE', deferrable=True, initially='DEFERRED'),
+    sa.PrimaryKeyConstraint('show_id'),
+    postgresql.ExcludeConstraint(('venue_id', '='), ('during', '&&'),
+                                 name='show_booking_venue_overlap', using='gist'),
+    postgresql.ExcludeConstraint(('artist_id', '='), ('during', '&&'),
+                                 name='show_booking_artist_overlap', using='gist')
+    )
+
+    # the upcoming shows, the first listed winning where two overlap
+    op.execute("""
+        INSERT INTO show_booking (show_id, start_time, venue_id, artist_id, during)
+        SELECT id, start_time, venue_id, artist_id,
+               tsrange(start_time, start_time + interval '{} hours')
+        FROM show WHERE start_time >= now()
+        ORDER BY start_time, id
+        ON CONFLICT DO NOTHING
+    """.format(BOOKING_HOURS))
+    op.execute('ANALYZE show_booking')
+
+    # a partition can't be detached while bookings point into it
+    op.execute(ARCHIVE_SHOWS.format('DELETE FROM show_booking WHERE start_time < before;'))
+
+
+def downgrade():
+    op.execute(ARCHIVE_SHOWS.format(''))
+    op.drop_table('show_booking')
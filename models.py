@@ -1,12 +1,247 @@
-from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+import hashlib
+import re
+from flask import g, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from datetime import datetime, timedelta
+from itertools import groupby
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.dialects.postgresql import (ARRAY, TSRANGE, TSVECTOR, ExcludeConstraint,
+                                            array, insert)
+from sqlalchemy.orm import load_only, noload, raiseload, sessionmaker
 
 
-db = SQLAlchemy()
+class RoutingSession(SignallingSession):
+    # reads of requests marked with g.db_replica go to the 'replica' bind;
+    # writes, and everything outside such requests, use the primary
 
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
 
-class Venue(db.Model):
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or not (has_request_context() and g.get('db_replica')):
+            return SignallingSession.get_bind(self, mapper, clause)
+        return self.db.get_engine(self.app, bind='replica')
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
+
+
+def utc_now():
+    return db.func.timezone('utc', db.func.now())
+
+
+def request_now():
+    # "now" is evaluated once per request so every query agrees on it, and
+    # taken afresh outside of one
+    if not has_request_context():
+        return datetime.now()
+    if 'now' not in g:
+        g.now = datetime.now()
+    return g.now
+
+
+# how much of a Venue/Artist each kind of page loads, applied per query with
+# Model.query.options(*Model.loader('listing')). shows are never loaded
+# with the entity: listings only need id and name, detail pages query their
+# shows separately, and deletes leave the shows to ON DELETE CASCADE
+LOADER_PROFILES = {
+    'listing': lambda model: [load_only(model.id, model.name),
+                              raiseload(model.shows)],
+    'detail': lambda model: [raiseload(model.shows)],
+    'delete': lambda model: [load_only(model.id, model.name),
+                             noload(model.shows)],
+}
+
+
+class SearchMixin(object):
+    # ranked search over the search_vector column (name, city, state and
+    # genres, kept up to date by a trigger) or, in fuzzy mode, trigram
+    # similarity of the name so typos still find something
+
+    @classmethod
+    def search(cls, term, limit=50, fuzzy=False, count_cap=1000):
+        query, count_query = cls.search_statements(term, limit, fuzzy, count_cap)
+        rows = db.session.execute(query).all()
+        count = len(rows)
+        if count == limit:
+            count = db.session.execute(count_query).scalar()
+        return cls.search_results(rows, count, count_cap)
+
+    @classmethod
+    def search_statements(cls, term, limit=50, fuzzy=False, count_cap=1000):
+        # the ranked top matches, and a count of all matches for when they
+        # fill the page
+        words = re.findall(r'\w+', term.lower())
+        if not words:
+            # nothing to rank by, list by name like the directory pages
+            match = db.true()
+            order = [cls.name]
+        elif fuzzy:
+            # the % operator uses pg_trgm.similarity_threshold
+            match = cls.name.op('%')(term)
+            order = [db.func.similarity(cls.name, term).desc(), cls.name]
+        else:
+            # every word has to match, the last one as a prefix
+            query = db.func.to_tsquery(db.literal_column("'simple'"), ' & '.join(
+                word + ':*' for word in words))
+            match = cls.search_vector.op('@@')(query)
+            order = [db.func.ts_rank(cls.search_vector, query).desc(), cls.name]
+
+        query = db.select(cls.id, cls.name).where(match) \
+            .order_by(*order).limit(limit)
+        # the total is only counted up to count_cap, past that it's shown
+        # as "count_cap+" rather than scanning every match
+        matches = db.select(cls.id).where(match).limit(count_cap).subquery()
+        count_query = db.select(db.func.count()).select_from(matches)
+        return query, count_query
+
+    @staticmethod
+    def search_results(rows, count, count_cap=1000):
+        return {'count': count, 'count_capped': count >= count_cap,
+                'data': [{'id': row.id, 'name': row.name} for row in rows]}
+
+
+class ShowsMixin(object):
+    # shared by Venue and Artist: the show column pointing back at us, and
+    # the entity on the other side of the show whose details are listed
+    show_key = None
+    counterpart = None
+
+    @classmethod
+    def _show_fk(cls):
+        return getattr(Show, cls.show_key)
+
+    @classmethod
+    def loader(cls, profile):
+        return LOADER_PROFILES[profile](cls)
+
+    def show_counts(self, now):
+        return self.counts_result(db.session.execute(
+            self.show_counts_statement(self.id, now)).one())
+
+    @classmethod
+    def show_counts_statement(cls, id, now):
+        # both counts from one pass over this entity's shows, the past one
+        # plus the shows that have been archived
+        archived = ShowArchive.count_statement(cls.show_key, id).scalar_subquery()
+        return db.select(
+            db.func.count(Show.id).filter(Show.start_time > now),
+            db.func.count(Show.id).filter(Show.start_time <= now) + archived
+        ).where(cls._show_fk() == id)
+
+    @staticmethod
+    def counts_result(row):
+        upcoming, past = row
+        return {'upcoming_shows_count': upcoming, 'past_shows_count': past}
+
+    def shows_page(self, now, upcoming, page=1, per_page=12):
+        rows = db.session.execute(self.shows_page_statement(
+            self.id, now, upcoming, page, per_page))
+        return [dict(row._mapping) for row in rows]
+
+    @classmethod
+    def shows_page_statement(cls, id, now, upcoming, page=1, per_page=12):
+        # one page of upcoming (soonest first) or past (latest first) shows,
+        # joined to the counterpart for the tile name and image. upcoming
+        # shows only come from the partitions after now
+        other = cls.registry._class_registry[cls.counterpart]
+        other_key = other.__tablename__
+        if upcoming:
+            query = db.select(
+                getattr(Show, other_key + '_id').label(other_key + '_id'),
+                other.name.label(other_key + '_name'),
+                other.image_link.label(other_key + '_image_link'),
+                Show.start_time
+            ).join(other, other.id == getattr(Show, other_key + '_id')) \
+             .where(cls._show_fk() == id, Show.start_time > now) \
+             .order_by(Show.start_time, Show.id)
+            return query.offset((page - 1) * per_page).limit(per_page)
+
+        # past shows are merged with the archived ones, each side cut to the
+        # rows this page could need first
+        needed = page * per_page
+        recent = db.select(Show.id, Show.venue_id, Show.artist_id, Show.start_time) \
+            .where(cls._show_fk() == id, Show.start_time <= now) \
+            .order_by(Show.start_time.desc(), Show.id.desc()).limit(needed).subquery()
+        archived = ShowArchive.shows_statement(cls.show_key, id)
+        archived = archived.order_by(archived.selected_columns.start_time.desc(),
+                                     archived.selected_columns.id.desc()).limit(needed).subquery()
+        shows = db.union_all(db.select(recent), db.select(archived)).subquery()
+        query = db.select(
+            shows.c[other_key + '_id'].label(other_key + '_id'),
+            other.name.label(other_key + '_name'),
+            other.image_link.label(other_key + '_image_link'),
+            shows.c.start_time
+        ).join(other, other.id == shows.c[other_key + '_id']) \
+         .order_by(shows.c.start_time.desc(), shows.c.id.desc())
+        return query.offset((page - 1) * per_page).limit(per_page)
+
+    @classmethod
+    def version_stamp(cls, id, now):
+        return cls.stamp_result(db.session.execute(
+            cls.version_stamp_statement(id, now)).first())
+
+    @classmethod
+    def version_stamp_statement(cls, id, now):
+        # everything the profile page shows changes one of these: the entity,
+        # its shows and the counterparts listed with them (shows_updated_at,
+        # kept by triggers), or which shows are upcoming, which changes when
+        # now passes the next one
+        next_show = db.select(db.func.min(Show.start_time)) \
+            .where(cls._show_fk() == cls.id, Show.start_time > now).scalar_subquery()
+        return db.select(cls.updated_at, cls.shows_updated_at, next_show).where(cls.id == id)
+
+    @staticmethod
+    def stamp_result(row):
+        # (etag, last modified), or None if there's no such entity
+        if row is None:
+            return None
+        last_modified = max(row[:2])
+        etag = hashlib.sha1(repr(tuple(row)).encode('utf-8')).hexdigest()
+        return etag, last_modified
+
+    @classmethod
+    def detail_statement(cls, id):
+        return db.select(cls).options(*cls.loader('detail')).where(cls.id == id)
+
+    # both sides count against request_now(), the now of the page's other
+    # queries, rather than the clocks of Python and of the database
+    @hybrid_property
+    def upcoming_shows_count(self):
+        return self.show_counts(request_now())['upcoming_shows_count']
+
+    @upcoming_shows_count.expression
+    def upcoming_shows_count(cls):
+        return db.select(db.func.count(Show.id)) \
+                 .where(cls._show_fk() == cls.id,
+                        Show.start_time > request_now()) \
+                 .scalar_subquery()
+
+    @hybrid_property
+    def past_shows_count(self):
+        return self.show_counts(request_now())['past_shows_count']
+
+    @past_shows_count.expression
+    def past_shows_count(cls):
+        # like show_counts(), the archived shows are past shows too
+        return db.select(db.func.count(Show.id)) \
+                 .where(cls._show_fk() == cls.id,
+                        Show.start_time <= request_now()) \
+                 .scalar_subquery() \
+            + ShowArchive.count_statement(cls.show_key, cls.id).scalar_subquery()
+
+
+class Venue(SearchMixin, ShowsMixin, db.Model):
     __tablename__ = 'venue'
+    show_key = 'venue_id'
+    counterpart = 'Artist'
 
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     name = db.Column(db.String)
@@ -19,85 +254,358 @@ class Venue(db.Model):
     website = db.Column(db.String(500))
     seeking_talent = db.Column(db.Boolean())
     seeking_description = db.Column(db.String(250))
-    genres = db.Column(db.ARRAY(db.String(120)))
+    genres = db.Column(ARRAY(db.String(120)))
+    search_vector = db.deferred(db.Column(TSVECTOR))
+    updated_at = db.Column(db.DateTime(), nullable=False,
+                           default=utc_now(), onupdate=utc_now())
+    # bumped by triggers when the shows listed with it change
+    shows_updated_at = db.Column(db.DateTime(), nullable=False, default=utc_now())
     shows = db.relationship('Show', cascade="all, delete",
-                            passive_deletes=True, lazy='joined',
+                            passive_deletes=True, lazy='select',
                             backref='venue')
 
-    @property
-    def upcoming_shows(self):
-        upcoming = []
-        for show in self.shows:
-            if show.start_time > datetime.now():
-                upcoming.append(show)
-        return upcoming
+    @classmethod
+    def directory(cls, city=None, state=None, genre=None):
+        rows = db.session.execute(cls.directory_statement(city, state, genre)
+                                  .execution_options(yield_per=1000))
+        return cls.directory_areas(rows)
 
-    @property
-    def upcoming_shows_count(self):
-        upcoming_shows_count = len(self.upcoming_shows)
-        return upcoming_shows_count
-
-    @property
-    def past_shows(self):
-        past_shows = []
-        for show in self.shows:
-            if show.start_time < datetime.now():
-                past_shows.append(show)
-        return past_shows
-
-    @property
-    def past_shows_count(self):
-        return len(self.past_shows)
+    @classmethod
+    def directory_statement(cls, city=None, state=None, genre=None):
+        # only the columns the listing needs, already in display order, so
+        # the areas can be built in a single pass over the rows
+        query = db.select(cls.id, cls.name, cls.city, cls.state)
+        if city:
+            query = query.where(cls.city == city)
+        if state:
+            query = query.where(cls.state == state)
+        if genre:
+            query = query.where(cls.genres.contains([genre]))
+        return query.order_by(cls.state, cls.city, cls.name)
+
+    @staticmethod
+    def directory_areas(rows):
+        areas = []
+        for (state, city), venues in groupby(rows, key=lambda row: (row.state, row.city)):
+            areas.append({'city': city, 'state': state,
+                          'venues': [{'id': venue.id, 'name': venue.name}
+                                     for venue in venues]})
+        return areas
 
+    @classmethod
+    def area_summaries(cls, now):
+        return cls.summary_areas(db.session.execute(cls.area_summaries_statement(now)))
 
-class Artist(db.Model):
+    @classmethod
+    def area_summaries_statement(cls, now):
+        # one row per city with its venue and upcoming show counts
+        return db.select(
+            cls.city, cls.state,
+            db.func.count(db.distinct(cls.id)).label('venue_count'),
+            db.func.count(Show.id).filter(Show.start_time > now).label('upcoming_shows_count')
+        ).outerjoin(Show, Show.venue_id == cls.id) \
+         .group_by(cls.state, cls.city) \
+         .order_by(cls.state, cls.city)
+
+    @staticmethod
+    def summary_areas(rows):
+        return [{'city': row.city, 'state': row.state,
+                 'venue_count': row.venue_count,
+                 'upcoming_shows_count': row.upcoming_shows_count}
+                for row in rows]
+
+
+class Artist(SearchMixin, ShowsMixin, db.Model):
     __tablename__ = 'artist'
+    show_key = 'artist_id'
+    counterpart = 'Venue'
 
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(120)))
+    genres = db.Column(ARRAY(db.String(120)))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(500))
     seeking_venue = db.Column(db.Boolean())
     seeking_description = db.Column(db.String(250))
+    search_vector = db.deferred(db.Column(TSVECTOR))
+    updated_at = db.Column(db.DateTime(), nullable=False,
+                           default=utc_now(), onupdate=utc_now())
+    # bumped by triggers when the shows listed with it change
+    shows_updated_at = db.Column(db.DateTime(), nullable=False, default=utc_now())
     shows = db.relationship('Show', cascade="all, delete",
-                            passive_deletes=True, lazy='joined',
+                            passive_deletes=True, lazy='select',
                             backref='artist')
 
-    @property
-    def upcoming_shows(self):
-        upcoming = []
-        for show in self.shows:
-            if show.start_time > datetime.now():
-                upcoming.append(show)
-        return upcoming
+    @classmethod
+    def listing_statement(cls, state=None, genre=None):
+        query = db.select(cls.id, cls.name)
+        if state:
+            query = query.where(cls.state == state)
+        if genre:
+            query = query.where(cls.genres.contains([genre]))
+        return query
 
-    @property
-    def upcoming_shows_count(self):
-        upcoming_shows_count = len(self.upcoming_shows)
-        return upcoming_shows_count
-
-    @property
-    def past_shows(self):
-        past_shows = []
-        for show in self.shows:
-            if show.start_time < datetime.now():
-                past_shows.append(show)
-        return past_shows
-
-    @property
-    def past_shows_count(self):
-        return len(self.past_shows)
+
+class GenreCount(db.Model):
+    # how many venues/artists of a state list a genre, or under genre ''
+    # how many there are in the state, kept up to date by triggers on both
+    # tables (see the genre_count migration)
+    __tablename__ = 'genre_count'
+
+    kind = db.Column(db.String(20), primary_key=True)
+    genre = db.Column(db.String(120), primary_key=True)
+    state = db.Column(db.String(120), primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+
+    @classmethod
+    def facets(cls, kind, genre=None, state=None):
+        genres, states = cls.facets_statements(kind, genre, state)
+        return cls.facet_results(db.session.execute(genres), db.session.execute(states))
+
+    @classmethod
+    def facets_statements(cls, kind, genre=None, state=None):
+        # each facet is counted within the other one's selection: the genres
+        # of the chosen state, the states of the chosen genre
+        genres = db.select(cls.genre.label('value'), db.func.sum(cls.count).label('count')) \
+            .where(cls.kind == kind, cls.genre != '').group_by(cls.genre).order_by(cls.genre)
+        if state:
+            genres = genres.where(cls.state == state)
+        states = db.select(cls.state.label('value'), db.func.sum(cls.count).label('count')) \
+            .where(cls.kind == kind, cls.genre == (genre or ''), cls.state != '') \
+            .group_by(cls.state).order_by(cls.state)
+        return genres, states
+
+    @staticmethod
+    def facet_results(genre_rows, state_rows):
+        return {'genres': [{'value': row.value, 'count': row.count} for row in genre_rows],
+                'states': [{'value': row.value, 'count': row.count} for row in state_rows]}
 
 
 class Show(db.Model):
+    # partitioned by month of start_time (see `flask shows-partitions`), the
+    # table's primary key is (id, start_time) but id alone is unique
     __tablename__ = 'show'
 
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     start_time = db.Column(db.DateTime(), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('venue.id', ondelete="CASCADE"), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('artist.id', ondelete="CASCADE"), nullable=False)
+    updated_at = db.Column(db.DateTime(), nullable=False,
+                           default=utc_now(), onupdate=utc_now())
+
+    @classmethod
+    def feed(cls, start=None, end=None, after=None, limit=60):
+        rows = db.session.execute(cls.feed_statement(start, end, after, limit)).all()
+        return cls.feed_page(rows, limit)
+
+    @classmethod
+    def feed_statement(cls, start=None, end=None, after=None, limit=60):
+        # one query for the show tiles, keyed on (start_time, id) so every
+        # page is a range scan from the previous page's last row
+        query = db.select(
+            cls.id, cls.start_time, cls.venue_id, cls.artist_id,
+            Venue.name.label('venue_name'),
+            Artist.name.label('artist_name'),
+            Artist.image_link.label('artist_image_link')
+        ).join(Venue, Venue.id == cls.venue_id) \
+         .join(Artist, Artist.id == cls.artist_id)
+        if start is not None:
+            query = query.where(cls.start_time >= start)
+        if end is not None:
+            query = query.where(cls.start_time < end)
+        if after is not None:
+            query = query.where(db.tuple_(cls.start_time, cls.id) > after)
+        return query.order_by(cls.start_time, cls.id).limit(limit + 1)
+
+    @staticmethod
+    def feed_page(rows, limit):
+        # the extra row only tells us whether there is a next page
+        next_after = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_after = (rows[-1].start_time, rows[-1].id)
+        return [dict(row._mapping) for row in rows], next_after
+
+    @classmethod
+    def book(cls, rows, hours=3):
+        # creates the shows of rows (dicts of venue_id, artist_id and
+        # start_time) that neither overlap a booking of their venue or
+        # artist nor an earlier row, each taking `hours`. returns a result
+        # per row, in order
+        results = cls.booking_results(
+            rows, db.session.execute(cls.book_statement(rows, hours)).all())
+        rejected = [n for n, result in enumerate(results) if result['status'] == 'conflict']
+        if rejected:
+            cls.add_conflicts(results, db.session.execute(
+                cls.conflicts_statement([(n, rows[n]) for n in rejected], hours)))
+        return results
+
+    @staticmethod
+    def _batch(numbered_rows, hours):
+        # (n, row) pairs as a VALUES list, with the time each row takes
+        batch = db.values(
+            db.column('n', db.Integer), db.column('venue_id', db.Integer),
+            db.column('artist_id', db.Integer), db.column('start_time', db.DateTime()),
+            name='batch'
+        ).data([(n, row['venue_id'], row['artist_id'], row['start_time'])
+                for n, row in numbered_rows])
+        during = db.func.tsrange(batch.c.start_time, batch.c.start_time + timedelta(hours=hours),
+                                 type_=TSRANGE)
+        return batch, during
+
+    @classmethod
+    def book_statement(cls, rows, hours=3):
+        # one statement for the whole batch: each row gets a show id, the
+        # rows of known venues and artists are booked in order, skipping
+        # those the exclusion constraints of show_booking refuse, and the
+        # booked ones are inserted as shows
+        batch, during = cls._batch(enumerate(rows), hours)
+        numbered = db.select(
+            batch.c.n, db.func.nextval('show_id_seq').label('id'),
+            batch.c.venue_id, batch.c.artist_id, batch.c.start_time,
+            during.label('during'),
+            db.exists().where(Venue.id == batch.c.venue_id).label('known_venue'),
+            db.exists().where(Artist.id == batch.c.artist_id).label('known_artist')
+        ).cte('numbered')
+        booked = insert(ShowBooking).from_select(
+            ['show_id', 'start_time', 'venue_id', 'artist_id', 'during'],
+            db.select(numbered.c.id, numbered.c.start_time, numbered.c.venue_id,
+                      numbered.c.artist_id, numbered.c.during)
+              .where(numbered.c.known_venue, numbered.c.known_artist)
+              .order_by(numbered.c.n)
+        ).on_conflict_do_nothing().returning(ShowBooking.show_id).cte('booked')
+        created = cls.__table__.insert().from_select(
+            ['id', 'start_time', 'venue_id', 'artist_id'],
+            db.select(numbered.c.id, numbered.c.start_time, numbered.c.venue_id,
+                      numbered.c.artist_id)
+              .where(numbered.c.id.in_(db.select(booked.c.show_id)))
+        ).returning(cls.id).cte('created')
+        return db.select(
+            numbered.c.n, numbered.c.id, numbered.c.known_venue, numbered.c.known_artist,
+            created.c.id.isnot(None).label('created')
+        ).outerjoin(created, created.c.id == numbered.c.id).order_by(numbered.c.n)
+
+    @staticmethod
+    def booking_results(rows, booked):
+        # status 'created' (with the show's id), 'unknown_venue',
+        # 'unknown_artist' or 'conflict'
+        results = []
+        for row, result in zip(rows, booked):
+            entry = {'venue_id': row['venue_id'], 'artist_id': row['artist_id'],
+                     'start_time': row['start_time']}
+            if result.created:
+                entry.update(status='created', show_id=result.id)
+            elif not result.known_venue:
+                entry['status'] = 'unknown_venue'
+            elif not result.known_artist:
+                entry['status'] = 'unknown_artist'
+            else:
+                entry.update(status='conflict', conflicts=[])
+            results.append(entry)
+        return results
+
+    @classmethod
+    def conflicts_statement(cls, numbered_rows, hours=3):
+        # the bookings in the way of each refused row, of its venue or its
+        # artist, including those of earlier rows of the same batch
+        batch, during = cls._batch(numbered_rows, hours)
+        return db.select(
+            batch.c.n, ShowBooking.show_id, ShowBooking.start_time,
+            (ShowBooking.venue_id == batch.c.venue_id).label('venue'),
+            (ShowBooking.artist_id == batch.c.artist_id).label('artist')
+        ).join(ShowBooking, db.and_(
+            db.or_(ShowBooking.venue_id == batch.c.venue_id,
+                   ShowBooking.artist_id == batch.c.artist_id),
+            ShowBooking.during.overlaps(during))
+        ).order_by(batch.c.n, ShowBooking.start_time)
+
+    @staticmethod
+    def add_conflicts(results, rows):
+        for row in rows:
+            results[row.n]['conflicts'].append({
+                'show_id': row.show_id, 'start_time': row.start_time,
+                'venue': row.venue, 'artist': row.artist})
+
+
+class ShowBooking(db.Model):
+    # the time each show takes its venue and artist. the exclusion
+    # constraints refuse a booking that overlaps one of the same venue or
+    # artist; they can't go on show, whose partitions only take constraints
+    # that include start_time with =. see Show.book()
+    __tablename__ = 'show_booking'
+    __table_args__ = (
+        db.ForeignKeyConstraint(['show_id', 'start_time'], ['show.id', 'show.start_time'],
+                                ondelete='CASCADE', deferrable=True, initially='DEFERRED'),
+        ExcludeConstraint(('venue_id', '='), ('during', '&&'),
+                          name='show_booking_venue_overlap', using='gist'),
+        ExcludeConstraint(('artist_id', '='), ('during', '&&'),
+                          name='show_booking_artist_overlap', using='gist'),
+    )
+
+    show_id = db.Column(db.Integer, primary_key=True)
+    start_time = db.Column(db.DateTime(), nullable=False)
+    venue_id = db.Column(db.Integer, nullable=False)
+    artist_id = db.Column(db.Integer, nullable=False)
+    during = db.Column(TSRANGE, nullable=False)
+
+    @classmethod
+    def book_listed_statement(cls, since, hours=3):
+        # bookings for the shows from `since` on that were inserted without
+        # one (bulk loads), the first listed winning where two overlap
+        during = db.func.tsrange(Show.start_time, Show.start_time + timedelta(hours=hours),
+                                 type_=TSRANGE)
+        return insert(cls).from_select(
+            ['show_id', 'start_time', 'venue_id', 'artist_id', 'during'],
+            db.select(Show.id, Show.start_time, Show.venue_id, Show.artist_id, during)
+              .where(Show.start_time >= since).order_by(Show.start_time, Show.id)
+        ).on_conflict_do_nothing()
+
+
+class ShowArchive(db.Model):
+    # shows of the partitions past the archive cutoff, packed per venue and
+    # month into parallel arrays; the past show lists read them from here
+    __tablename__ = 'show_archive'
+
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id', ondelete="CASCADE"), primary_key=True)
+    month = db.Column(db.Date(), primary_key=True)
+    show_ids = db.Column(ARRAY(db.Integer), nullable=False)
+    artist_ids = db.Column(ARRAY(db.Integer), nullable=False)
+    start_times = db.Column(ARRAY(db.DateTime()), nullable=False)
+    show_count = db.Column(db.Integer, nullable=False)
+
+    @classmethod
+    def _of(cls, show_key, id):
+        # a venue's archive rows by primary key, an artist's through the GIN
+        # index on artist_ids
+        if show_key == 'venue_id':
+            return cls.venue_id == id
+        return cls.artist_ids.contains(array([id]))
+
+    @classmethod
+    def unnested_statement(cls):
+        # the archived shows, one row each with the columns of Show
+        shows = db.func.unnest(cls.show_ids, cls.artist_ids, cls.start_times).table_valued(
+            db.column('id', db.Integer), db.column('artist_id', db.Integer),
+            db.column('start_time', db.DateTime())).render_derived(name='archived')
+        return db.select(shows.c.id, cls.venue_id, shows.c.artist_id, shows.c.start_time) \
+            .select_from(cls).join(shows, db.true())
+
+    @classmethod
+    def shows_statement(cls, show_key, id):
+        # a venue's or artist's archived shows
+        query = cls.unnested_statement().where(cls._of(show_key, id))
+        if show_key == 'artist_id':
+            query = query.where(query.selected_columns.artist_id == id)
+        return query
+
+    @classmethod
+    def count_statement(cls, show_key, id):
+        if show_key == 'venue_id':
+            count = db.func.sum(cls.show_count)
+        else:
+            count = db.func.sum(db.func.cardinality(db.func.array_positions(cls.artist_ids, id)))
+        return db.select(db.func.coalesce(count, 0)).where(cls._of(show_key, id))
@@ -0,0 +1,197 @@
+import cProfile
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import g, request
+from itsdangerous import BadSignature, TimestampSigner
+
+PROFILE_HEADER = 'X-Profile'
+
+
+def frame_name(code):
+    # "function (path:first line)", the path relative to the sys.path entry
+    # it was imported from, so the name is the same in every deployment
+    path = code.co_filename
+    for root in sorted(sys.path, key=len, reverse=True):
+        if root and path.startswith(root + os.sep):
+            path = path[len(root) + 1:]
+            break
+    return '{} ({}:{})'.format(code.co_name, path, code.co_firstlineno)
+
+
+class StackSampler(object):
+    # a statistical profiler: while a profiled request is being handled, one
+    # thread per process looks at its stack every `interval` seconds and
+    # counts it, collapsed to "outer;...;inner", under the request's
+    # endpoint. the request itself runs untouched; with nothing to profile
+    # the thread waits on an event
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.active = {}
+        self.stacks = defaultdict(Counter)
+        self._names = {}
+        self._wakeup = threading.Event()
+        self._pid = None
+
+    def start(self, endpoint):
+        if self._pid != os.getpid():
+            # after a fork the parent's thread is gone
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='stack-sampler', daemon=True).start()
+        self.active[threading.get_ident()] = endpoint
+        self._wakeup.set()
+
+    def stop(self):
+        self.active.pop(threading.get_ident(), None)
+
+    def _name(self, code):
+        name = self._names.get(code)
+        if name is None:
+            name = self._names[code] = frame_name(code)
+        return name
+
+    def _run(self):
+        while True:
+            if not self.active:
+                self._wakeup.clear()
+                if not self.active:
+                    self._wakeup.wait()
+                continue
+            frames = sys._current_frames()
+            for ident, endpoint in list(self.active.items()):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    stack.append(self._name(frame.f_code))
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[endpoint][';'.join(reversed(stack))] += 1
+            del frames
+            time.sleep(self.interval)
+
+    def collapsed(self, endpoint=None):
+        # flamegraph.pl / speedscope input: a stack and its sample count per
+        # line, the endpoint as the root frame
+        lines = []
+        for name, stacks in sorted(self.stacks.items()):
+            if endpoint is None or name == endpoint:
+                lines.extend('{};{} {}'.format(name, stack, count)
+                             for stack, count in sorted(stacks.items()))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        self.stacks = defaultdict(Counter)
+
+
+class RequestProfiler(object):
+    # opt-in profiling of live requests. with PROFILE_ENABLED off nothing is
+    # hooked into the app at all. otherwise a request is profiled when it
+    # carries a valid X-Profile token (`flask profile-token`), or with
+    # probability PROFILE_SAMPLE_RATE if its endpoint is in PROFILE_ENDPOINTS
+    # (or that is empty). PROFILE_MODE 'sample' counts stacks with the
+    # StackSampler, dumped as collapsed stacks; 'cprofile' runs cProfile in
+    # the request, much slower but exact, dumped as a pstats file. either is
+    # kept per endpoint in each worker until dumped with ?reset=1
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.sampler = None
+        self.stats = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PROFILE_ENABLED', False)
+        if not self.enabled:
+            return
+        self.app = app
+        self.mode = app.config.get('PROFILE_MODE', 'sample')
+        self.rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+        self.endpoints = set(app.config.get('PROFILE_ENDPOINTS') or ())
+        self.sampler = StackSampler(app.config.get('PROFILE_INTERVAL_MS', 5) / 1000.0)
+        app.before_request(self._start)
+        app.teardown_request(self._finish)
+
+    @staticmethod
+    def signer(app):
+        return TimestampSigner(app.secret_key, salt='fyyur-profile')
+
+    def token(self, app):
+        return self.signer(app).sign(b'profile').decode('ascii')
+
+    def authorized(self):
+        # a request carrying a token signed with SECRET_KEY in the last
+        # PROFILE_TOKEN_MAX_AGE seconds
+        token = request.headers.get(PROFILE_HEADER)
+        if not token:
+            return False
+        try:
+            self.signer(self.app).unsign(token, max_age=self.app.config.get(
+                'PROFILE_TOKEN_MAX_AGE', 3600))
+        except BadSignature:
+            return False
+        return True
+
+    def _selected(self):
+        if self.authorized():
+            return True
+        if self.endpoints and request.endpoint not in self.endpoints:
+            return False
+        return self.rate > 0 and random.random() < self.rate
+
+    def _start(self):
+        if request.endpoint == 'main.profile_dump' or not self._selected():
+            return
+        endpoint = request.endpoint or 'unmatched'
+        if self.mode == 'cprofile':
+            profile = cProfile.Profile()
+            g.profile = (endpoint, profile)
+            profile.enable()
+        else:
+            g.profile = (endpoint, None)
+            self.sampler.start(endpoint)
+
+    def _finish(self, exc):
+        endpoint, profile = g.pop('profile', (None, None))
+        if endpoint is None:
+            return
+        if profile is None:
+            self.sampler.stop()
+            return
+        profile.disable()
+        with self._lock:
+            if endpoint in self.stats:
+                self.stats[endpoint].add(profile)
+            else:
+                self.stats[endpoint] = pstats.Stats(profile)
+
+    def collapsed(self, endpoint=None):
+        return self.sampler.collapsed(endpoint)
+
+    def pstats_file(self, endpoint=None):
+        # the bytes of a pstats dump (`python -m pstats file`, snakeviz),
+        # of one endpoint or all of them merged
+        with self._lock:
+            selected = [stats for name, stats in self.stats.items()
+                        if endpoint is None or name == endpoint]
+            if not selected:
+                return None
+            merged = pstats.Stats()
+            merged.add(*selected)
+            return marshal.dumps(merged.stats)
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+        self.sampler.reset()
+
+
+request_profiler = RequestProfiler()
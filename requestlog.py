@@ -0,0 +1,251 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import (QueueHandler, QueueListener, RotatingFileHandler,
+                              TimedRotatingFileHandler)
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# ids passed on by a proxy are kept if they look like one
+_REQUEST_ID = re.compile(r'^[\w.:-]{1,128}$')
+
+
+class JSONFormatter(logging.Formatter):
+    # one JSON object per line: time, level, logger, message, the request id
+    # of the request it was logged in, the record's `fields` and the
+    # traceback if any
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc)
+                            .isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, default=str)
+
+
+class BatchingQueueListener(QueueListener):
+    # takes whatever is waiting in the queue, up to batch_size records, and
+    # hands it to the handler as one record of JSON lines: under load that
+    # is one write, flush and rotation check per batch instead of per record
+
+    def __init__(self, queue, handler, batch_size=500):
+        QueueListener.__init__(self, queue, handler)
+        self.batch_size = batch_size
+        self.formatter = JSONFormatter()
+        self._stopping = False
+
+    def dequeue(self, block):
+        if self._stopping:
+            return self._sentinel
+        batch = [self.queue.get(block)]
+        if batch[0] is self._sentinel:
+            return self._sentinel
+        while len(batch) < self.batch_size:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is self._sentinel:
+                self._stopping = True
+                break
+            batch.append(record)
+        return batch
+
+    def handle(self, batch):
+        lines = '\n'.join(self.formatter.format(record) for record in batch)
+        record = logging.makeLogRecord({'msg': lines, 'levelno': batch[-1].levelno,
+                                        'levelname': batch[-1].levelname})
+        for handler in self.handlers:
+            handler.handle(record)
+
+
+class DroppingQueueHandler(QueueHandler):
+    # hands records to a BatchingQueueListener thread that writes them,
+    # so a slow disk never holds up the thread that logged. the queue takes
+    # queue_size records; past that they are dropped and counted in
+    # `dropped`. each process starts its own queue and listener when it
+    # first logs, as the parent's thread does not survive a fork
+
+    def __init__(self, make_handler, queue_size=10000):
+        QueueHandler.__init__(self, None)
+        self.make_handler = make_handler
+        self.queue_size = queue_size
+        self.listener = None
+        self.dropped = 0
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._drop_lock = threading.Lock()
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(self.queue_size)
+            self.listener = BatchingQueueListener(self.queue, self.make_handler())
+            self.listener.start()
+            atexit.register(self.stop)
+            self._pid = os.getpid()
+
+    def stop(self):
+        # writes out what is queued; records logged after this are dropped
+        listener, self.listener = self.listener, None
+        if listener is None:
+            return
+        try:
+            listener.stop()
+        except queue.Full:
+            pass
+        for handler in listener.handlers:
+            handler.close()
+
+    def prepare(self, record):
+        # what has to be done in the logging thread: the message and
+        # traceback become text, as the arguments may change or be gone by
+        # the time the listener gets to them, and the request id is only
+        # known here
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if has_request_context():
+            record.request_id = g.get('request_id')
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._drop_lock:
+                self.dropped += 1
+
+
+class RequestLog(object):
+    # JSON-lines logging for the app: app.logger and an access record per
+    # request on the 'fyyur.access' logger, with its request id, endpoint,
+    # status, latency and the count and time of its SQL statements. the
+    # request id is the X-Request-ID header a proxy sent, or a new one, and
+    # is sent back in the response. records go through a
+    # DroppingQueueHandler to LOG_FILE (stderr when empty), rotated at
+    # LOG_MAX_BYTES or every LOG_ROTATE_WHEN ('midnight', 'H', ...)
+
+    def __init__(self, app=None):
+        self.handler = None
+        self.access_enabled = False
+        self.access_logger = logging.getLogger('fyyur.access')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.access_enabled = config.get('LOG_ACCESS', True)
+
+        def make_handler():
+            path = config.get('LOG_FILE', '').format(pid=os.getpid())
+            if not path:
+                handler = logging.StreamHandler(sys.stderr)
+            elif config.get('LOG_ROTATE_WHEN'):
+                handler = TimedRotatingFileHandler(
+                    path, when=config['LOG_ROTATE_WHEN'], utc=True,
+                    backupCount=config.get('LOG_BACKUP_COUNT', 5))
+            else:
+                handler = RotatingFileHandler(
+                    path, maxBytes=config.get('LOG_MAX_BYTES', 0),
+                    backupCount=config.get('LOG_BACKUP_COUNT', 5))
+            # the listener has made the lines already
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            return handler
+
+        # every app made by create_app() logs to the same loggers, through
+        # the handler of the latest one
+        previous = self.handler
+        self.handler = DroppingQueueHandler(make_handler, config.get('LOG_QUEUE_SIZE', 10000))
+        level = config.get('LOG_LEVEL', 'INFO')
+        app.logger.removeHandler(default_handler)
+        for logger in (app.logger, self.access_logger):
+            logger.removeHandler(previous)
+            logger.addHandler(self.handler)
+            logger.setLevel(level)
+            logger.propagate = False
+        if previous is not None:
+            previous.stop()
+        app.before_request(self._start)
+        app.after_request(self._response)
+        app.teardown_request(self._finish)
+
+    @property
+    def dropped(self):
+        return self.handler.dropped if self.handler is not None else 0
+
+    @staticmethod
+    def request_id(headers):
+        # the proxy's request id, or a new one
+        request_id = headers.get(REQUEST_ID_HEADER)
+        if not request_id or not _REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        return request_id
+
+    def access(self, method, path, endpoint, status, duration, stats):
+        # the access record of a finished request, stats being its
+        # sqlstats.StatementStats or None
+        if not self.access_enabled:
+            return
+        fields = {
+            'method': method,
+            'path': path,
+            'endpoint': endpoint,
+            'status': status,
+            'latency_ms': round(duration * 1000, 3),
+        }
+        if stats is not None:
+            fields['sql_statements'] = stats.count
+            fields['db_ms'] = round(stats.duration * 1000, 3)
+        self.access_logger.info('%s %s %s', method, path, status, extra={'fields': fields})
+
+    def _start(self):
+        store = g._get_current_object()
+        store.request_id = self.request_id(request.headers)
+        store.request_log_started = time.perf_counter()
+
+    def _response(self, response):
+        store = g._get_current_object()
+        response.headers[REQUEST_ID_HEADER] = store.request_id
+        store.request_log_status = response.status_code
+        return response
+
+    def _finish(self, exc):
+        store = g._get_current_object()
+        started = store.__dict__.pop('request_log_started', None)
+        if started is None:
+            return
+        self.access(request.method, request.path, request.endpoint,
+                    getattr(store, 'request_log_status', 500),
+                    time.perf_counter() - started, getattr(store, 'sql_stats', None))
+
+
+request_log = RequestLog()
@@ -0,0 +1,210 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+import json
+from datetime import datetime
+from flask import (Blueprint, current_app, render_template, request, flash,
+                   Response, g)
+from models import db, Venue, Artist, Show
+from cache import response_cache
+from views import (request_now, stream_rows, parse_date, parse_cursor,
+                   format_cursor, json_default)
+
+#the forms (WTForms) are imported by the views that use them, so they are
+#not loaded until a form is shown or submitted
+blueprint = Blueprint('shows', __name__)
+
+#----------------------------------------------------------------------------#
+# Booking.
+#----------------------------------------------------------------------------#
+
+def show_row(artist_id, venue_id, start_time):
+    # (row for Show.book(), None) or (None, what is wrong with it)
+    try:
+        if not isinstance(start_time, datetime):
+            start_time = parse_date(str(start_time).strip())
+        return {'artist_id': int(artist_id), 'venue_id': int(venue_id),
+                'start_time': start_time}, None
+    except (TypeError, ValueError):
+        return None, 'expected an artist id, a venue id and a YYYY-MM-DD HH:MM start time'
+
+def show_lines(text, artist_id):
+    # the lines of the batch form, blank ones skipped
+    entries = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        fields = [field.strip() for field in line.split(',')]
+        if len(fields) == 2 and artist_id:
+            fields.insert(0, artist_id)
+        if len(fields) != 3:
+            entries.append((None, 'expected "venue_id, start_time" with an artist id given, '
+                                  'or "artist_id, venue_id, start_time"'))
+            continue
+        entries.append(show_row(*fields))
+    return entries
+
+def book_shows(entries):
+    # books the entries that parsed in one transaction and returns a
+    # result per entry, in order, numbered from 1
+    rows = [row for row, error in entries if error is None]
+    booked = iter(Show.book(rows, current_app.config['SHOW_BOOKING_HOURS']) if rows else ())
+    results = []
+    for number, (row, error) in enumerate(entries, 1):
+        result = next(booked) if error is None else {'status': 'invalid', 'error': error}
+        result['row'] = number
+        results.append(result)
+    db.session.commit()
+    if any(result['status'] == 'created' for result in results):
+        #the booking is one Core statement, no flush marks it as a write:
+        #the booker's next pages read from the primary all the same
+        g.db_wrote = True
+        response_cache.invalidate('shows')
+    return results
+
+def booking_summary(results):
+    return {status: sum(result['status'] == status for result in results)
+            for status in ('created', 'conflict', 'unknown_venue', 'unknown_artist', 'invalid')}
+
+def error_response(message, status):
+    return Response(json.dumps({'error': message}), status=status,
+                    mimetype='application/json')
+
+#----------------------------------------------------------------------------#
+# Controllers.
+#----------------------------------------------------------------------------#
+
+@blueprint.route('/shows')
+@response_cache.cached('venues', 'artists', 'shows')
+def shows():
+    #only upcoming shows unless a window (?from=/?to=) or ?all=1 is given
+    start = request.args.get('from', type=parse_date)
+    end = request.args.get('to', type=parse_date)
+    if start is None and not request.args.get('all'):
+        start = request_now()
+    after = request.args.get('after', type=parse_cursor)
+
+    data, next_after = Show.feed(start=start, end=end, after=after,
+                                 limit=current_app.config['SHOWS_PER_PAGE'])
+
+    #carry the filters over to the next page link
+    filters = {key: request.args[key] for key in ('from', 'to', 'all')
+               if key in request.args}
+    next_cursor = format_cursor(next_after) if next_after else None
+
+    return render_template('pages/shows.html', shows=data,
+                           next_cursor=next_cursor, filters=filters)
+
+@blueprint.route('/api/shows')
+def api_shows():
+    #the fields of the dicts built by shows(), filtered by ?from=, ?to=,
+    #?venue_id= and ?artist_id=
+    query = db.session.query(
+        Show.id, Show.venue_id, Show.artist_id,
+        Venue.name.label('venue_name'),
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.start_time
+    ).join(Venue, Venue.id == Show.venue_id) \
+     .join(Artist, Artist.id == Show.artist_id)
+    start = request.args.get('from', type=parse_date)
+    end = request.args.get('to', type=parse_date)
+    if start is not None:
+        query = query.filter(Show.start_time >= start)
+    if end is not None:
+        query = query.filter(Show.start_time < end)
+    for key, column in (('venue_id', Show.venue_id), ('artist_id', Show.artist_id)):
+        if request.args.get(key, type=int) is not None:
+            query = query.filter(column == request.args.get(key, type=int))
+    return stream_rows(query.order_by(Show.start_time, Show.id))
+
+@blueprint.route('/api/shows', methods=['POST'])
+def api_create_shows():
+    #a JSON list of {artist_id, venue_id, start_time}, booked in one
+    #transaction: a result per show with its status, 'created' with the
+    #show_id, or 'conflict' with the shows in the way
+    shows = request.get_json(silent=True)
+    if isinstance(shows, dict):
+        shows = shows.get('shows')
+    if not isinstance(shows, list) or not shows:
+        return error_response('expected a JSON list of shows', 400)
+    if len(shows) > current_app.config['SHOW_BATCH_MAX']:
+        return error_response('at most {} shows at once'.format(
+            current_app.config['SHOW_BATCH_MAX']), 413)
+    entries = [show_row(show.get('artist_id'), show.get('venue_id'), show.get('start_time'))
+               if isinstance(show, dict) else (None, 'expected an object')
+               for show in shows]
+    try:
+        results = book_shows(entries)
+    except:
+        db.session.rollback()
+        current_app.logger.exception('Shows could not be listed')
+        return error_response("shows weren't listed", 500)
+    finally:
+        db.session.close()
+    return Response(json.dumps({'summary': booking_summary(results), 'results': results},
+                               default=json_default),
+                    mimetype='application/json')
+
+@blueprint.route('/shows/create')
+def create_shows():
+    from forms import ShowForm
+    # renders form. do not touch.
+    form = ShowForm()
+    return render_template('forms/new_show.html', form=form)
+
+@blueprint.route('/shows/create', methods=['POST'])
+def create_show_submission():
+    from forms import ShowForm
+    # called to create new shows in the db, upon submitting new show listing form
+    form = ShowForm(request.form)
+    try:
+        #the field wants seconds, the placeholder says YYYY-MM-DD HH:MM
+        start_time = form.start_time.data or request.form.get('start_time')
+        result, = book_shows([show_row(form.artist_id.data, form.venue_id.data, start_time)])
+        if result['status'] == 'created':
+            flash('Show was successfully listed!')
+        elif result['status'] == 'conflict':
+            booked = [kind for kind in ('venue', 'artist')
+                      if any(conflict[kind] for conflict in result['conflicts'])]
+            flash("Show wasn't listed, the {} {} booked then!".format(
+                ' and the '.join(booked), 'are' if len(booked) > 1 else 'is'))
+        else:
+            flash("Show wasn't successfully listed!")
+    except:
+        db.session.rollback()
+        flash("Show wasn't successfully listed!")
+        current_app.logger.exception('Show could not be listed')
+    finally:
+        db.session.close()
+    return render_template('pages/home.html')
+
+@blueprint.route('/shows/batch')
+def create_shows_batch():
+    from forms import ShowBatchForm
+    form = ShowBatchForm()
+    return render_template('forms/new_shows.html', form=form)
+
+@blueprint.route('/shows/batch', methods=['POST'])
+def create_shows_batch_submission():
+    from forms import ShowBatchForm
+    # a whole tour at once, with what became of each line
+    form = ShowBatchForm(request.form)
+    entries = show_lines(form.shows.data or '', (form.artist_id.data or '').strip())
+    if not entries:
+        flash('No shows to list!')
+        return render_template('forms/new_shows.html', form=form)
+    if len(entries) > current_app.config['SHOW_BATCH_MAX']:
+        flash('At most {} shows at once!'.format(current_app.config['SHOW_BATCH_MAX']))
+        return render_template('forms/new_shows.html', form=form)
+    results = None
+    try:
+        results = book_shows(entries)
+    except:
+        db.session.rollback()
+        flash("Shows weren't successfully listed!")
+        current_app.logger.exception('Shows could not be listed')
+    finally:
+        db.session.close()
+    return render_template('forms/new_shows.html', form=form, results=results,
+                           summary=booking_summary(results) if results else None)
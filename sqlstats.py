@@ -0,0 +1,205 @@
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# literals and bound parameters, so statements that only differ in them
+# have the same shape
+_LITERALS = re.compile(r"'(?:[^']|'')*'|%\(\w+\)s|%s|\$\d+|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+def statement_shape(statement):
+    # the same query in a loop, or a lazy load per row, repeats one shape
+    # with different ids: the N+1 pattern
+    shape = _LISTS.sub('(?)', _LITERALS.sub('?', statement))
+    return ' '.join(shape.split())
+
+
+def _rows(cursor):
+    # rowcount is the size of the result for a buffered SELECT; rows
+    # streamed through a server-side cursor are not known here
+    if cursor.description is not None and cursor.rowcount > 0:
+        return cursor.rowcount
+    return 0
+
+
+class QueryCounter(object):
+    # records every statement run on an engine while active, and how many
+    # rows the SELECTs among them returned
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self.rows = 0
+
+    def __enter__(self):
+        event.listen(self.engine, 'after_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'after_cursor_execute', self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def repeated(self, threshold):
+        # {shape: times} of the statements run at least threshold times
+        shapes = Counter(statement_shape(statement) for statement in self.statements)
+        return {shape: times for shape, times in shapes.items() if times >= threshold}
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+        self.rows += _rows(cursor)
+
+
+@contextmanager
+def assert_queries(engine, statements=None, rows=None, repeats=None):
+    # fails if the block runs more than `statements` statements, fetches
+    # more than `rows` rows or runs any statement shape `repeats` times, e.g.
+    #
+    #     with app.app_context(), assert_queries(db.engine, statements=3):
+    #         client.get('/venues/1')
+    counter = QueryCounter(engine)
+    with counter:
+        yield counter
+    if statements is not None and counter.count > statements:
+        raise AssertionError('{} statements run, expected at most {}:\n{}'.format(
+            counter.count, statements, '\n\n'.join(counter.statements)))
+    if rows is not None and counter.rows > rows:
+        raise AssertionError('{} rows fetched, expected at most {}'.format(
+            counter.rows, rows))
+    if repeats is not None and counter.repeated(repeats):
+        raise AssertionError('statements repeated:\n{}'.format('\n\n'.join(
+            '{}x {}'.format(times, shape) for shape, times in counter.repeated(repeats).items())))
+
+
+# the StatementStats of a request served outside Flask (asgi.py's pages)
+request_statement_stats = ContextVar('request_statement_stats', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class StatementStats(object):
+    # what the statements of one request cost
+
+    def __init__(self, endpoint=None, budget=None, repeat_threshold=None, strict=False):
+        self.endpoint = endpoint
+        self.budget = budget
+        self.repeat_threshold = repeat_threshold
+        self.strict = strict
+        self.count = 0
+        self.duration = 0.0
+        self.rows = 0
+        self.shapes = Counter()
+
+    def record(self, statement, duration, rows):
+        self.count += 1
+        self.duration += duration
+        self.rows += rows
+        shape = statement_shape(statement)
+        self.shapes[shape] += 1
+        if not self.strict:
+            return
+        # raised from the statement that went over, so the traceback shows
+        # the code that ran it
+        if self.budget is not None and self.count > self.budget:
+            raise QueryBudgetExceeded('{} ran more than its budget of {} statements: {}'.format(
+                self.endpoint, self.budget, statement))
+        if self.repeat_threshold and self.shapes[shape] == self.repeat_threshold:
+            raise QueryBudgetExceeded('{} ran the same statement {} times: {}'.format(
+                self.endpoint, self.repeat_threshold, shape))
+
+    @classmethod
+    def for_endpoint(cls, endpoint, config):
+        budgets = config.get('SQL_QUERY_BUDGETS', {})
+        return cls(endpoint=endpoint,
+                   budget=budgets.get(endpoint, config.get('SQL_DEFAULT_QUERY_BUDGET')),
+                   repeat_threshold=config.get('SQL_REPEAT_THRESHOLD'),
+                   strict=config.get('SQL_STRICT', False))
+
+    def repeated(self):
+        if not self.repeat_threshold:
+            return {}
+        return {shape: times for shape, times in self.shapes.items()
+                if times >= self.repeat_threshold}
+
+    def report(self, response, config, logger):
+        # the headers and warnings of the finished request
+        if config.get('SQL_STATS_HEADERS'):
+            response.headers['X-SQL-Statements'] = str(self.count)
+            response.headers['X-SQL-Time-Ms'] = '{:.2f}'.format(self.duration * 1000)
+            response.headers['X-SQL-Rows'] = str(self.rows)
+            response.headers.add('Server-Timing', 'db;dur={:.2f};desc="{} statements"'.format(
+                self.duration * 1000, self.count))
+        for shape, times in self.repeated().items():
+            logger.warning('%s ran a statement %d times (N+1?): %s',
+                           self.endpoint, times, shape)
+        if self.budget is not None and self.count > self.budget:
+            logger.warning('%s ran %d statements, its budget is %d',
+                           self.endpoint, self.count, self.budget)
+
+
+class RequestSQLStats(object):
+    # counts the statements, database time and rows of every request, on
+    # every engine (the replica's too), in g.sql_stats. they go out as
+    # X-SQL-* and Server-Timing headers with SQL_STATS_HEADERS, and a
+    # request that repeats a statement shape SQL_REPEAT_THRESHOLD times or
+    # runs more statements than its endpoint's budget in SQL_QUERY_BUDGETS
+    # is logged, or fails right there with SQL_STRICT. statements of a
+    # streamed response body run after the headers went out and are not in them
+
+    def __init__(self, app=None):
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_execute)
+            self._listening = True
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    @staticmethod
+    def current():
+        # this request's StatementStats, None outside requests
+        if not has_request_context():
+            return request_statement_stats.get()
+        return g.get('sql_stats')
+
+    @staticmethod
+    def _start():
+        # the settings of the app serving the request: every app made by
+        # create_app() shares this instance
+        g.sql_stats = StatementStats.for_endpoint(request.endpoint, current_app.config)
+
+    @staticmethod
+    def _finish(response):
+        stats = g.get('sql_stats')
+        if stats is not None:
+            stats.report(response, current_app.config, current_app.logger)
+        return response
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._sql_stats_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self.current()
+        started = getattr(context, '_sql_stats_started', None)
+        if stats is not None and started is not None:
+            stats.record(statement, time.perf_counter() - started, _rows(cursor))
+
+
+request_sql_stats = RequestSQLStats()
@@ -2,3 +2,24 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// fill the navbar search datalists from /api/search/suggest as the user types
+document.addEventListener('input', function(event) {
+  var input = event.target;
+  var kind = input.getAttribute('data-suggest-kind');
+  if (!kind) return;
+  var query = input.value;
+  if (query.length < 2) return;
+  fetch('/api/search/suggest?kind=' + kind + '&q=' + encodeURIComponent(query))
+    .then(function(response) { return response.json(); })
+    .then(function(suggestions) {
+      if (input.value !== query) return;
+      var list = document.getElementById(input.getAttribute('list'));
+      list.innerHTML = '';
+      suggestions.forEach(function(suggestion) {
+        var option = document.createElement('option');
+        option.value = suggestion.name;
+        list.appendChild(option);
+      });
+    });
+});
@@ -0,0 +1,255 @@
+import heapq
+import re
+import sys
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+KINDS = ('venue', 'artist')
+
+
+def normalize(text):
+    # lowercase words with accents folded, "Café Rouge" -> ['cafe', 'rouge']
+    text = unicodedata.normalize('NFKD', text or '')
+    text = text.encode('ascii', 'ignore').decode('ascii').lower()
+    return re.findall(r'[a-z0-9]+', text)
+
+
+class SuggestIndex(object):
+    # in-memory autocomplete over venue and artist names.
+    #
+    # every word of a name is an entry in two parallel sequences sorted by
+    # (word, entity): the interned word itself and the entity packed into an
+    # int (id * 2 + kind). a prefix lookup is a bisect to the entries sharing
+    # the prefix, so "note" finds "The Blue Note"; a query of several words
+    # matches the entities found by all of them. the index is per process:
+    # each worker builds its own copy and only sees the writes it handled
+    # itself until it is rebuilt.
+    #
+    # the index is two such parts, both never changed once published so
+    # lookups take no lock: the base, built by load(), and an overlay of the
+    # writes since, which a write copies and replaces. the overlay's codes
+    # hide their entries in the base, a removed name stays in it as None.
+    # once merge_size entities have been written the overlay is merged into
+    # a new base, so only one write in that many copies the whole index.
+    #
+    # the base also keeps every entity ranked by its name, shortest first:
+    # a prefix shared by too many entries to rank them all, like "a", takes
+    # the first names in that order that start with it instead.
+
+    def __init__(self, merge_size=1000, walk_limit=5000):
+        self.merge_size = merge_size
+        self.walk_limit = walk_limit
+        self.ready = False
+        # (base, overlay), replaced as a whole: the base is (words, codes,
+        # names, ranked), the overlay (words, codes, names)
+        self._state = (self._part() + (array('q'),), self._part())
+        # the writes made while a load() is running, None when none is
+        self._pending = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _part(words=(), codes=(), names=()):
+        return list(words), array('q', codes), dict(names)
+
+    @staticmethod
+    def _code(kind, id):
+        return id * 2 + KINDS.index(kind)
+
+    @staticmethod
+    def _entity_words(name):
+        return sorted(set(sys.intern(word) for word in normalize(name)))
+
+    @staticmethod
+    def _rank(item):
+        # the order of names within each tier of suggest(): shorter first,
+        # the same names by entity
+        code, name = item
+        return len(name), name, code
+
+    def load(self, rows):
+        # rows of (kind, id, name); builds a fresh index and swaps it in.
+        # rows read from the database can miss the writes made meanwhile,
+        # those are replayed onto the new index before it goes live
+        with self._lock:
+            self._pending = []
+        try:
+            entries = []
+            names = {}
+            for kind, id, name in rows:
+                code = self._code(kind, id)
+                names[code] = name
+                entries.extend((word, code) for word in self._entity_words(name))
+            entries.sort()
+            words = [word for word, _ in entries]
+            codes = array('q', (code for _, code in entries))
+            del entries
+            ranked = array('q', (code for code, _ in sorted(names.items(), key=self._rank)))
+            with self._lock:
+                overlay = self._part()
+                for code, name in self._pending:
+                    self._apply(overlay, code, name)
+                self._state = ((words, codes, names, ranked), overlay)
+                self.ready = True
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def add(self, kind, id, name):
+        self._write(self._code(kind, id), name)
+
+    def remove(self, kind, id):
+        self._write(self._code(kind, id), None)
+
+    def _write(self, code, name):
+        # copy on write of the overlay only: the change goes into a copy that
+        # replaces it in one assignment, readers keep the state they took
+        with self._lock:
+            base, overlay = self._state
+            overlay = self._part(*overlay)
+            self._apply(overlay, code, name)
+            if len(overlay[2]) >= self.merge_size:
+                base, overlay = self._merge(base, overlay), self._part()
+            self._state = (base, overlay)
+            if self._pending is not None:
+                self._pending.append((code, name))
+
+    @classmethod
+    def _apply(cls, overlay, code, name):
+        # the entity's overlay entries replaced by those of name, in place.
+        # the code stays in names, as None once removed, to hide the base
+        words, codes, names = overlay
+        old_name = names.get(code)
+        if old_name is not None:
+            for word in cls._entity_words(old_name):
+                i = cls._position(words, codes, word, code)
+                if i < len(words) and words[i] == word and codes[i] == code:
+                    del words[i]
+                    del codes[i]
+        names[code] = name
+        if name is None:
+            return
+        for word in cls._entity_words(name):
+            i = cls._position(words, codes, word, code)
+            words.insert(i, word)
+            codes.insert(i, code)
+
+    @classmethod
+    def _merge(cls, base, overlay):
+        # a new base: the base entries the overlay doesn't hide and the
+        # overlay's own, merged in (word, code) order and in rank order
+        words, codes, names, ranked = base
+        overlay_words, overlay_codes, overlay_names = overlay
+        entries = heapq.merge(
+            ((word, code) for word, code in zip(words, codes) if code not in overlay_names),
+            zip(overlay_words, overlay_codes))
+        merged_words, merged_codes = [], array('q')
+        for word, code in entries:
+            merged_words.append(word)
+            merged_codes.append(code)
+        written = sorted(((code, name) for code, name in overlay_names.items()
+                          if name is not None), key=cls._rank)
+        merged_ranked = array('q', (code for code, _ in heapq.merge(
+            ((code, names[code]) for code in ranked if code not in overlay_names),
+            written, key=cls._rank)))
+        names = dict(names)
+        for code, name in overlay_names.items():
+            if name is None:
+                names.pop(code, None)
+            else:
+                names[code] = name
+        return merged_words, merged_codes, names, merged_ranked
+
+    @staticmethod
+    def _position(words, codes, word, code):
+        # bisect on (word, code) across the two parallel sequences
+        lo, hi = 0, len(words)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (words[mid], codes[mid]) < (word, code):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    @staticmethod
+    def _matching(part, word):
+        # the codes of the part's entries whose word starts with word
+        words, codes = part[:2]
+        return codes[bisect_left(words, word):bisect_left(words, word + '\uffff')]
+
+    def suggest(self, query, kind=None, limit=10):
+        words = normalize(query)
+        if not words:
+            return []
+        base, overlay = self._state
+        kind_bit = KINDS.index(kind) if kind in KINDS else None
+        first = query.strip().lower()
+
+        narrowest = min(bisect_left(base[0], word + '\uffff') - bisect_left(base[0], word)
+                        for word in words)
+        matches = None
+        if narrowest > self.walk_limit:
+            matches = self._leading(base, overlay, words, first, kind_bit, limit)
+        if matches is None:
+            matches = self._matches(base, overlay, words, kind_bit)
+
+        # names that start with what was typed first, then shorter names
+        ranked = heapq.nsmallest(limit, matches, key=lambda item: (
+            not item[1].lower().startswith(first),) + self._rank(item))
+        return [{'kind': KINDS[code % 2], 'id': code // 2, 'name': name}
+                for code, name in ranked]
+
+    def _matches(self, base, overlay, words, kind_bit):
+        # (code, name) of the entities with a word starting with each of the
+        # query's words, the words' sets intersected from the smallest on
+        overlay_names = overlay[2]
+        found = sorted(
+            ({code for code in self._matching(base, word) if code not in overlay_names}
+             | set(self._matching(overlay, word)) for word in set(words)), key=len)
+        return [(code, overlay_names[code] if code in overlay_names else base[2][code])
+                for code in found[0].intersection(*found[1:])
+                if kind_bit is None or code % 2 == kind_bit]
+
+    def _leading(self, base, overlay, words, first, kind_bit, limit):
+        # the first limit names in rank order that start with the query, and
+        # the overlay's that do: no name further down can rank above them.
+        # None when the first walk_limit names hold fewer than limit of them
+        names, ranked = base[2], base[3]
+        overlay_names = overlay[2]
+
+        def leads(code, name):
+            return ((kind_bit is None or code % 2 == kind_bit)
+                    and name.lower().startswith(first)
+                    and all(any(w.startswith(word) for w in normalize(name))
+                            for word in words))
+
+        found = []
+        for code in ranked[:self.walk_limit]:
+            if code not in overlay_names and leads(code, names[code]):
+                found.append((code, names[code]))
+                if len(found) == limit:
+                    break
+        else:
+            return None
+        found.extend((code, name) for code, name in overlay_names.items()
+                     if name is not None and leads(code, name))
+        return found
+
+    def stats(self):
+        (words, codes, names, ranked), (overlay_words, overlay_codes, overlay_names) = self._state
+        size = sum(sys.getsizeof(part) for part in (
+            words, codes, names, ranked, overlay_words, overlay_codes, overlay_names))
+        # words are interned, each distinct one is stored once
+        size += sum(sys.getsizeof(word) for word in set(words) | set(overlay_words))
+        size += sum(sys.getsizeof(code) + sys.getsizeof(name)
+                    for part in (names, overlay_names) for code, name in part.items())
+        entries = len(names) - sum(code in names for code in overlay_names) \
+            + sum(name is not None for name in overlay_names.values())
+        return {'ready': self.ready, 'entries': entries,
+                'keys': len(words) + len(overlay_words), 'writes': len(overlay_names),
+                'bytes': size}
+
+
+suggest_index = SuggestIndex()
@@ -0,0 +1,67 @@
+"""Fixtures of the test suite.
+
+    TEST_DATABASE_URL=postgresql://localhost/fyyur_test python -m pytest -q
+
+The tests that need Postgres run against TEST_DATABASE_URL, a scratch
+database with the migrations applied (`flask db upgrade`) whose catalog
+tables they empty and fill with datagen.py's synthetic rows. Without it
+they are skipped and only the tests that need no database run.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+# the test profile: query budgets enforced (SQL_STRICT), no page cache
+os.environ.setdefault('FYYUR_ENV', 'test')
+
+DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+
+
+@pytest.fixture(scope='session')
+def app():
+    if not DATABASE_URL:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    from app import create_app
+    app = create_app()
+    app.config.update(SQLALCHEMY_DATABASE_URI=DATABASE_URL, TESTING=True)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def db(app):
+    # the app's db inside an app context, as the routes see it
+    from models import db
+    with app.app_context():
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture(scope='module')
+def catalog(app):
+    # a small synthetic catalog, and the busiest venue and artist in it
+    from datagen import generate
+    from models import db, Show, Venue
+    with app.app_context():
+        generate(2000, seed=0, echo=lambda *args: None)
+        venue_id, artist_id = (db.session.execute(
+            db.select(column).group_by(column)
+              .order_by(db.func.count().desc(), column).limit(1)).scalar()
+            for column in (Show.venue_id, Show.artist_id))
+        venue = db.session.get(Venue, venue_id)
+        ids = {'venue_id': venue_id, 'artist_id': artist_id,
+               'word': venue.name.split()[0].lower()}
+        db.session.remove()
+    # the suggest index loaded now, rather than by the first request, whose
+    # statements its background load would add to
+    from views import load_suggest_index
+    load_suggest_index(app)
+    return ids
@@ -0,0 +1,52 @@
+"""Archived shows still count, and are exported, as past shows."""
+import gzip
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def archived(app, catalog):
+    # the shows of the oldest month packed into show_archive
+    from commands import show_partitions, add_months
+    from models import db, ShowArchive
+    with app.app_context():
+        name, month = show_partitions(db.session.connection())[0]
+        db.session.execute(db.text('SELECT fyyur_archive_shows(:source, :before)'),
+                           {'source': name, 'before': add_months(month, 1)})
+        db.session.commit()
+        count = db.session.execute(db.select(db.func.sum(ShowArchive.show_count))).scalar()
+        db.session.remove()
+    assert count
+    return count
+
+
+def test_past_shows_count_expression(db, archived):
+    from models import Artist, ShowArchive, Venue
+    # a venue and an artist with archived shows
+    venue_id, artist_ids = db.session.execute(
+        db.select(ShowArchive.venue_id, ShowArchive.artist_ids).limit(1)).one()
+    now = datetime.now()
+    for model, id in ((Venue, venue_id), (Artist, artist_ids[0])):
+        entity = db.session.get(model, id)
+        assert db.session.execute(db.select(model.past_shows_count).where(model.id == id)) \
+            .scalar() == entity.show_counts(now)['past_shows_count']
+
+
+def test_export_has_archived_shows(app, db, tmp_path, catalog, archived):
+    from commands import export_command
+    from models import Show, ShowArchive
+    result = app.test_cli_runner().invoke(export_command, [
+        str(tmp_path), '--format', 'jsonl', '--table', 'show'])
+    assert result.exit_code == 0, result.output
+    with gzip.open(os.path.join(tmp_path, 'show.jsonl.gz'), 'rt') as f:
+        rows = [json.loads(line) for line in f]
+    shows = set(db.session.execute(db.select(Show.id)).scalars())
+    archive = set(db.session.execute(
+        db.select(ShowArchive.unnested_statement().subquery().c.id)).scalars())
+    assert len(archive) == archived
+    assert len(rows) == len(shows) + len(archive)
+    assert {row['id'] for row in rows} == shows | archive
+    assert all(row['updated_at'] is None for row in rows if row['id'] in archive)
@@ -0,0 +1,62 @@
+"""The async pages of asgi.py keep the Flask app's per-request behaviour."""
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from cache import LRUBackend
+
+
+@pytest.fixture
+def asgi(app, catalog, monkeypatch):
+    import asgi
+    monkeypatch.setitem(asgi.wsgi_app.config, 'SQLALCHEMY_DATABASE_URI',
+                        app.config['SQLALCHEMY_DATABASE_URI'])
+    monkeypatch.setitem(asgi.app.config, 'SQLALCHEMY_BINDS', {})
+    return asgi
+
+
+def serve(asgi, requests):
+    # requests(client) run with the app serving, its engines in this loop
+    async def main():
+        async with asgi.app.test_app() as test_app:
+            return await requests(test_app.test_client())
+    return asyncio.run(main())
+
+
+def test_profile_page(asgi, catalog):
+    async def requests(client):
+        return await client.get('/venues/{venue_id}'.format(**catalog))
+    response = serve(asgi, requests)
+    assert response.status_code == 200
+    assert response.headers['X-SQL-Statements'] == '5'
+    assert response.headers['X-Request-ID']
+
+
+def test_search_counts_only_a_full_page(asgi, catalog):
+    async def requests(client):
+        return await client.post('/venues/search', form={'search_term': catalog['word'] + 'x'})
+    response = serve(asgi, requests)
+    assert response.status_code == 200
+    assert response.headers['X-SQL-Statements'] == '1'
+
+
+def test_cached_page(asgi, monkeypatch):
+    monkeypatch.setattr(asgi.response_cache, 'backend', LRUBackend())
+
+    async def requests(client):
+        responses = [await client.get('/artists') for _ in range(2)]
+        return [(response.headers['X-SQL-Statements'], await response.get_data())
+                for response in responses]
+    (first_statements, first), (second_statements, second) = serve(asgi, requests)
+    assert first == second
+    assert (first_statements, second_statements) == ('3', '0')
+
+
+def test_statement_timeout(asgi, monkeypatch):
+    monkeypatch.setitem(asgi.app.config, 'DB_STATEMENT_TIMEOUT_MS', 1234)
+
+    async def requests(client):
+        async with asgi.app.test_request_context('/venues'):
+            return (await asgi.execute(text('SHOW statement_timeout')))[0][0]
+    assert serve(asgi, requests) == '1234ms'
@@ -0,0 +1,57 @@
+"""The page cache: tag versions survive eviction, invalidate() misses."""
+import os
+
+import pytest
+from flask import Flask
+
+from cache import FileSystemBackend, LRUBackend, ResponseCache
+
+
+@pytest.fixture(params=['lru', 'filesystem'])
+def cache(request, tmp_path):
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='test', CACHE_BACKEND=request.param,
+                      CACHE_DIR=str(tmp_path), CACHE_MAX_ENTRIES=3)
+    cache = ResponseCache(app)
+    renders = []
+
+    @app.route('/page/<int:n>')
+    @cache.cached('venues')
+    def page(n):
+        renders.append(n)
+        return 'page {}'.format(n)
+
+    cache.client = app.test_client()
+    cache.renders = renders
+    return cache
+
+
+def test_invalidate_misses(cache):
+    for _ in range(2):
+        assert cache.client.get('/page/1').get_data(as_text=True) == 'page 1'
+    assert cache.renders == [1]
+    cache.invalidate('venues')
+    cache.client.get('/page/1')
+    assert cache.renders == [1, 1]
+
+
+def test_versions_are_not_evicted(cache):
+    version = cache._version('venues')
+    # more pages than the cache holds
+    for n in range(10):
+        cache.client.get('/page/{}'.format(n))
+    assert cache.backend.evictions
+    assert cache._version('venues') == version
+
+
+def test_lost_version_is_a_miss(cache):
+    cache.client.get('/page/1')
+    # the version gone, as after a restart with a shared directory wiped
+    if isinstance(cache.backend, LRUBackend):
+        cache.backend._versions.clear()
+    else:
+        assert isinstance(cache.backend, FileSystemBackend)
+        for entry in os.scandir(cache.backend.versions_directory):
+            os.remove(entry.path)
+    cache.client.get('/page/1')
+    assert cache.renders == [1, 1]
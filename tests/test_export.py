@@ -0,0 +1,32 @@
+"""flask export reads in read-only transactions, with or without --snapshot."""
+import re
+
+import pytest
+from sqlalchemy import event
+
+
+@pytest.mark.parametrize('snapshot', ['--snapshot', '--no-snapshot'])
+def test_export_is_read_only(app, db, tmp_path, catalog, snapshot):
+    from commands import export_command, EXPORT_TABLES
+    # per table read: whether its transaction was read only, and its start
+    reads = {}
+
+    def check(connection, cursor, statement, parameters, context, executemany):
+        table = re.search(r'\bFROM "?(\w+)', statement)
+        if table and table.group(1) in EXPORT_TABLES:
+            with cursor.connection.cursor() as probe:
+                probe.execute("SELECT current_setting('transaction_read_only'), now()")
+                reads.setdefault(table.group(1), set()).add(probe.fetchone())
+
+    event.listen(db.engine, 'before_cursor_execute', check)
+    try:
+        result = app.test_cli_runner().invoke(
+            export_command, [str(tmp_path), '--format', 'csv', snapshot])
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', check)
+    assert result.exit_code == 0, result.output
+    assert set(reads) == set(EXPORT_TABLES)
+    assert all(read_only == 'on' for table in reads.values() for read_only, _ in table)
+    # one transaction for all the tables with --snapshot, one each without
+    starts = {start for table in reads.values() for _, start in table}
+    assert len(starts) == (1 if snapshot == '--snapshot' else len(EXPORT_TABLES))
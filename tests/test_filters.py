@@ -0,0 +1,23 @@
+"""The `datetime` template filter renders what the one it replaced did."""
+from datetime import datetime
+
+import pytest
+
+from datetime_filter_bench import format_datetime_before
+from filters import format_datetime
+
+VALUES = [datetime(2026, 1, 2, 20, 0), datetime(2026, 11, 30, 9, 5),
+          '2026-05-17T21:30:00.000Z', '2026-05-17 21:30:00']
+
+# the templates' formats, babel's other named ones and a pattern of its own
+FORMATS = ['full', 'medium', 'short', 'long', "yyyy-MM-dd 'at' HH:mm"]
+
+
+@pytest.mark.parametrize('format', FORMATS)
+@pytest.mark.parametrize('value', VALUES)
+def test_same_as_before(value, format):
+    assert format_datetime(value, format) == format_datetime_before(value, format)
+
+
+def test_default_format():
+    assert format_datetime(VALUES[0]) == format_datetime_before(VALUES[0])
@@ -0,0 +1,25 @@
+"""benchmarks/plan_check.py as a test: no read route scans a large table."""
+from datetime import datetime
+
+import pytest
+
+# plan_check.py's defaults: the planner only prefers the indexes once the
+# tables are about this large
+VENUES, ARTISTS, SHOWS = 100000, 100000, 1000000
+
+
+@pytest.fixture(scope='module')
+def plans(app):
+    import plan_check
+    from models import db
+    with app.app_context():
+        plan_check.seed(VENUES, ARTISTS, SHOWS)
+        yield plan_check.check_plans(datetime.now())
+        db.session.rollback()
+        db.session.remove()
+
+
+def test_no_route_scans_a_large_table(plans):
+    failures = ['{}: {}\n{}'.format(route, '; '.join(problems), text)
+                for route, problems, node_type, text in plans if problems]
+    assert not failures, '\n\n'.join(failures)
@@ -0,0 +1,89 @@
+"""Statements per request of the list, detail and search routes.
+
+Each route is pinned to the statements it runs, so a change that adds a
+query, or loads shows one per row (N+1), fails here first.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from sqlstats import assert_queries
+
+# (method, path, form, statements): path is formatted with the catalog ids
+ROUTES = [
+    ('GET', '/venues', None, 3),
+    ('GET', '/venues?summary=1', None, 1),
+    ('GET', '/venues?state=NY&genre=Jazz', None, 3),
+    ('GET', '/artists', None, 3),
+    ('GET', '/artists?genre=Jazz', None, 3),
+    ('GET', '/shows', None, 1),
+    ('GET', '/shows?all=1', None, 1),
+    ('GET', '/venues/{venue_id}', None, 5),
+    ('GET', '/venues/{venue_id}?past_page=2&upcoming_page=2', None, 5),
+    ('GET', '/artists/{artist_id}', None, 5),
+    ('POST', '/venues/search', {'search_term': '{word}'}, 2),
+    ('POST', '/venues/search', {'search_term': '{word}x', 'fuzzy': 'y'}, 2),
+    ('POST', '/artists/search', {'search_term': 'the'}, 2),
+    ('GET', '/api/venues?state=NY', None, 1),
+    ('GET', '/api/artists?genre=Jazz', None, 1),
+    ('GET', '/api/shows?venue_id={venue_id}', None, 1),
+]
+
+
+@pytest.mark.parametrize('method, path, form, statements', ROUTES)
+def test_statements(app, client, db, catalog, method, path, form, statements):
+    path = path.format(**catalog)
+    form = form and {key: value.format(**catalog) for key, value in form.items()}
+    with assert_queries(db.engine, statements=statements, repeats=2):
+        response = client.open(path, method=method, data=form)
+        # the /api routes run their query while the body streams
+        response.get_data()
+    assert response.status_code == 200
+
+
+def test_not_modified_runs_only_the_stamp(client, db, catalog):
+    path = '/venues/{venue_id}'.format(**catalog)
+    etag = client.get(path).headers['ETag']
+    with assert_queries(db.engine, statements=1):
+        response = client.get(path, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+@pytest.fixture
+def replica(app, db, monkeypatch):
+    # the test database standing in for a replica too, on its own engine
+    monkeypatch.setitem(app.config, 'SQLALCHEMY_BINDS', {'replica': app.config['SQLALCHEMY_DATABASE_URI']})
+    engine = db.get_engine(app, bind='replica')
+    yield engine
+    engine.dispose()
+
+
+def test_reads_go_to_the_replica(client, db, catalog, replica):
+    with assert_queries(db.engine, statements=0), assert_queries(replica) as on_replica:
+        assert client.get('/venues/{venue_id}'.format(**catalog)).status_code == 200
+    assert on_replica.count == 5
+
+
+def test_writer_reads_from_the_primary(app, client, db, catalog, replica):
+    form = {'name': 'Replica Test', 'city': 'Austin', 'state': 'TX', 'address': '1 Main St',
+            'phone': '512-555-0100', 'genres': ['Jazz'],
+            'facebook_link': 'https://www.facebook.com/replica'}
+    assert client.post('/venues/create', data=form).status_code == 200
+    # this client's next reads see its write, other clients' use the replica
+    with assert_queries(replica, statements=0):
+        assert client.get('/venues/{venue_id}'.format(**catalog)).status_code == 200
+    with assert_queries(db.engine, statements=0):
+        assert app.test_client().get('/venues/{venue_id}'.format(**catalog)).status_code == 200
+
+
+def test_booker_reads_from_the_primary(app, client, db, catalog, replica):
+    start_time = (datetime.now() + timedelta(days=900)).isoformat()
+    response = client.post('/api/shows', json=[{
+        'venue_id': catalog['venue_id'], 'artist_id': catalog['artist_id'],
+        'start_time': start_time}])
+    assert response.get_json()['results'][0]['status'] == 'created'
+    with assert_queries(replica, statements=0):
+        assert client.get('/shows').status_code == 200
+        assert client.get('/venues/{venue_id}'.format(**catalog)).status_code == 200
+    with assert_queries(db.engine, statements=0):
+        assert app.test_client().get('/venues/{venue_id}'.format(**catalog)).status_code == 200
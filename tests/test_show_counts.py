@@ -0,0 +1,24 @@
+"""The show count hybrids agree in Python and in SQL on the request's now."""
+import pytest
+from flask import g
+
+
+@pytest.mark.parametrize('model_name', ['Venue', 'Artist'])
+def test_show_counts_use_request_now(app, db, catalog, model_name):
+    import models
+    from models import Show
+    model = getattr(models, model_name)
+    id = catalog['venue_id' if model_name == 'Venue' else 'artist_id']
+    # a now on one of its shows, which either clock would move past
+    now = db.session.execute(
+        db.select(Show.start_time).where(model._show_fk() == id)
+          .order_by(Show.start_time).offset(1).limit(1)).scalar()
+    with app.test_request_context():
+        g.now = now
+        entity = db.session.get(model, id)
+        counts = db.session.execute(
+            db.select(model.upcoming_shows_count, model.past_shows_count)
+              .where(model.id == id)).one()
+        assert tuple(counts) == (entity.upcoming_shows_count, entity.past_shows_count)
+        assert counts._asdict() == entity.show_counts(now)
+        assert counts.past_shows_count >= 2
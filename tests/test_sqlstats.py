@@ -0,0 +1,93 @@
+"""Query budgets and N+1 detection of sqlstats, per request and per route."""
+import logging
+
+import pytest
+
+from sqlstats import QueryBudgetExceeded, StatementStats, statement_shape
+
+SHOWS_OF_VENUE = 'SELECT show.id FROM show WHERE show.venue_id = %(venue_id_1)s'
+
+
+def test_shape_ignores_literals_and_parameters():
+    assert statement_shape("SELECT * FROM venue WHERE id = 12 AND name = 'x'") == \
+        statement_shape("SELECT *\n  FROM venue WHERE id = %(id_1)s AND name = 'it''s'")
+    assert statement_shape('SELECT * FROM venue WHERE id IN (1, 2, 3)') == \
+        statement_shape('SELECT * FROM venue WHERE id IN (4, 5)')
+
+
+def test_over_budget_raises_in_strict_mode():
+    stats = StatementStats('venues.show_venue', budget=2, strict=True)
+    stats.record('SELECT 1', 0.001, 1)
+    stats.record('SELECT 2', 0.001, 1)
+    with pytest.raises(QueryBudgetExceeded, match='budget of 2'):
+        stats.record('SELECT 3', 0.001, 1)
+
+
+def test_repeated_shape_raises_in_strict_mode():
+    stats = StatementStats('venues.venues', repeat_threshold=3, strict=True)
+    stats.record(SHOWS_OF_VENUE, 0.001, 1)
+    stats.record(SHOWS_OF_VENUE, 0.001, 1)
+    with pytest.raises(QueryBudgetExceeded, match='same statement 3 times'):
+        stats.record(SHOWS_OF_VENUE, 0.001, 1)
+
+
+def test_only_counted_otherwise():
+    stats = StatementStats('venues.venues', budget=1, repeat_threshold=3)
+    for _ in range(4):
+        stats.record(SHOWS_OF_VENUE, 0.002, 2)
+    assert (stats.count, stats.rows) == (4, 8)
+    assert stats.repeated() == {statement_shape(SHOWS_OF_VENUE): 4}
+
+
+@pytest.fixture
+def n_plus_one_app(app):
+    # an app with a route that loads the shows of each venue one at a time
+    from app import create_app
+    from models import db, Show, Venue
+
+    n_plus_one_app = create_app()
+    n_plus_one_app.config.update(app.config)
+
+    @n_plus_one_app.route('/n-plus-one')
+    def n_plus_one():
+        venues = Venue.query.order_by(Venue.id).limit(6).all()
+        return {venue.id: Show.query.filter_by(venue_id=venue.id).count()
+                for venue in venues}
+
+    return n_plus_one_app
+
+
+@pytest.fixture
+def logged(app, caplog):
+    caplog.set_level(logging.WARNING, logger=app.logger.name)
+    return caplog
+
+
+def test_route_over_budget_raises_in_strict_mode(app, client, catalog, monkeypatch):
+    monkeypatch.setitem(app.config['SQL_QUERY_BUDGETS'], 'venues.show_venue', 2)
+    with pytest.raises(QueryBudgetExceeded, match='venues.show_venue'):
+        client.get('/venues/{venue_id}'.format(**catalog))
+
+
+def test_route_over_budget_logs_otherwise(app, client, catalog, monkeypatch, logged):
+    monkeypatch.setitem(app.config['SQL_QUERY_BUDGETS'], 'venues.show_venue', 2)
+    monkeypatch.setitem(app.config, 'SQL_STRICT', False)
+    response = client.get('/venues/{venue_id}'.format(**catalog))
+    assert response.status_code == 200
+    assert response.headers['X-SQL-Statements'] == '5'
+    assert 'db;dur=' in response.headers['Server-Timing']
+    assert 'venues.show_venue ran 5 statements, its budget is 2' in logged.messages
+
+
+def test_n_plus_one_raises_in_strict_mode(n_plus_one_app, catalog):
+    with pytest.raises(QueryBudgetExceeded, match='same statement 5 times'):
+        n_plus_one_app.test_client().get('/n-plus-one')
+
+
+def test_n_plus_one_logs_otherwise(n_plus_one_app, catalog, logged):
+    n_plus_one_app.config['SQL_STRICT'] = False
+    response = n_plus_one_app.test_client().get('/n-plus-one')
+    assert response.status_code == 200
+    assert response.headers['X-SQL-Statements'] == '7'
+    assert any(message.startswith('n_plus_one ran a statement 6 times (N+1?)')
+               for message in logged.messages)
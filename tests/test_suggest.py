@@ -0,0 +1,108 @@
+"""The in-memory name index behind /api/search/suggest."""
+from array import array
+
+import pytest
+
+from suggest import SuggestIndex
+
+
+def names(index, query, kind=None):
+    return [suggestion['name'] for suggestion in index.suggest(query, kind=kind)]
+
+
+def test_prefix_of_any_word():
+    index = SuggestIndex()
+    index.load([('venue', 1, 'The Blue Note'), ('artist', 1, 'Blue Öyster Cult'),
+                ('venue', 2, 'Café Rouge')])
+    assert names(index, 'blu') == ['Blue Öyster Cult', 'The Blue Note']
+    assert names(index, 'note') == ['The Blue Note']
+    assert names(index, 'blue oy', kind='artist') == ['Blue Öyster Cult']
+    assert names(index, 'cafe') == ['Café Rouge']
+
+
+def test_add_rename_and_remove():
+    index = SuggestIndex()
+    index.load([('venue', 1, 'The Blue Note')])
+    index.add('venue', 2, 'Blue Hall')
+    index.add('venue', 1, 'The Green Note')
+    assert names(index, 'blue') == ['Blue Hall']
+    assert names(index, 'note') == ['The Green Note']
+    index.remove('venue', 2)
+    assert names(index, 'blue') == []
+    assert index.stats()['entries'] == 1
+
+
+def test_writes_leave_what_readers_hold():
+    # a suggest() running during a write keeps scanning the index it took,
+    # and the write copies the overlay, not the base
+    index = SuggestIndex()
+    index.load([('venue', n, 'Venue {}'.format(n)) for n in range(100)])
+    base, overlay = state = index._state
+    index.add('venue', 1000, 'Venue Thousand')
+    index.remove('venue', 5)
+    assert index._state is not state and index._state[0] is base
+    assert len(base[0]) == len(base[1]) == 200 and len(base[2]) == 100
+    assert overlay == ([], array('q'), {})
+    assert 'Venue 5' not in names(index, 'venue 5')
+    assert index.stats()['entries'] == 100
+
+
+def test_overlay_is_merged():
+    index = SuggestIndex(merge_size=3)
+    index.load([('venue', 1, 'The Blue Note'), ('venue', 2, 'Blue Hall')])
+    index.add('venue', 1, 'The Green Note')
+    index.remove('venue', 2)
+    assert len(index._state[1][2]) == 2
+    index.add('artist', 3, 'Blue Notes')
+    base, overlay = index._state
+    assert overlay[2] == {}
+    assert sorted(base[2].values()) == ['Blue Notes', 'The Green Note']
+    assert list(base[0]) == sorted(base[0])
+    assert names(index, 'blue') == ['Blue Notes']
+    assert names(index, 'note') == ['Blue Notes', 'The Green Note']
+
+
+def test_every_word_narrows_the_whole_index():
+    # the words' matches are intersected before the limit, a name found by
+    # all of them is not lost among the many found by one
+    index = SuggestIndex()
+    index.load([('venue', n, 'Blue Room {}'.format(n)) for n in range(1000)]
+               + [('artist', n, 'Note Taker {}'.format(n)) for n in range(1000)]
+               + [('venue', 5000, 'Blue Note')])
+    assert names(index, 'blue note') == ['Blue Note']
+    assert names(index, 'blue n') == ['Blue Note']
+
+
+@pytest.mark.parametrize('walk_limit', [5000, 100])
+def test_best_matches_of_a_common_prefix(walk_limit):
+    # ranked from all the names with the prefix, or taken from the names in
+    # rank order when there are more of them than walk_limit
+    index = SuggestIndex(walk_limit=walk_limit)
+    index.load([('artist', n, 'Band Number {}'.format(n)) for n in range(999, -1, -1)]
+               + [('artist', 5000, 'Ban'), ('artist', 5001, 'The Ban')])
+    index.add('venue', 6000, 'Bandstand')
+    index.add('artist', 0, 'Renamed')
+    assert names(index, 'ban') == ['Ban', 'Bandstand'] + [
+        'Band Number {}'.format(n) for n in range(1, 9)]
+    assert names(index, 'ban', kind='venue') == ['Bandstand']
+    assert names(index, 'the ban') == ['The Ban']
+
+
+def test_writes_during_a_load_are_kept():
+    index = SuggestIndex()
+    index.load([('venue', 1, 'Old Name')])
+
+    def rows():
+        # the database read for the load, with writes landing meanwhile
+        yield 'venue', 1, 'Old Name'
+        yield 'venue', 2, 'Deleted Hall'
+        index.add('venue', 1, 'New Name')
+        index.remove('venue', 2)
+        index.add('artist', 3, 'Late Arrival')
+        yield 'venue', 4, 'Other Hall'
+
+    index.load(rows())
+    assert names(index, 'name') == ['New Name']
+    assert names(index, 'hall') == ['Other Hall']
+    assert names(index, 'late') == ['Late Arrival']
+    assert index._pending is None
@@ -0,0 +1,63 @@
+"""The ETag of the profile pages, and what changes it."""
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def etag(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    return response.headers['ETag']
+
+
+@pytest.fixture
+def venue_path(catalog):
+    return '/venues/{venue_id}'.format(**catalog)
+
+
+def test_not_modified_by_etag_only(client, venue_path):
+    response = client.get(venue_path)
+    assert client.get(venue_path, headers={
+        'If-None-Match': response.headers['ETag']}).status_code == 304
+    # a date can't tell that the next show went past, so it gets the page
+    assert client.get(venue_path, headers={
+        'If-Modified-Since': response.headers['Last-Modified']}).status_code == 200
+
+
+def test_new_show_changes_both_pages(client, catalog, venue_path):
+    artist_path = '/artists/{artist_id}'.format(**catalog)
+    before = etag(client, venue_path), etag(client, artist_path)
+    start_time = (datetime.now() + timedelta(days=800)).isoformat()
+    response = client.post('/api/shows', json=[{
+        'venue_id': catalog['venue_id'], 'artist_id': catalog['artist_id'],
+        'start_time': start_time}])
+    assert response.get_json()['results'][0]['status'] == 'created'
+    assert etag(client, venue_path) != before[0]
+    assert etag(client, artist_path) != before[1]
+
+
+def test_renamed_artist_changes_the_venue_page(client, db, catalog, venue_path):
+    from models import Artist, Show
+    artist = db.session.get(Artist, db.session.execute(
+        db.select(Show.artist_id).where(Show.venue_id == catalog['venue_id']).limit(1)).scalar())
+    before = etag(client, venue_path)
+    artist.name += ' Renamed'
+    db.session.commit()
+    assert etag(client, venue_path) != before
+    # and what it doesn't list does not
+    before = etag(client, venue_path)
+    artist.phone = '512-555-0199'
+    db.session.commit()
+    assert etag(client, venue_path) == before
+
+
+def test_stamp_changes_when_the_next_show_starts(db, catalog):
+    from models import Show, Venue
+    now = datetime.now()
+    next_show = db.session.execute(
+        db.select(db.func.min(Show.start_time))
+          .where(Show.venue_id == catalog['venue_id'], Show.start_time > now)).scalar()
+    assert Venue.version_stamp(catalog['venue_id'], now) != \
+        Venue.version_stamp(catalog['venue_id'], next_show)
+    assert Venue.version_stamp(catalog['venue_id'], now) == \
+        Venue.version_stamp(catalog['venue_id'], next_show - timedelta(seconds=1))
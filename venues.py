@@ -0,0 +1,197 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+from flask import (Blueprint, current_app, render_template, request, flash,
+                   redirect, url_for, abort, make_response)
+from models import db, Venue, GenreCount
+from suggest import suggest_index
+from cache import response_cache
+from views import (request_now, not_modified, cache_validators, stream_rows,
+                   browse_filters, show_pages, filter_place, VENUE_FIELDS)
+
+#the forms (WTForms) are imported by the views that use them, so they are
+#not loaded until a form is shown or submitted
+blueprint = Blueprint('venues', __name__)
+
+#----------------------------------------------------------------------------#
+# Controllers.
+#----------------------------------------------------------------------------#
+
+@blueprint.route('/venues')
+@response_cache.cached('venues', 'shows')
+def venues():
+
+    #?summary=1 lists each city with its counts instead of every venue
+    if request.args.get('summary'):
+        areas = Venue.area_summaries(request_now())
+        return render_template('pages/venues.html', areas=areas, summary=True)
+
+    #venues come back grouped by city/state, optionally for a single area
+    #and/or genre, with the genre and state counts to narrow them further
+    filters = browse_filters('city')
+    areas = Venue.directory(**filters)
+    facets = GenreCount.facets('venue', genre=filters['genre'], state=filters['state'])
+
+    return render_template('pages/venues.html', areas=areas,
+                           facets=facets, filters=filters)
+
+@blueprint.route('/venues/search', methods=['POST'])
+def search_venues():
+
+    #Get the search term that the user inputs
+    search_term = request.form.get('search_term', '')
+    fuzzy = bool(request.form.get('fuzzy'))
+
+    #ranked top matches and an estimate of how many there are in total
+    responses = Venue.search(search_term, fuzzy=fuzzy,
+                             limit=current_app.config['SEARCH_RESULTS_LIMIT'])
+
+    return render_template('pages/search_venues.html',
+        results=responses, search_term=search_term, fuzzy=fuzzy)
+
+@blueprint.route('/venues/<int:venue_id>')
+def show_venue(venue_id):
+
+    #one indexed query decides whether the client's copy is still current
+    now = request_now()
+    stamp = Venue.version_stamp(venue_id, now)
+    if stamp is None:
+        abort(404)
+    response = not_modified(stamp)
+    if response is not None:
+        return response
+
+    #query the venue with the right id
+    venue = Venue.query.options(*Venue.loader('detail')) \
+        .filter(Venue.id == venue_id).first()
+    #with proper query, serialize the data
+    datas={
+    'id': venue.id,
+    'name': venue.name,
+    'city': venue.city,
+    'state': venue.state,
+    'address': venue.address,
+    'phone': venue.phone,
+    'image_link': venue.image_link,
+    'facebook_link': venue.facebook_link,
+    'website': venue.website,
+    'seeking_talent': venue.seeking_talent,
+    'seeking_description': venue.seeking_description,
+    'genres': venue.genres
+    }
+
+    #counts come from one aggregate, the lists are a page each
+    pages = show_pages()
+    per_page = current_app.config['PROFILE_SHOWS_PER_PAGE']
+    datas.update(venue.show_counts(now))
+    datas['upcoming_shows'] = venue.shows_page(
+        now, upcoming=True, page=pages['upcoming_page'], per_page=per_page)
+    datas['past_shows'] = venue.shows_page(
+        now, upcoming=False, page=pages['past_page'], per_page=per_page)
+
+    return cache_validators(make_response(render_template(
+        'pages/show_venue.html', venue=datas, per_page=per_page, **pages)), stamp)
+
+@blueprint.route('/api/venues')
+def api_venues():
+    query = db.session.query(*[getattr(Venue, field) for field in VENUE_FIELDS])
+    return stream_rows(filter_place(query, Venue).order_by(Venue.id))
+
+#  Create Venue
+#  ----------------------------------------------------------------
+
+@blueprint.route('/venues/create', methods=['GET'])
+def create_venue_form():
+    from forms import VenueForm
+    form = VenueForm()
+    return render_template('forms/new_venue.html', form=form)
+
+@blueprint.route('/venues/create', methods=['POST'])
+def create_venue_submission():
+    from forms import VenueForm
+
+    form = VenueForm(request.form)
+    new_venue = Venue(
+        name=form.name.data,
+        phone=form.phone.data,
+        state=form.state.data,
+        address=form.address.data,
+        image_link=form.image_link.data,
+        facebook_link=form.facebook_link.data,
+        city=form.city.data,
+        website=form.website_link.data,
+        genres=form.genres.data,
+        seeking_talent=form.seeking_talent.data,
+        seeking_description=form.seeking_description.data)
+    try:
+        db.session.add(new_venue)
+        db.session.commit()
+        suggest_index.add('venue', new_venue.id, new_venue.name)
+        response_cache.invalidate('venues')
+        flash('Venue ' + request.form['name'] + ' was successfully listed!')
+    except:
+        db.session.rollback()
+        flash('Venue ' + request.form['name'] + " couldn't successfully listed!")
+        current_app.logger.exception('Venue %s could not be listed', request.form.get('name'))
+    finally:
+        db.session.close()
+
+    return render_template('pages/home.html')
+
+@blueprint.route('/venues/<venue_id>/delete', methods=['GET'])
+def delete_venue(venue_id):
+    try:
+        venue = Venue.query.options(*Venue.loader('delete')) \
+            .filter(Venue.id == venue_id).first()
+        db.session.delete(venue)
+        db.session.commit()
+        suggest_index.remove('venue', venue.id)
+        response_cache.invalidate('venues', 'shows')
+        flash('Venue ' + venue.name + ' was successfully deleted!')
+    except:
+        db.session.rollback()
+        current_app.logger.exception('Venue %s could not be deleted', venue_id)
+    finally:
+        db.session.close()
+
+    return redirect(url_for('main.index'))
+
+#  Update
+#  ----------------------------------------------------------------
+
+@blueprint.route('/venues/<int:venue_id>/edit', methods=['GET'])
+def edit_venue(venue_id):
+    from forms import VenueForm
+    form = VenueForm()
+    venue = Venue.query.options(*Venue.loader('detail')) \
+        .filter(Venue.id == venue_id).first()
+
+    # TODO: populate form with values from venue with ID <venue_id>
+    return render_template('forms/edit_venue.html', form=form, venue=venue)
+
+@blueprint.route('/venues/<int:venue_id>/edit', methods=['POST'])
+def edit_venue_submission(venue_id):
+    from forms import VenueForm
+    # TODO: take values from the form submitted, and update existing
+    # venue record with ID <venue_id> using the new attributes
+    form = VenueForm(request.form)
+    update_venue = Venue.query.options(*Venue.loader('detail')) \
+        .filter(Venue.id == venue_id).first()
+    update_venue.name=form.name.data
+    update_venue.phone=form.phone.data
+    update_venue.state=form.state.data
+    update_venue.address=form.address.data
+    update_venue.image_link=form.image_link.data
+    update_venue.facebook_link=form.facebook_link.data
+    update_venue.city=form.city.data
+    update_venue.website=form.website_link.data
+    update_venue.genres=form.genres.data
+    update_venue.seeking_talent=form.seeking_talent.data
+    update_venue.seeking_description=form.seeking_description.data
+    db.session.commit()
+    suggest_index.add('venue', venue_id, form.name.data)
+    response_cache.invalidate('venues')
+    db.session.close()
+
+
+    return redirect(url_for('venues.show_venue', venue_id=venue_id))
@@ -0,0 +1,219 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+import os
+import json
+import threading
+from datetime import datetime
+from flask import (Blueprint, current_app, render_template, request, jsonify,
+                   session, Response, abort, stream_with_context)
+from werkzeug.http import is_resource_modified
+from models import db, Venue, Artist, request_now
+from suggest import suggest_index
+from cache import response_cache
+from metrics import metrics
+from profiler import request_profiler
+
+#the pages that belong to no venue, artist or show: home, search
+#suggestions, stats and the error pages
+blueprint = Blueprint('main', __name__)
+
+#----------------------------------------------------------------------------#
+# Helpers.
+#----------------------------------------------------------------------------#
+
+def not_modified(stamp):
+    # a 304 for a client that already holds this version of the page, before
+    # anything else is loaded or rendered. only by its ETag: If-Modified-Since
+    # alone can't tell that a show has gone from upcoming to past
+    etag, _ = stamp
+    if '_flashes' in session or is_resource_modified(request.environ, etag=etag):
+        return None
+    return cache_validators(Response(status=304), stamp)
+
+def cache_validators(response, stamp):
+    etag, last_modified = stamp
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    #clients and the CDN may keep the page but must revalidate it
+    response.cache_control.no_cache = True
+    return response
+
+def stream_rows(query):
+    # rows straight from a server-side cursor to the client, one JSON
+    # document per line, or as one JSON array with ?format=json
+    as_array = request.args.get('format') == 'json'
+
+    def generate():
+        separator = ''
+        if as_array:
+            yield '['
+        for row in query.yield_per(1000):
+            yield separator + json.dumps(dict(row._mapping), default=json_default)
+            separator = ',' if as_array else ''
+            if not as_array:
+                yield '\n'
+        if as_array:
+            yield ']'
+
+    mimetype = 'application/json' if as_array else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+def browse_filters(*extra):
+    # ?genre= and ?state= for the venue and artist listings, plus extra keys
+    return {key: request.args.get(key) or None
+            for key in ('genre', 'state') + extra}
+
+def show_pages():
+    # page numbers for the upcoming/past show lists on a profile page
+    return {key: max(request.args.get(key, 1, type=int), 1)
+            for key in ('upcoming_page', 'past_page')}
+
+def parse_date(value):
+    # for request.args.get(type=...): a ValueError falls back to the default
+    return datetime.fromisoformat(value)
+
+def parse_cursor(value):
+    # keyset cursors look like <start_time isoformat>_<show id>
+    start_time, show_id = value.rsplit('_', 1)
+    return datetime.fromisoformat(start_time), int(show_id)
+
+def format_cursor(cursor):
+    return '{}_{}'.format(cursor[0].isoformat(), cursor[1])
+
+#the fields of the venue/artist dicts built by show_venue()/show_artist()
+VENUE_FIELDS = ('id', 'name', 'city', 'state', 'address', 'phone',
+                'image_link', 'facebook_link', 'website', 'seeking_talent',
+                'seeking_description', 'genres')
+ARTIST_FIELDS = ('id', 'name', 'city', 'state', 'phone', 'website',
+                 'facebook_link', 'seeking_venue', 'seeking_description',
+                 'image_link', 'genres')
+
+def filter_place(query, model):
+    #?city=, ?state= and ?genre= narrow venue and artist listings
+    if request.args.get('city'):
+        query = query.filter(model.city == request.args['city'])
+    if request.args.get('state'):
+        query = query.filter(model.state == request.args['state'])
+    if request.args.get('genre'):
+        query = query.filter(model.genres.contains([request.args['genre']]))
+    return query
+
+#----------------------------------------------------------------------------#
+# Autocomplete.
+#----------------------------------------------------------------------------#
+
+#reading every name takes seconds on a large catalog, so each worker builds
+#its index in the background from its first request on, rather than making
+#that request wait. a suggestion asked for before it is done waits for it
+_suggest_loading = threading.Lock()
+
+@blueprint.before_app_first_request
+def start_suggest_index():
+    threading.Thread(target=load_suggest_index, args=(current_app._get_current_object(),),
+                     name='suggest-index', daemon=True).start()
+
+def load_suggest_index(app):
+    # names only, streamed, so building the index stays cheap
+    def rows():
+        for model, kind in ((Venue, 'venue'), (Artist, 'artist')):
+            for id, name in db.session.query(model.id, model.name).yield_per(5000):
+                yield kind, id, name
+    with _suggest_loading:
+        if suggest_index.ready:
+            return
+        with app.app_context():
+            suggest_index.load(rows())
+            db.session.remove()
+
+#----------------------------------------------------------------------------#
+# Controllers.
+#----------------------------------------------------------------------------#
+
+@blueprint.route('/')
+def index():
+  return render_template('pages/home.html')
+
+
+#  Search suggestions
+#  ----------------------------------------------------------------
+
+@blueprint.route('/api/search/suggest')
+def search_suggest():
+    #served from the in-memory index, never from the database
+    if not suggest_index.ready:
+        load_suggest_index(current_app._get_current_object())
+    kind = request.args.get('kind')
+    suggestions = suggest_index.suggest(request.args.get('q', ''), kind=kind,
+                                        limit=current_app.config['SUGGEST_LIMIT'])
+    for suggestion in suggestions:
+        suggestion['url'] = '/{}s/{}'.format(suggestion['kind'], suggestion['id'])
+    return jsonify(suggestions)
+
+@blueprint.route('/api/search/suggest/stats')
+def search_suggest_stats():
+    return jsonify(suggest_index.stats())
+
+@blueprint.route('/api/cache/stats')
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+@blueprint.route('/metrics')
+def prometheus_metrics():
+    #every worker's numbers, in the Prometheus text format
+    if not metrics.enabled:
+        abort(404)
+    return Response(metrics.render(),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@blueprint.route('/api/profile')
+def profile_dump():
+    #this worker's profiles, for holders of a profile token: collapsed
+    #stacks, or ?format=pstats; ?endpoint= for one endpoint, ?reset=1 to
+    #start over
+    if not request_profiler.enabled or not request_profiler.authorized():
+        abort(404)
+    endpoint = request.args.get('endpoint')
+    if request.args.get('format') == 'pstats':
+        data = request_profiler.pstats_file(endpoint)
+        if data is None:
+            abort(404)
+        response = Response(data, mimetype='application/octet-stream')
+        response.headers['Content-Disposition'] = 'attachment; filename={}-{}.pstats'.format(
+            endpoint or 'all', os.getpid())
+    else:
+        response = Response(request_profiler.collapsed(endpoint), mimetype='text/plain')
+    response.headers['X-Profile-Pid'] = str(os.getpid())
+    if request.args.get('reset'):
+        request_profiler.reset()
+    return response
+
+@blueprint.route('/api/db/pool')
+def db_pool_stats():
+    #this worker's pool, to size workers against the database's connections
+    config = current_app.config
+    pool = db.engine.pool
+    stats = {'pid': os.getpid(), 'pool': type(pool).__name__,
+             'pgbouncer': config['DB_PGBOUNCER']}
+    if hasattr(pool, 'checkedout'):
+        capacity = pool.size() + config['DB_MAX_OVERFLOW']
+        stats.update({
+            'size': pool.size(), 'max_overflow': config['DB_MAX_OVERFLOW'],
+            'checked_out': pool.checkedout(), 'checked_in': pool.checkedin(),
+            'overflow': pool.overflow(),
+            'utilization': pool.checkedout() / capacity if capacity else None,
+        })
+    return jsonify(stats)
+
+@blueprint.app_errorhandler(404)
+def not_found_error(error):
+    return render_template('errors/404.html'), 404
+
+@blueprint.app_errorhandler(500)
+def server_error(error):
+    return render_template('errors/500.html'), 500
@@ -0,0 +1,10 @@
+#----------------------------------------------------------------------------#
+# The app for WSGI servers and the flask command:
+#
+#     gunicorn --preload --workers 4 wsgi:app
+#
+# --preload creates it once in the master, before the workers fork.
+#----------------------------------------------------------------------------#
+from app import create_app
+
+app = create_app()